@@ -0,0 +1,1089 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks del Sistema Inmunológico Artificial
+
+Mide el costo real de las operaciones de detección para respaldar con datos
+las decisiones de configuración del sistema (tipo de índice, tamaño de banco).
+suite_benchmarks() mide el sistema completo (entrenamiento y detección) y
+guarda los resultados en JSON con la información del entorno, para comparar
+corridas con comparar_resultados().
+
+Uso:
+    python benchmark_sistema_inmune.py
+
+Autor: Leonardo Mosquera
+"""
+
+import time
+import numpy as np
+import pandas as pd
+
+from busqueda_detectores import IndiceDetectores, IndiceLSH, calcular_distancias_minimas
+
+
+def _medir(funcion, repeticiones=3):
+    """Devuelve el mejor tiempo (segundos) de varias ejecuciones de funcion()."""
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+
+def benchmark_indice_detectores(tamanos_banco=(40, 500, 2000, 10000, 50000, 100000),
+                                num_consultas=2000, dimensiones=4, semilla=42):
+    """
+    Compara el recorrido exhaustivo contra KD-tree y Ball-tree por tamaño de banco.
+
+    Los detectores y las consultas se generan en el espacio normalizado, tal
+    como quedan las células de memoria tras entrenar_fase_self_nonself().
+
+    Args:
+        tamanos_banco (tuple): Números de detectores a evaluar
+        num_consultas (int): Lecturas consultadas por medición
+        dimensiones (int): Variables por lectura
+        semilla (int): Semilla aleatoria
+
+    Returns:
+        pd.DataFrame: Tiempos de construcción y consulta por tipo de índice
+    """
+    rng = np.random.default_rng(semilla)
+    consultas = rng.normal(size=(num_consultas, dimensiones))
+    filas = []
+
+    print("🌲 BENCHMARK: ÍNDICE ESPACIAL DE DETECTORES")
+    print("=" * 60)
+
+    for tamano in tamanos_banco:
+        celulas = rng.normal(size=(tamano, dimensiones))
+        referencia = None
+
+        for tipo in ('fuerza_bruta', 'kdtree', 'balltree'):
+            t_construccion = _medir(lambda: IndiceDetectores(celulas, tipo=tipo), repeticiones=1)
+            indice = IndiceDetectores(celulas, tipo=tipo)
+            t_consulta = _medir(lambda: indice.consultar(consultas))
+
+            distancias, _ = indice.consultar(consultas)
+            if referencia is None:
+                referencia = distancias
+            exacto = np.allclose(distancias, referencia)
+
+            filas.append({
+                'detectores': tamano,
+                'indice': tipo,
+                'construccion_ms': t_construccion * 1e3,
+                'consulta_us_por_lectura': t_consulta / num_consultas * 1e6,
+                'exacto': exacto
+            })
+
+    df = pd.DataFrame(filas)
+    base = df[df['indice'] == 'fuerza_bruta'].set_index('detectores')['consulta_us_por_lectura']
+    df['aceleracion'] = df['detectores'].map(base) / df['consulta_us_por_lectura']
+
+    print(df.to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+    return df
+
+
+def benchmark_busqueda_aproximada(tamano_banco=1_000_000, valores_num_tablas=(1, 2, 4, 8, 16),
+                                  num_consultas=2000, fraccion_anomalas=0.02,
+                                  dimensiones=4, semilla=42):
+    """
+    Mide recall y velocidad del índice LSH contra el recorrido exacto.
+
+    Las consultas imitan el tráfico real: la mayoría cae cerca de la región
+    "self" cubierta por el banco y una fracción pequeña son anomalías lejanas.
+
+    Args:
+        tamano_banco (int): Número de detectores
+        valores_num_tablas (tuple): Valores de la perilla recall/velocidad
+        num_consultas (int): Lecturas consultadas
+        fraccion_anomalas (float): Fracción de lecturas anómalas
+        dimensiones (int): Variables por lectura
+        semilla (int): Semilla aleatoria
+
+    Returns:
+        pd.DataFrame: Recall, fracción verificada y tiempos por configuración
+    """
+    rng = np.random.default_rng(semilla)
+    celulas = rng.normal(size=(tamano_banco, dimensiones))
+    num_anomalas = int(num_consultas * fraccion_anomalas)
+    consultas = np.vstack([
+        rng.normal(size=(num_consultas - num_anomalas, dimensiones)),
+        rng.normal(loc=4.0, size=(num_anomalas, dimensiones))
+    ])
+
+    print(f"\n🔎 BENCHMARK: BÚSQUEDA APROXIMADA (LSH) CON {tamano_banco:,} DETECTORES")
+    print("=" * 60)
+
+    inicio = time.perf_counter()
+    exactas, _ = calcular_distancias_minimas(consultas, celulas)
+    t_exacto = (time.perf_counter() - inicio) / num_consultas
+    filas = [{'modo': 'exacto', 'num_tablas': 0, 'recall_aproximado': 1.0, 'recall_final': 1.0,
+              'fraccion_verificada': 0.0, 'candidatos_por_lectura': float(tamano_banco),
+              'construccion_s': 0.0, 'consulta_us_por_lectura': t_exacto * 1e6}]
+
+    for num_tablas in valores_num_tablas:
+        inicio = time.perf_counter()
+        indice = IndiceLSH(celulas, num_tablas=num_tablas, ancho_cubeta=0.25)
+        t_construccion = time.perf_counter() - inicio
+        t_consulta = _medir(lambda: indice.consultar(consultas), repeticiones=1)
+        recall = indice.medir_recall(consultas, distancias_exactas=exactas)
+        filas.append({'modo': 'lsh', 'num_tablas': num_tablas, **recall,
+                      'construccion_s': t_construccion,
+                      'consulta_us_por_lectura': t_consulta / num_consultas * 1e6})
+
+    df = pd.DataFrame(filas)
+    df['aceleracion'] = t_exacto * 1e6 / df['consulta_us_por_lectura']
+    print(df.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    return df
+
+
+def benchmark_multiproceso(valores_num_procesos=None, tamano_banco=2000, num_lecturas=400000,
+                           num_sensores=1000, dimensiones=4, semilla=42):
+    """
+    Mide la escalabilidad de DetectorMultiproceso según el número de procesos.
+
+    Args:
+        valores_num_procesos (tuple, optional): Procesos a evaluar; por defecto
+            potencias de dos hasta el número de núcleos
+        tamano_banco (int): Número de detectores del banco compartido
+        num_lecturas (int): Lecturas por medición
+        num_sensores (int): Sensores distintos entre los que se fragmenta
+        dimensiones (int): Variables por lectura
+        semilla (int): Semilla aleatoria
+
+    Returns:
+        pd.DataFrame: Lecturas por segundo y eficiencia de escalado
+    """
+    import os
+    import contextlib
+    import io
+    from sklearn.preprocessing import StandardScaler
+    from deteccion_multiproceso import DetectorMultiproceso
+    from sistema_bioinspirado_cultivos import SistemaInmunologicoArtificial
+
+    nucleos = os.cpu_count() or 1
+    if valores_num_procesos is None:
+        valores_num_procesos = [2 ** i for i in range(nucleos.bit_length()) if 2 ** i <= nucleos]
+
+    rng = np.random.default_rng(semilla)
+    with contextlib.redirect_stdout(io.StringIO()):
+        sistema = SistemaInmunologicoArtificial(num_celulas_memoria=tamano_banco)
+    sistema.scaler = StandardScaler().fit(rng.normal(size=(1000, dimensiones)))
+    sistema.actualizar_celulas_memoria(rng.normal(size=(tamano_banco, dimensiones)))
+    lecturas = rng.normal(size=(num_lecturas, dimensiones))
+    sensores = rng.integers(0, num_sensores, size=num_lecturas)
+
+    print(f"\n🧵 BENCHMARK: DETECCIÓN MULTIPROCESO ({nucleos} núcleos disponibles)")
+    print("=" * 60)
+
+    filas = []
+    for num_procesos in valores_num_procesos:
+        with DetectorMultiproceso(sistema, num_procesos=num_procesos) as detector:
+            detector.detectar_lote(sensores[:1000], lecturas[:1000])  # Arranque de trabajadores
+            duracion = _medir(lambda: detector.detectar_lote(sensores, lecturas), repeticiones=1)
+        filas.append({'procesos': num_procesos, 'lecturas_por_segundo': num_lecturas / duracion})
+
+    df = pd.DataFrame(filas)
+    base = df['lecturas_por_segundo'].iloc[0] / df['procesos'].iloc[0]
+    df['eficiencia'] = df['lecturas_por_segundo'] / (df['procesos'] * base)
+    print(df.to_string(index=False, float_format=lambda v: f"{v:,.2f}"))
+    return df
+
+
+def prueba_memoria_multiproceso(num_rondas=40, tamano_lote=20000, fraccion_anomalas=0.05,
+                                capacidad_historial=5000, tamano_banco=200, dimensiones=4, semilla=42):
+    """
+    Verifica que la memoria de DetectorMultiproceso no crezca con los lotes.
+
+    Detecta num_rondas lotes sin pedir nunca el reporte y mide con
+    tracemalloc la memoria del proceso principal (donde esperan las anomalías
+    de los fragmentos y vive el historial del sistema) después de cada lote.
+
+    Args:
+        num_rondas (int): Lotes detectados
+        tamano_lote (int): Lecturas por lote
+        fraccion_anomalas (float): Fracción de lecturas anómalas
+        capacidad_historial (int): Capacidad del historial del sistema
+        tamano_banco (int): Número de detectores
+        dimensiones (int): Variables por lectura
+        semilla (int): Semilla aleatoria
+
+    Returns:
+        pd.DataFrame: Memoria y anomalías pendientes después de cada lote
+    """
+    import contextlib
+    import io
+    import tracemalloc
+    from sklearn.preprocessing import StandardScaler
+    from deteccion_multiproceso import DetectorMultiproceso
+    from sistema_bioinspirado_cultivos import SistemaInmunologicoArtificial
+
+    rng = np.random.default_rng(semilla)
+    with contextlib.redirect_stdout(io.StringIO()):
+        sistema = SistemaInmunologicoArtificial(num_celulas_memoria=tamano_banco,
+                                                capacidad_historial=capacidad_historial)
+    sistema.scaler = StandardScaler().fit(rng.normal(size=(1000, dimensiones)))
+    sistema.actualizar_celulas_memoria(rng.normal(size=(tamano_banco, dimensiones)))
+    sensores = rng.integers(0, 1000, size=tamano_lote)
+
+    print(f"\n🧠 PRUEBA: MEMORIA DE LA DETECCIÓN MULTIPROCESO EN EJECUCIÓN LARGA")
+    print("=" * 60)
+
+    filas = []
+    tracemalloc.start()
+    with DetectorMultiproceso(sistema, num_procesos=1, num_fragmentos=4) as detector:
+        for ronda in range(num_rondas):
+            lecturas = rng.normal(scale=0.5, size=(tamano_lote, dimensiones))
+            lecturas[rng.random(tamano_lote) < fraccion_anomalas] += 4.0
+            detector.detectar_lote(sensores, lecturas)
+            del lecturas
+            filas.append({'ronda': ronda, 'memoria_mb': tracemalloc.get_traced_memory()[0] / 2**20,
+                          'pendientes': sum(map(len, detector.historial_fragmentos)),
+                          'historial': len(sistema.historial_anomalias)})
+    tracemalloc.stop()
+
+    df = pd.DataFrame(filas)
+    mitad = num_rondas // 2
+    primera, segunda = df['memoria_mb'].iloc[:mitad].max(), df['memoria_mb'].iloc[mitad:].max()
+    print(df.iloc[::max(1, num_rondas // 8)].to_string(index=False, float_format=lambda v: f"{v:,.2f}"))
+    print(f"   • Memoria máxima: {primera:.2f} MB (primera mitad), {segunda:.2f} MB (segunda mitad)")
+    assert segunda <= 1.1 * primera, "La memoria de la detección multiproceso crece con los lotes"
+    assert df['pendientes'].max() <= detector.max_pendientes + tamano_lote
+    return df
+
+
+def prueba_estres_concurrente(valores_num_hilos=(1, 2, 4, 8), lotes_por_hilo=40, tamano_lote=4096,
+                              tamano_banco=2000, fraccion_anomalas=0.05, aceleracion_minima=0.5,
+                              dimensiones=4, semilla=42):
+    """
+    Prueba de estrés de DetectorConcurrente con muchos hilos lectores.
+
+    Verifica que no se pierdan actualizaciones: cada anomalía devuelta a un
+    lector debe quedar registrada en el historial exactamente una vez, y el
+    umbral final debe coincidir con el de un sistema de referencia que, sin
+    hilos, recalcula las distancias de esas anomalías y adapta su umbral en
+    el orden en que el escritor las registró. También verifica que las
+    instantáneas no compartan estado mutable con el sistema vivo: los
+    lectores no deben registrar latencias en su instrumentación.
+
+    La aceleración por número de hilos se informa, pero solo se exige que no
+    caiga bajo aceleracion_minima: la prueba detecta un colapso por
+    contención, no demuestra que el rendimiento escale, lo que depende de
+    los núcleos disponibles y de cuánto tiempo pasa NumPy sin el GIL.
+
+    Args:
+        valores_num_hilos (tuple): Hilos lectores a evaluar
+        lotes_por_hilo (int): Lotes detectados por cada hilo
+        tamano_lote (int): Lecturas por lote
+        tamano_banco (int): Número de detectores
+        fraccion_anomalas (float): Fracción de lecturas anómalas
+        aceleracion_minima (float): Rendimiento mínimo, relativo al primer
+            número de hilos, exigido a los demás
+        dimensiones (int): Variables por lectura
+        semilla (int): Semilla aleatoria
+
+    Returns:
+        pd.DataFrame: Lecturas por segundo (total y por hilo) y verificación
+        de consistencia por número de hilos
+    """
+    import contextlib
+    import io
+    import os
+    import threading
+    from sklearn.preprocessing import StandardScaler
+    from deteccion_concurrente import DetectorConcurrente
+    from sistema_bioinspirado_cultivos import SistemaInmunologicoArtificial
+
+    rng = np.random.default_rng(semilla)
+    celulas = rng.normal(size=(tamano_banco, dimensiones))
+    escalador = StandardScaler().fit(rng.normal(size=(1000, dimensiones)))
+    lotes = rng.normal(scale=0.5, size=(max(valores_num_hilos), lotes_por_hilo, tamano_lote, dimensiones))
+    anomalas = rng.random(lotes.shape[:3]) < fraccion_anomalas
+    lotes[anomalas] += 4.0
+
+    def _nuevo_sistema(capacidad):
+        with contextlib.redirect_stdout(io.StringIO()):
+            sistema = SistemaInmunologicoArtificial(num_celulas_memoria=tamano_banco, capacidad_historial=capacidad,
+                                                    instrumentacion=True)
+        sistema.scaler = escalador
+        sistema.actualizar_celulas_memoria(celulas)
+        return sistema
+
+    print(f"\n🔒 PRUEBA DE ESTRÉS: DETECCIÓN CONCURRENTE CON INSTANTÁNEAS")
+    print("=" * 60)
+
+    filas = []
+    for num_hilos in valores_num_hilos:
+        sistema = _nuevo_sistema(num_hilos * lotes_por_hilo * tamano_lote)
+        detectadas = [[] for _ in range(num_hilos)]
+
+        with DetectorConcurrente(sistema) as detector:
+            def _lector(h):
+                for lote in lotes[h]:
+                    es_anomalia = detector.detectar_lote(lote)[0]
+                    detectadas[h].append(lote[es_anomalia])
+
+            hilos = [threading.Thread(target=_lector, args=(h,)) for h in range(num_hilos)]
+            inicio = time.perf_counter()
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+            detector.sincronizar()
+            duracion = time.perf_counter() - inicio
+            version = detector.instantanea.version
+            congelado = detector.instantanea.sistema
+
+        # Los lectores no escriben en el sistema vivo ni comparten su estado mutable
+        aislada = ('busqueda' not in sistema.instrumentacion.etapas
+                   and congelado.historial_anomalias is None
+                   and congelado.indice_detectores is not sistema.indice_detectores
+                   and congelado.scaler is not sistema.scaler)
+
+        # Cada anomalía devuelta a un lector aparece una sola vez en el historial
+        registradas = sistema.historial_anomalias.columnas()['dato']
+        devueltas = np.concatenate([parte for lista in detectadas for parte in lista])
+        mismas_anomalias = (len(devueltas) == len(registradas)
+                            and np.array_equal(np.unique(devueltas, axis=0), np.unique(registradas, axis=0)))
+
+        # Referencia secuencial: mismas anomalías, en el orden del escritor
+        referencia = _nuevo_sistema(1)
+        distancias, _ = referencia._puntuar_lote(registradas, ["general"] * len(registradas))
+        for distancia in distancias:
+            referencia._adaptacion_inmunologica(None, distancia)
+
+        mismas_distancias = np.array_equal(distancias, sistema.historial_anomalias.columnas()['distancia'])
+
+        filas.append({
+            'hilos': num_hilos,
+            'lecturas_por_segundo': num_hilos * lotes_por_hilo * tamano_lote / duracion,
+            'anomalias_detectadas': len(devueltas),
+            'anomalias_registradas': len(registradas),
+            'instantaneas_publicadas': version,
+            'umbral_final': sistema.umbral_activacion,
+            'umbral_referencia': referencia.umbral_activacion,
+            'sin_perdidas': (mismas_anomalias and mismas_distancias
+                             and sistema.umbral_activacion == referencia.umbral_activacion),
+            'instantanea_aislada': aislada
+        })
+
+    df = pd.DataFrame(filas)
+    df['lecturas_por_segundo_por_hilo'] = df['lecturas_por_segundo'] / df['hilos']
+    df['aceleracion'] = df['lecturas_por_segundo'] / df['lecturas_por_segundo'].iloc[0]
+    print(df.to_string(index=False, float_format=lambda v: f"{v:,.4f}"))
+    print(f"   • Núcleos disponibles: {os.cpu_count()}; la aceleración solo se exige ≥ {aceleracion_minima}x "
+          f"(detecta colapso por contención, no mide escalamiento)")
+    assert df['sin_perdidas'].all(), "Se perdieron o duplicaron actualizaciones del escritor"
+    assert df['instantanea_aislada'].all(), "Las instantáneas comparten estado mutable con el sistema vivo"
+    assert (df['aceleracion'] >= aceleracion_minima).all(), "El rendimiento colapsa al agregar hilos lectores"
+    return df
+
+
+def prueba_servicio_mensajes_invalidos(num_lecturas=2000, tamano_lote=16, capacidad_cola=32,
+                                      dimensiones=4, semilla=42):
+    """
+    Verifica que el servicio de ingesta siga procesando tras mensajes inválidos.
+
+    Envía, intercaladas con lecturas válidas, una lectura JSON de 3 valores,
+    una con NaN, una trama binaria con infinito y una lectura válida que hace
+    fallar a la detección de su lote. Con una cola de entrada pequeña, un
+    trabajador caído dejaría a la conexión bloqueada: la prueba falla si el
+    envío no termina dentro del plazo.
+
+    Args:
+        num_lecturas (int): Lecturas válidas enviadas
+        tamano_lote (int): Máximo de lecturas por micro-lote
+        capacidad_cola (int): Capacidad de la cola de entrada del servicio
+        dimensiones (int): Variables por lectura (el protocolo usa 4)
+        semilla (int): Semilla aleatoria
+
+    Returns:
+        dict: Contadores del servicio al terminar
+    """
+    import asyncio
+    import contextlib
+    import io
+    import json
+    from sklearn.preprocessing import StandardScaler
+    from servicio_deteccion import ServicioDeteccion, codificar_json, codificar_trama
+    from sistema_bioinspirado_cultivos import SistemaInmunologicoArtificial
+
+    rng = np.random.default_rng(semilla)
+    with contextlib.redirect_stdout(io.StringIO()):
+        sistema = SistemaInmunologicoArtificial(num_celulas_memoria=50)
+    sistema.scaler = StandardScaler().fit(_generar_lecturas(rng, 1000, dimensiones))
+    sistema.actualizar_celulas_memoria(rng.normal(size=(50, dimensiones)))
+    lecturas = _generar_lecturas(rng, num_lecturas, dimensiones, fraccion_anomalas=0.02)
+
+    # La lectura "veneno" es válida para el protocolo pero su lote falla al detectarse
+    veneno = -999.0
+    detectar_lote = sistema.detectar_anomalias_lote
+
+    def _detectar_con_fallo(X, tipos_cultivo=None):
+        if np.any(np.asarray(X)[:, 0] == veneno):
+            raise RuntimeError("lote con lectura veneno")
+        return detectar_lote(X, tipos_cultivo)
+
+    sistema.detectar_anomalias_lote = _detectar_con_fallo
+
+    invalidos = [
+        (json.dumps({'sensor_id': 1, 'lectura': [55.0, 24.0, 6.0]}) + '\n').encode(),
+        (json.dumps({'sensor_id': 2, 'lectura': [55.0, float('nan'), 6.0, 80.0]}) + '\n').encode(),
+        codificar_trama(3, 'general', [55.0, float('inf'), 6.0, 80.0]),
+    ]
+
+    async def _ejecutar():
+        servicio = ServicioDeteccion(sistema, capacidad_cola=capacidad_cola, tamano_lote=tamano_lote,
+                                     espera_maxima=0.005)
+        await servicio.iniciar()
+        _, escritor = await asyncio.open_connection(*servicio.direccion)
+        # Un cliente conectado que nunca envía ni cierra no debe colgar detener()
+        _, ocioso = await asyncio.open_connection(*servicio.direccion)
+        mensajes = list(invalidos) + [codificar_json(0, 'general', [veneno, 24.0, 6.0, 80.0])]
+        mensajes += [codificar_trama(int(i), 'general', lectura) for i, lectura in enumerate(lecturas)]
+
+        async def _enviar():
+            for inicio in range(0, len(mensajes), 64):
+                escritor.write(b''.join(mensajes[inicio:inicio + 64]))
+                await escritor.drain()
+            escritor.close()
+            await escritor.wait_closed()
+
+        completo = True
+        try:
+            await asyncio.wait_for(_enviar(), timeout=30)
+            await asyncio.wait_for(servicio.detener(), timeout=30)
+        except asyncio.TimeoutError:
+            completo = False
+        ocioso.close()
+        return servicio, completo
+
+    print(f"\n🛡️ PRUEBA: SERVICIO DE INGESTA CON MENSAJES INVÁLIDOS")
+    print("=" * 60)
+    with contextlib.redirect_stdout(io.StringIO()):
+        servicio, completo = asyncio.run(_ejecutar())
+
+    resultado = {
+        'envio_completo': completo,
+        'mensajes_invalidos': servicio.mensajes_invalidos,
+        'lecturas_recibidas': servicio.lecturas_recibidas,
+        'lecturas_procesadas': servicio.flujo.lecturas_procesadas,
+        'lotes_fallidos': servicio.lotes_fallidos,
+        'lecturas_descartadas': servicio.lecturas_descartadas
+    }
+    for clave, valor in resultado.items():
+        print(f"   • {clave}: {valor}")
+    assert completo, "El servicio dejó de procesar y la conexión quedó bloqueada"
+    assert resultado['mensajes_invalidos'] == len(invalidos)
+    assert resultado['lotes_fallidos'] == 1
+    assert resultado['lecturas_recibidas'] == num_lecturas + 1
+    assert resultado['lecturas_procesadas'] + resultado['lecturas_descartadas'] == num_lecturas + 1
+    return resultado
+
+
+def benchmark_precision_float32(tamanos_banco=(2000, 20000), num_lecturas=100000, fraccion_anomalas=0.02,
+                                dimensiones=4, semilla=42):
+    """
+    Compara la detección por lotes en float64 contra el modo dtype=np.float32.
+
+    El sistema float64 usa el mismo banco redondeado a float32, de modo que
+    las decisiones y niveles deben coincidir exactamente.
+
+    Args:
+        tamanos_banco (tuple): Números de detectores a evaluar
+        num_lecturas (int): Lecturas por medición
+        fraccion_anomalas (float): Fracción de lecturas anómalas
+        dimensiones (int): Variables por lectura
+        semilla (int): Semilla aleatoria
+
+    Returns:
+        pd.DataFrame: Lecturas por segundo por precisión y coincidencia de decisiones
+    """
+    import contextlib
+    import io
+    from sklearn.preprocessing import StandardScaler
+    from sistema_bioinspirado_cultivos import SistemaInmunologicoArtificial
+
+    rng = np.random.default_rng(semilla)
+    lecturas = rng.normal(scale=0.5, size=(num_lecturas, dimensiones))
+    lecturas[rng.random(num_lecturas) < fraccion_anomalas] += 4.0
+    escalador = StandardScaler().fit(rng.normal(size=(1000, dimensiones)))
+
+    print(f"\n🎯 BENCHMARK: DETECCIÓN EN FLOAT32 (GEMM) FRENTE A FLOAT64")
+    print("=" * 60)
+
+    filas = []
+    for tamano in tamanos_banco:
+        celulas = rng.normal(size=(tamano, dimensiones)).astype(np.float32)
+        resultados = {}
+        for dtype in (np.float64, np.float32):
+            with contextlib.redirect_stdout(io.StringIO()):
+                sistema = SistemaInmunologicoArtificial(num_celulas_memoria=tamano, dtype=dtype,
+                                                        capacidad_historial=num_lecturas)
+            sistema.scaler = escalador
+            sistema.actualizar_celulas_memoria(celulas)
+            umbral = sistema.umbral_activacion
+
+            def _detectar():
+                sistema.umbral_activacion = umbral
+                resultados[dtype] = sistema.detectar_anomalias_lote(lecturas)
+
+            duracion = _medir(_detectar, repeticiones=2)
+            filas.append({'detectores': tamano, 'dtype': np.dtype(dtype).name,
+                          'lecturas_por_segundo': num_lecturas / duracion})
+
+        (es64, _, niv64, _), (es32, _, niv32, _) = resultados[np.float64], resultados[np.float32]
+        filas[-2]['decisiones_identicas'] = filas[-1]['decisiones_identicas'] = bool(np.array_equal(es64, es32) and np.array_equal(niv64, niv32))
+
+    df = pd.DataFrame(filas)
+    print(df.to_string(index=False, float_format=lambda v: f"{v:,.2f}"))
+    return df
+
+
+def prueba_paridad_float32(tipos_indice=('fuerza_bruta', 'kdtree', 'balltree'), tamano_banco=200,
+                           num_lecturas=20000, tamano_lote=1000, dimensiones=4, semilla=42):
+    """
+    Verifica que el modo dtype=np.float32 decida igual que float64 cerca de los límites.
+
+    Las lecturas se colocan a distancias de un detector a 1e-6 o menos de
+    umbral_activacion, de los límites de nivel y de los cortes de
+    ajustar_umbral(), donde el error de normalizar en float32 cambia la
+    decisión si no se verifica en float64. El sistema float64 usa el mismo
+    banco redondeado a float32.
+
+    Args:
+        tipos_indice (tuple): Índices de detectores a verificar
+        tamano_banco (int): Número de detectores
+        num_lecturas (int): Lecturas por índice
+        tamano_lote (int): Lecturas por llamada a detectar_anomalias_lote()
+        dimensiones (int): Variables por lectura
+        semilla (int): Semilla aleatoria
+
+    Returns:
+        pd.DataFrame: Discrepancias de decisión, nivel y umbral final por índice
+    """
+    import contextlib
+    import io
+    from sklearn.preprocessing import StandardScaler
+    from sistema_bioinspirado_cultivos import (SistemaInmunologicoArtificial, LIMITES_NIVEL_ALERTA,
+                                               calcular_niveles_alerta)
+
+    rng = np.random.default_rng(semilla)
+    escalador = StandardScaler().fit(_generar_lecturas(rng, 1000, dimensiones))
+    celulas = rng.normal(size=(tamano_banco, dimensiones)).astype(np.float32)
+
+    criticas = np.concatenate([LIMITES_NIVEL_ALERTA, [0.7, 0.8, 1.5]])
+    direcciones = rng.normal(size=(num_lecturas, dimensiones))
+    direcciones /= np.linalg.norm(direcciones, axis=1, keepdims=True)
+    radios = rng.choice(criticas, size=num_lecturas) + rng.uniform(-1e-6, 1e-6, size=num_lecturas)
+    puntos = celulas[rng.integers(0, tamano_banco, size=num_lecturas)] + radios[:, np.newaxis] * direcciones
+    lecturas = puntos * escalador.scale_ + escalador.mean_
+
+    print(f"\n⚖️ PRUEBA: PARIDAD FLOAT32 / FLOAT64 CERCA DE UMBRAL Y LÍMITES DE NIVEL")
+    print("=" * 60)
+
+    filas = []
+    for tipo in tipos_indice:
+        sistemas = []
+        for dtype in (np.float64, np.float32):
+            with contextlib.redirect_stdout(io.StringIO()):
+                sistema = SistemaInmunologicoArtificial(num_celulas_memoria=tamano_banco, tipo_indice=tipo,
+                                                        dtype=dtype, capacidad_historial=num_lecturas)
+            sistema.scaler = escalador
+            sistema.actualizar_celulas_memoria(celulas)
+            sistemas.append(sistema)
+
+        decisiones = niveles = umbrales = 0
+        for inicio in range(0, num_lecturas, tamano_lote):
+            lote = lecturas[inicio:inicio + tamano_lote]
+            (es64, _, niv64, _), (es32, _, niv32, _) = (sistema.detectar_anomalias_lote(lote) for sistema in sistemas)
+            decisiones += int((es64 != es32).sum())
+            niveles += int((niv64 != niv32).sum())
+            umbrales += int(sistemas[0].umbral_activacion != sistemas[1].umbral_activacion)
+
+        # Lecturas sueltas con el umbral fijo vigente
+        for dato in lecturas[:500]:
+            (a64, d64, n64), (a32, d32, n32) = (sistema.detectar_anomalia(dato) for sistema in sistemas)
+            decisiones += int(a64 != a32)
+            niveles += int(n64 != n32 or calcular_niveles_alerta(d32) != n32)
+
+        filas.append({'indice': tipo, 'discrepancias_decision': decisiones, 'discrepancias_nivel': niveles,
+                      'discrepancias_umbral': umbrales})
+
+    df = pd.DataFrame(filas)
+    print(df.to_string(index=False))
+    assert not df[['discrepancias_decision', 'discrepancias_nivel', 'discrepancias_umbral']].any().any(), \
+        "El modo float32 decidió distinto que float64"
+    return df
+
+
+def prueba_reloj_hora_local(zonas=('America/Bogota', 'UTC', 'Asia/Tokyo')):
+    """
+    Verifica que los instantes del reloj de eventos estén en hora local.
+
+    Para cada zona horaria (fijada con TZ en un proceso nuevo, porque el
+    desfase se toma al importar el módulo) registra una anomalía y compara
+    su instante y su fecha en conteos_por_dia() con pd.Timestamp.now() y la
+    fecha local del proceso.
+
+    Args:
+        zonas (tuple): Valores de TZ a verificar
+
+    Returns:
+        pd.DataFrame: Diferencia con la hora local y coincidencia de la fecha por zona
+    """
+    import json
+    import os
+    import subprocess
+    import sys
+
+    codigo = (
+        "import datetime, json, numpy as np, pandas as pd\n"
+        "from historial_anomalias import HistorialAnomalias\n"
+        "from sistema_bioinspirado_cultivos import reloj_ns\n"
+        "historial = HistorialAnomalias(10)\n"
+        "instante, local = reloj_ns(), pd.Timestamp.now()\n"
+        "historial.agregar_lote(instante, np.zeros((1, 4)), [1.0], [3], [0], ['general'])\n"
+        "fecha = historial.agregados.conteos_por_dia().index[0]\n"
+        "print(json.dumps({'diferencia_s': abs(pd.Timestamp(instante) - local).total_seconds(),\n"
+        "                  'fecha_registrada': str(fecha), 'fecha_local': str(datetime.date.today())}))\n"
+    )
+    directorio = os.path.dirname(os.path.abspath(__file__))
+
+    print(f"\n🕰️ PRUEBA: RELOJ DE EVENTOS EN HORA LOCAL")
+    print("=" * 60)
+
+    filas = []
+    for zona in zonas:
+        entorno = {**os.environ, 'TZ': zona, 'PYTHONPATH': directorio}
+        salida = subprocess.run([sys.executable, '-c', codigo], capture_output=True, text=True,
+                                env=entorno, cwd=directorio, check=True).stdout
+        filas.append({'zona': zona, **json.loads(salida.strip().splitlines()[-1])})
+
+    df = pd.DataFrame(filas)
+    df['fecha_correcta'] = df['fecha_registrada'] == df['fecha_local']
+    print(df.to_string(index=False))
+    assert df['fecha_correcta'].all() and (df['diferencia_s'] < 1.0).all(), \
+        "El reloj de eventos no coincide con la hora local"
+    return df
+
+
+def prueba_derrame_segmentos(num_anomalias=20000, capacidad=500, dimensiones=4, semilla=42):
+    """
+    Verifica el derrame a segmentos del historial registro a registro.
+
+    Registra anomalías una por una (el camino de detectar_anomalia()) en un
+    historial pequeño con derrame y comprueba que los segmentos más los
+    registros vigentes reproduzcan todo lo registrado. También verifica que
+    derramar tras cerrar() y los fallos de escritura lancen un error, que
+    una consulta sin registros conserve la forma (0, D) de 'dato' y que los
+    bloques pendientes se escriban al salir del intérprete sin cerrar().
+
+    Args:
+        num_anomalias (int): Anomalías registradas
+        capacidad (int): Capacidad del historial en memoria
+        dimensiones (int): Variables por lectura
+        semilla (int): Semilla aleatoria
+
+    Returns:
+        dict: Microsegundos por registro y resultado de cada verificación
+    """
+    import os
+    import subprocess
+    import sys
+    import tempfile
+    from historial_anomalias import HistorialAnomalias
+    from segmentos_anomalias import EscritorSegmentos, LectorSegmentos
+
+    rng = np.random.default_rng(semilla)
+    datos = rng.normal(size=(num_anomalias, dimensiones))
+    cultivos = rng.choice(['maiz', 'soya', 'trigo'], num_anomalias)
+
+    print(f"\n💾 PRUEBA: DERRAME DEL HISTORIAL A SEGMENTOS")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as directorio:
+        historial = HistorialAnomalias(capacidad, derrame=EscritorSegmentos(directorio, registros_por_segmento=4096))
+        inicio = time.perf_counter()
+        for i in range(num_anomalias):
+            historial.append({'timestamp': 10**18 + i * 10**6, 'dato': datos[i], 'distancia': float(i),
+                              'nivel_alerta': i % 5, 'celula_activada': i, 'tipo_cultivo': cultivos[i]})
+        us_por_registro = (time.perf_counter() - inicio) / num_anomalias * 1e6
+        historial.cerrar()
+
+        lector = LectorSegmentos(directorio)
+        columnas = lector.consultar()
+        completo = (np.array_equal(columnas['dato'], datos)
+                    and np.array_equal(columnas['distancia'], np.arange(num_anomalias, dtype=float))
+                    and np.array_equal(columnas['tipo_cultivo'], cultivos))
+        vacia = lector.consultar(desde=0, hasta=1)['dato'].shape == (0, dimensiones)
+        try:
+            historial.derrame.derramar_registro(0, datos[0], 0.0, 0, 0, 0, ['maiz'])
+            falla_cerrado = False
+        except RuntimeError:
+            falla_cerrado = True
+
+    # Un directorio reemplazado por un archivo hace fallar la escritura
+    with tempfile.TemporaryDirectory() as raiz:
+        destino = os.path.join(raiz, 'segmentos')
+        escritor = EscritorSegmentos(destino, registros_por_segmento=1)
+        os.rmdir(destino)
+        open(destino, 'w').close()
+        bloque = {nombre: valor[:10] for nombre, valor in columnas.items() if nombre != 'tipo_cultivo'}
+        escritor.derramar(bloque, ['maiz', 'soya', 'trigo'])
+        try:
+            escritor.cerrar()
+            falla_escritura = False
+        except RuntimeError:
+            falla_escritura = escritor.registros_perdidos == 10
+
+    # Proceso que termina sin cerrar(): los bloques pendientes se escriben al salir
+    with tempfile.TemporaryDirectory() as directorio:
+        codigo = (
+            "import numpy as np\n"
+            "from segmentos_anomalias import EscritorSegmentos\n"
+            f"escritor = EscritorSegmentos({directorio!r}, intervalo_vaciado=60)\n"
+            "for i in range(300):\n"
+            "    escritor.derramar_registro(10**18 + i, np.ones(4), 1.0, 1, 1, 0, ['maiz'])\n"
+        )
+        raiz = os.path.dirname(os.path.abspath(__file__))
+        subprocess.run([sys.executable, '-c', codigo], env={**os.environ, 'PYTHONPATH': raiz}, cwd=raiz, check=True)
+        escritos_al_salir = len(LectorSegmentos(directorio).consultar()['timestamp'])
+
+    resultado = {
+        'us_por_registro': us_por_registro,
+        'historial_completo': completo,
+        'consulta_vacia_2d': vacia,
+        'falla_tras_cerrar': falla_cerrado,
+        'falla_escritura': falla_escritura,
+        'escritos_al_salir': escritos_al_salir == 300
+    }
+    for clave, valor in resultado.items():
+        print(f"   • {clave}: {valor:.2f}" if isinstance(valor, float) else f"   • {clave}: {valor}")
+    assert all(valor for clave, valor in resultado.items() if clave != 'us_por_registro'), \
+        "El derrame a segmentos perdió registros o no informó un error"
+    return resultado
+
+
+def benchmark_reloj_eventos(num_anomalias=20000, dimensiones=4, semilla=42):
+    """
+    Costo por anomalía del instante del evento: pd.Timestamp.now() frente al
+    reloj entero del sistema, solo y al registrar la anomalía en el historial.
+
+    Args:
+        num_anomalias (int): Anomalías registradas por medición
+        dimensiones (int): Variables por lectura
+        semilla (int): Semilla aleatoria
+
+    Returns:
+        pd.DataFrame: Microsegundos por anomalía de cada variante
+    """
+    from historial_anomalias import HistorialAnomalias
+    from sistema_bioinspirado_cultivos import reloj_ns
+
+    rng = np.random.default_rng(semilla)
+    datos = rng.normal(size=(num_anomalias, dimensiones))
+
+    def _registrar(reloj):
+        historial = HistorialAnomalias(num_anomalias)
+        for dato in datos:
+            historial.append({'timestamp': reloj(), 'dato': dato, 'distancia': 1.0,
+                              'nivel_alerta': 3, 'celula_activada': 0, 'tipo_cultivo': 'general'})
+
+    variantes = {
+        'pd.Timestamp.now()': lambda: [pd.Timestamp.now() for _ in range(num_anomalias)],
+        'reloj_ns()': lambda: [reloj_ns() for _ in range(num_anomalias)],
+        'historial + pd.Timestamp.now()': lambda: _registrar(pd.Timestamp.now),
+        'historial + reloj_ns()': lambda: _registrar(reloj_ns),
+    }
+
+    print(f"\n⏱️ MICROBENCHMARK: INSTANTE DE CADA ANOMALÍA")
+    print("=" * 60)
+
+    df = pd.DataFrame([{'variante': nombre, 'us_por_anomalia': _medir(funcion) / num_anomalias * 1e6}
+                       for nombre, funcion in variantes.items()])
+    print(df.to_string(index=False, float_format=lambda v: f"{v:,.3f}"))
+    return df
+
+
+# Configuración central de la suite: cada barrido varía un solo parámetro
+CONFIGURACION_BASE_SUITE = {'tamano_entrenamiento': 10000, 'detectores': 50, 'dimensiones': 4, 'tamano_lote': 1024}
+VERSION_FORMATO_SUITE = 1
+
+
+def _generar_lecturas(rng, num_lecturas, dimensiones, fraccion_anomalas=0.0):
+    """
+    Lecturas sintéticas alrededor de valores de campo típicos.
+
+    Con 4 dimensiones son [humedad, temperatura, nutrientes, crecimiento];
+    con otras, variables normales con media 50 y desviación 10.
+    """
+    if dimensiones == 4:
+        medias, escalas = np.array([65.0, 24.0, 3.0, 55.0]), np.array([8.0, 3.0, 0.6, 10.0])
+    else:
+        medias, escalas = np.full(dimensiones, 50.0), np.full(dimensiones, 10.0)
+    lecturas = medias + rng.normal(size=(num_lecturas, dimensiones)) * escalas
+    anomalas = rng.random(num_lecturas) < fraccion_anomalas
+    lecturas[anomalas] += 4.0 * escalas
+    return lecturas
+
+
+def _percentiles_us(duraciones_ns):
+    """p50/p95/p99 y máximo en microsegundos de una lista de duraciones en ns."""
+    duraciones_us = np.asarray(duraciones_ns, dtype=float) / 1e3
+    p50, p95, p99 = np.percentile(duraciones_us, [50, 95, 99]).tolist()
+    return {'p50_us': p50, 'p95_us': p95, 'p99_us': p99, 'max_us': float(duraciones_us.max())}
+
+
+def informacion_entorno():
+    """
+    Versiones, hardware y commit del código medido, para comparar corridas.
+
+    Returns:
+        dict: Descripción del entorno de ejecución
+    """
+    import os
+    import platform
+    import subprocess
+    import sklearn
+    import scipy
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, timeout=10,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+
+    return {
+        'fecha_utc': pd.Timestamp.now(tz='UTC').isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'implementacion': platform.python_implementation(),
+        'sistema_operativo': platform.platform(),
+        'arquitectura': platform.machine(),
+        'procesador': platform.processor() or None,
+        'nucleos': os.cpu_count(),
+        'versiones': {'numpy': np.__version__, 'pandas': pd.__version__,
+                      'scikit-learn': sklearn.__version__, 'scipy': scipy.__version__}
+    }
+
+
+def _medir_configuracion(tamano_entrenamiento, detectores, dimensiones, tamano_lote, num_lecturas,
+                         num_lecturas_escalares, fraccion_anomalas, semilla):
+    """
+    Entrena un sistema y mide entrenamiento, detección escalar y por lotes en una configuración.
+
+    Las cifras de rendimiento y latencia se toman con la instrumentación
+    desactivada (el modo por defecto del sistema). El desglose por etapa sale
+    de una pasada por lotes adicional con la instrumentación activa.
+    """
+    import contextlib
+    import io
+    from instrumentacion import Instrumentacion, INSTRUMENTACION_INACTIVA
+    from sistema_bioinspirado_cultivos import SistemaInmunologicoArtificial
+
+    rng = np.random.default_rng(semilla)
+    datos_normales = _generar_lecturas(rng, tamano_entrenamiento, dimensiones)
+    lecturas = _generar_lecturas(rng, num_lecturas, dimensiones, fraccion_anomalas)
+
+    # El entrenamiento registra solo tres etapas, así que se instrumenta para
+    # separar ajuste y silhouette; el total se mide aparte con perf_counter
+    sistema = SistemaInmunologicoArtificial(num_celulas_memoria=detectores, capacidad_historial=num_lecturas,
+                                            instrumentacion=True, verbose=False)
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        sistema.entrenar_fase_self_nonself(datos_normales)
+    duracion_entrenamiento = time.perf_counter() - inicio
+    etapas = sistema.instrumentacion.instantanea()
+    sistema.instrumentacion = INSTRUMENTACION_INACTIVA
+
+    fila = {
+        'tamano_entrenamiento': tamano_entrenamiento,
+        'detectores': detectores,
+        'dimensiones': dimensiones,
+        'tamano_lote': tamano_lote,
+        'entrenamiento_s': duracion_entrenamiento,
+        'ajuste_s': etapas['ajuste']['total_s'],
+        'silhouette_s': etapas.get('silhouette', {}).get('total_s', 0.0)
+    }
+    umbral_entrenado = sistema.umbral_activacion
+
+    # Lectura por lectura con detectar_anomalia(), latencia de cada llamada
+    duraciones = []
+    for dato in lecturas[:num_lecturas_escalares]:
+        inicio = time.perf_counter_ns()
+        sistema.detectar_anomalia(dato)
+        duraciones.append(time.perf_counter_ns() - inicio)
+    fila['escalar_lecturas_por_segundo'] = len(duraciones) / (sum(duraciones) / 1e9)
+    fila.update({f'escalar_{clave}': valor for clave, valor in _percentiles_us(duraciones).items()})
+
+    # Por lotes con detectar_anomalias_lote(), latencia de cada lote
+    sistema.umbral_activacion = umbral_entrenado
+    sistema.historial_anomalias.clear()
+    duraciones = []
+    for inicio_lote in range(0, num_lecturas, tamano_lote):
+        lote = lecturas[inicio_lote:inicio_lote + tamano_lote]
+        inicio = time.perf_counter_ns()
+        sistema.detectar_anomalias_lote(lote)
+        duraciones.append(time.perf_counter_ns() - inicio)
+    fila['lote_lecturas_por_segundo'] = num_lecturas / (sum(duraciones) / 1e9)
+    fila.update({f'lote_{clave}': valor for clave, valor in _percentiles_us(duraciones).items()})
+
+    # Desglose por etapa: misma pasada por lotes, ahora instrumentada
+    sistema.umbral_activacion = umbral_entrenado
+    sistema.historial_anomalias.clear()
+    sistema.instrumentacion = Instrumentacion()
+    for inicio_lote in range(0, num_lecturas, tamano_lote):
+        sistema.detectar_anomalias_lote(lecturas[inicio_lote:inicio_lote + tamano_lote])
+    fila['lote_etapas_us_por_lectura'] = {etapa: resumen['total_s'] / num_lecturas * 1e6
+                                          for etapa, resumen in sistema.instrumentacion.instantanea().items()}
+    return fila
+
+
+def suite_benchmarks(ruta_salida='resultados_benchmark.json',
+                     tamanos_entrenamiento=(1000, 10000, 50000), valores_detectores=(10, 50, 200),
+                     valores_dimensiones=(2, 4, 8, 16), tamanos_lote=(1, 64, 1024, 16384),
+                     num_lecturas=20000, num_lecturas_escalares=2000, fraccion_anomalas=0.02, semilla=42):
+    """
+    Suite reproducible del sistema completo: entrenamiento y detección.
+
+    Parte de CONFIGURACION_BASE_SUITE y varía un parámetro por barrido
+    (tamaño de entrenamiento, detectores, dimensiones, tamaño de lote). En
+    cada configuración mide entrenar_fase_self_nonself() (total, ajuste de
+    KMeans y silhouette), el rendimiento y la latencia p50/p95/p99 de
+    detectar_anomalia() lectura por lectura y de detectar_anomalias_lote()
+    sin instrumentación, y el costo por etapa de la detección por lotes en
+    una pasada instrumentada aparte.
+    Los datos son sintéticos con semilla fija, así que dos corridas sobre la
+    misma máquina solo difieren por el código medido (ver comparar_resultados).
+
+    Args:
+        ruta_salida (str, optional): Archivo JSON de resultados; None para no escribirlo
+        tamanos_entrenamiento (tuple): Muestras normales de entrenamiento a evaluar
+        valores_detectores (tuple): Células de memoria a evaluar
+        valores_dimensiones (tuple): Variables por lectura a evaluar
+        tamanos_lote (tuple): Lecturas por llamada a detectar_anomalias_lote()
+        num_lecturas (int): Lecturas detectadas por lotes en cada configuración
+        num_lecturas_escalares (int): Lecturas detectadas una a una
+        fraccion_anomalas (float): Fracción de lecturas anómalas
+        semilla (int): Semilla aleatoria
+
+    Returns:
+        dict: Documento con entorno, parámetros y resultados por barrido
+    """
+    import json
+
+    barridos = {
+        'tamano_entrenamiento': tamanos_entrenamiento,
+        'detectores': valores_detectores,
+        'dimensiones': valores_dimensiones,
+        'tamano_lote': tamanos_lote
+    }
+
+    print(f"\n📏 SUITE DE BENCHMARKS: ENTRENAMIENTO Y DETECCIÓN")
+    print("=" * 60)
+
+    resultados = []
+    for barrido, valores in barridos.items():
+        for valor in valores:
+            configuracion = {**CONFIGURACION_BASE_SUITE, barrido: valor}
+            fila = _medir_configuracion(num_lecturas=num_lecturas, num_lecturas_escalares=num_lecturas_escalares,
+                                        fraccion_anomalas=fraccion_anomalas, semilla=semilla, **configuracion)
+            resultados.append({'barrido': barrido, **fila})
+            print(f"   • {barrido}={valor}: entrenamiento {fila['entrenamiento_s']:.2f} s, "
+                  f"escalar p50 {fila['escalar_p50_us']:.0f} µs, "
+                  f"lote {fila['lote_lecturas_por_segundo']:,.0f} lecturas/s")
+
+    documento = {
+        'version_formato': VERSION_FORMATO_SUITE,
+        'entorno': informacion_entorno(),
+        'parametros': {
+            'configuracion_base': CONFIGURACION_BASE_SUITE,
+            'barridos': {barrido: list(valores) for barrido, valores in barridos.items()},
+            'num_lecturas': num_lecturas,
+            'num_lecturas_escalares': num_lecturas_escalares,
+            'fraccion_anomalas': fraccion_anomalas,
+            'semilla': semilla
+        },
+        'resultados': resultados
+    }
+
+    if ruta_salida is not None:
+        with open(ruta_salida, 'w', encoding='utf-8') as archivo:
+            json.dump(documento, archivo, indent=2)
+        print(f"💾 Resultados guardados en {ruta_salida}")
+    return documento
+
+
+# Métricas comparadas entre corridas y si un valor mayor es mejor
+METRICAS_COMPARADAS = {
+    'entrenamiento_s': False,
+    'escalar_lecturas_por_segundo': True,
+    'escalar_p50_us': False,
+    'escalar_p95_us': False,
+    'lote_lecturas_por_segundo': True,
+    'lote_p50_us': False
+}
+
+
+def comparar_resultados(anterior, actual, tolerancia=0.10):
+    """
+    Compara dos corridas de suite_benchmarks() configuración por configuración.
+
+    Args:
+        anterior (str | dict): Documento o ruta del JSON de referencia
+        actual (str | dict): Documento o ruta del JSON nuevo
+        tolerancia (float): Empeoramiento relativo a partir del cual una
+            métrica se marca como regresión
+
+    Returns:
+        pd.DataFrame: Valor anterior, actual, cambio relativo y regresión por
+        configuración y métrica
+    """
+    import json
+
+    documentos = []
+    for documento in (anterior, actual):
+        if isinstance(documento, str):
+            with open(documento, encoding='utf-8') as archivo:
+                documento = json.load(archivo)
+        documentos.append(pd.DataFrame(documento['resultados']))
+
+    claves = ['barrido', 'tamano_entrenamiento', 'detectores', 'dimensiones', 'tamano_lote']
+    unidos = documentos[0].merge(documentos[1], on=claves, suffixes=('_anterior', '_actual'))
+
+    filas = []
+    for metrica, mayor_es_mejor in METRICAS_COMPARADAS.items():
+        for _, fila in unidos.iterrows():
+            previo, nuevo = fila[f'{metrica}_anterior'], fila[f'{metrica}_actual']
+            cambio = (nuevo - previo) / previo if previo else 0.0
+            empeoramiento = -cambio if mayor_es_mejor else cambio
+            filas.append({**{clave: fila[clave] for clave in claves}, 'metrica': metrica,
+                          'anterior': previo, 'actual': nuevo, 'cambio': cambio,
+                          'regresion': empeoramiento > tolerancia})
+
+    df = pd.DataFrame(filas)
+    print(f"\n🔍 COMPARACIÓN DE CORRIDAS: {int(df['regresion'].sum())} regresiones "
+          f"(tolerancia {tolerancia:.0%}) en {len(df)} métricas")
+    if df['regresion'].any():
+        print(df[df['regresion']].to_string(index=False, float_format=lambda v: f"{v:,.3f}"))
+    return df
+
+
+if __name__ == "__main__":
+    print(__doc__)
+    benchmark_indice_detectores()
+    benchmark_busqueda_aproximada()
+    benchmark_multiproceso()
+    prueba_memoria_multiproceso()
+    prueba_estres_concurrente()
+    prueba_servicio_mensajes_invalidos()
+    benchmark_precision_float32()
+    prueba_paridad_float32()
+    benchmark_reloj_eventos()
+    prueba_reloj_hora_local()
+    prueba_derrame_segmentos()
+    suite_benchmarks()
@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Búsqueda del Detector más Afín para el Sistema Inmunológico Artificial
+
+Cada lectura se compara contra el banco de células de memoria para encontrar
+el detector más cercano. Con bancos pequeños basta el recorrido exhaustivo
+vectorizado; con bancos de decenas de miles de detectores un índice espacial
+(KD-tree o Ball-tree) reduce el costo de cada consulta a sub-lineal. Para
+bancos de millones de detectores se ofrece una búsqueda aproximada por LSH
+con verificación exacta de las lecturas cercanas al umbral de activación.
+
+Con bancos en float32 el recorrido exhaustivo usa la forma
+||x||² - 2·x·c + ||c||², que convierte la búsqueda en un producto matricial
+(GEMM) y reduce a la mitad el tráfico de memoria. Sus distancias vienen con
+una cota de error para que el sistema verifique en float64 las que queden
+cerca de una decisión.
+
+Referencias:
+- Bentley, J. L. (1975). Multidimensional binary search trees used for
+  associative searching. Communications of the ACM, 18(9), 509-517.
+- Omohundro, S. M. (1989). Five balltree construction algorithms.
+  International Computer Science Institute, Technical Report TR-89-063.
+- Datar, M., Immorlica, N., Indyk, P., & Mirrokni, V. S. (2004).
+  Locality-sensitive hashing scheme based on p-stable distributions.
+  Proceedings of the 20th Symposium on Computational Geometry, 253-262.
+
+Autor: Leonardo Mosquera
+"""
+
+import numpy as np
+from sklearn.neighbors import KDTree, BallTree
+
+TIPOS_INDICE = ('fuerza_bruta', 'kdtree', 'balltree', 'auto', 'lsh')
+
+# Tamaño de banco a partir del cual 'auto' usa KD-tree (ver benchmark_sistema_inmune.py)
+UMBRAL_AUTO_INDICE = 500
+
+# Primo de Mersenne 2^31 - 1: las claves LSH se reducen módulo este valor para
+# que ningún producto intermedio desborde int64
+PRIMO_CLAVES_LSH = 2 ** 31 - 1
+
+
+def calcular_distancias_minimas(datos_scaled, celulas, tamano_bloque=65536):
+    """
+    Calcula la distancia euclidiana al detector más afín para cada lectura.
+
+    Procesa las lecturas por bloques para acotar la matriz intermedia
+    (lecturas x detectores) sin recorrer los detectores en Python.
+
+    Args:
+        datos_scaled (array): Lecturas normalizadas de forma (N, D)
+        celulas (array): Banco de detectores de forma (K, D)
+        tamano_bloque (int): Máximo de elementos de la matriz intermedia por bloque
+
+    Returns:
+        tuple: (distancias_minimas, indices_celula) ambos de longitud N
+    """
+    datos_scaled = np.asarray(datos_scaled, dtype=float)
+    num_lecturas = len(datos_scaled)
+    distancias = np.empty(num_lecturas)
+    indices = np.empty(num_lecturas, dtype=np.intp)
+
+    # Columnas contiguas: la suma por variable evita reducir un eje de tamaño D
+    columnas = np.ascontiguousarray(np.asarray(celulas, dtype=float).T)
+    filas_por_bloque = max(1, tamano_bloque // max(1, columnas.shape[1]))
+    for inicio in range(0, num_lecturas, filas_por_bloque):
+        bloque = datos_scaled[inicio:inicio + filas_por_bloque]
+        cuadrados = np.square(bloque[:, 0, np.newaxis] - columnas[0])
+        for d in range(1, len(columnas)):
+            cuadrados += np.square(bloque[:, d, np.newaxis] - columnas[d])
+        fin = inicio + len(bloque)
+        indices[inicio:fin] = np.argmin(cuadrados, axis=1)
+        distancias[inicio:fin] = np.sqrt(cuadrados[np.arange(len(bloque)), indices[inicio:fin]])
+
+    return distancias, indices
+
+
+def calcular_distancias_minimas_gemm(datos_scaled, celulas, normas_celulas=None, tamano_bloque=262144):
+    """
+    Distancia al detector más afín con la forma ||x||² - 2·x·c + ||c||².
+
+    Trabaja en el tipo de las células (float32 para bancos reducidos). El
+    término ||x||² no cambia el detector elegido, así que solo se suma al
+    mínimo de cada lectura.
+
+    Args:
+        datos_scaled (array): Lecturas normalizadas de forma (N, D)
+        celulas (array): Banco de detectores de forma (K, D)
+        normas_celulas (array, optional): ||c||² de cada detector, precalculadas
+        tamano_bloque (int): Máximo de elementos de la matriz intermedia por bloque
+
+    Returns:
+        tuple: (distancias_minimas, indices_celula) ambos de longitud N
+    """
+    celulas = np.asarray(celulas)
+    datos_scaled = np.asarray(datos_scaled, dtype=celulas.dtype)
+    if normas_celulas is None:
+        normas_celulas = np.einsum('ij,ij->i', celulas, celulas)
+
+    num_lecturas = len(datos_scaled)
+    distancias = np.empty(num_lecturas, dtype=celulas.dtype)
+    indices = np.empty(num_lecturas, dtype=np.intp)
+
+    filas_por_bloque = max(1, tamano_bloque // max(1, len(celulas)))
+    for inicio in range(0, num_lecturas, filas_por_bloque):
+        bloque = datos_scaled[inicio:inicio + filas_por_bloque]
+        cuadrados = bloque @ celulas.T
+        cuadrados *= -2
+        cuadrados += normas_celulas
+        fin = inicio + len(bloque)
+        indices[inicio:fin] = np.argmin(cuadrados, axis=1)
+        minimos = cuadrados[np.arange(len(bloque)), indices[inicio:fin]] + np.einsum('ij,ij->i', bloque, bloque)
+        distancias[inicio:fin] = np.sqrt(np.maximum(minimos, 0))
+
+    return distancias, indices
+
+
+def cota_error_gemm(datos_scaled, distancias, radio_banco, dtype=np.float32):
+    """
+    Cota del error absoluto de calcular_distancias_minimas_gemm() por lectura.
+
+    El error de d² está acotado por (D + 4)·u·(||x|| + max||c||)², con u el
+    épsilon de máquina del tipo; de ahí |d̂ - d| <= min(√cota, cota / d̂).
+
+    Args:
+        datos_scaled (array): Lecturas normalizadas de forma (N, D)
+        distancias (array): Distancias devueltas por la variante GEMM
+        radio_banco (float): Mayor norma de los detectores
+        dtype (dtype): Tipo en que se calcularon las distancias
+
+    Returns:
+        array: Cota de error de cada distancia
+    """
+    datos_scaled = np.asarray(datos_scaled, dtype=float)
+    normas = np.sqrt(np.einsum('ij,ij->i', datos_scaled, datos_scaled))
+    cota = (datos_scaled.shape[1] + 4) * np.finfo(dtype).eps * (normas + radio_banco) ** 2
+    distancias = np.asarray(distancias, dtype=float)
+    with np.errstate(divide='ignore'):
+        return np.minimum(np.sqrt(cota), cota / distancias)
+
+
+class IndiceDetectores:
+    """
+    Índice exacto de vecino más cercano sobre el banco de detectores.
+
+    El árbol se construye una sola vez por banco. Los detectores agregados
+    después se mantienen en un bloque pendiente que se recorre de forma
+    exhaustiva junto al árbol, y el árbol se reconstruye cuando ese bloque
+    supera una fracción del banco.
+    """
+
+    def __init__(self, celulas, tipo='fuerza_bruta', tamano_hoja=40, fraccion_reconstruccion=0.1,
+                 dtype=np.float64):
+        """
+        Construye el índice sobre un banco de detectores.
+
+        Args:
+            celulas (array): Banco de detectores de forma (K, D)
+            tipo (str): 'fuerza_bruta', 'kdtree', 'balltree' o 'auto'
+            tamano_hoja (int): Tamaño de hoja del árbol
+            fraccion_reconstruccion (float): Fracción de detectores pendientes
+                que dispara la reconstrucción del árbol
+            dtype (dtype): Tipo del banco; con float32 el recorrido exhaustivo
+                usa calcular_distancias_minimas_gemm()
+        """
+        if tipo not in TIPOS_INDICE or tipo == 'lsh':
+            raise ValueError(f"Tipo de índice desconocido: {tipo}. Opciones: {TIPOS_INDICE}")
+
+        self.tipo_solicitado = tipo
+        self.tamano_hoja = tamano_hoja
+        self.fraccion_reconstruccion = fraccion_reconstruccion
+        self.dtype = np.dtype(dtype)
+        self.num_reconstrucciones = 0
+        self.reconstruir(celulas)
+
+    def reconstruir(self, celulas):
+        """Reconstruye el índice completo para un banco de detectores nuevo."""
+        self.celulas = celulas
+        self._celulas_indexadas = np.asarray(celulas, dtype=self.dtype)
+        self._num_indexadas = len(self._celulas_indexadas)
+        self._normas = np.einsum('ij,ij->i', self._celulas_indexadas, self._celulas_indexadas)
+        self._radio = float(np.sqrt(self._normas.max())) if self._num_indexadas else 0.0
+
+        tipo = self.tipo_solicitado
+        if tipo == 'auto':
+            tipo = 'kdtree' if self._num_indexadas >= UMBRAL_AUTO_INDICE else 'fuerza_bruta'
+        self.tipo = tipo
+
+        if tipo == 'kdtree':
+            self._arbol = KDTree(self._celulas_indexadas, leaf_size=self.tamano_hoja)
+        elif tipo == 'balltree':
+            self._arbol = BallTree(self._celulas_indexadas, leaf_size=self.tamano_hoja)
+        else:
+            self._arbol = None
+
+        self.num_reconstrucciones += 1
+        return self
+
+    def agregar(self, nuevas_celulas):
+        """
+        Agrega detectores al banco sin reconstruir el árbol de inmediato.
+
+        Args:
+            nuevas_celulas (array): Detectores nuevos de forma (M, D)
+
+        Returns:
+            array: Banco completo actualizado (indexadas + pendientes)
+        """
+        nuevas_celulas = np.atleast_2d(np.asarray(nuevas_celulas, dtype=self.dtype))
+        celulas = np.vstack([self.celulas, nuevas_celulas])
+
+        pendientes = len(celulas) - self._num_indexadas
+        if self._arbol is None or pendientes > self.fraccion_reconstruccion * self._num_indexadas:
+            self.reconstruir(celulas)
+        else:
+            self.celulas = celulas
+
+        return celulas
+
+    def consultar(self, datos_scaled):
+        """
+        Busca el detector más cercano para cada lectura.
+
+        Args:
+            datos_scaled (array): Lecturas normalizadas de forma (N, D)
+
+        Returns:
+            tuple: (distancias_minimas, indices_celula) ambos de longitud N
+        """
+        if self._arbol is None:
+            if self.dtype != np.float64:
+                return calcular_distancias_minimas_gemm(datos_scaled, self._celulas_indexadas, self._normas)
+            return calcular_distancias_minimas(datos_scaled, self._celulas_indexadas)
+
+        distancias, indices = self._arbol.query(datos_scaled, k=1)
+        distancias, indices = distancias[:, 0], indices[:, 0].astype(np.intp)
+
+        # Detectores agregados después de construir el árbol
+        if len(self.celulas) > self._num_indexadas:
+            pendientes = np.asarray(self.celulas[self._num_indexadas:], dtype=float)
+            dist_pend, idx_pend = calcular_distancias_minimas(datos_scaled, pendientes)
+            mejores = dist_pend < distancias
+            distancias[mejores] = dist_pend[mejores]
+            indices[mejores] = idx_pend[mejores] + self._num_indexadas
+
+        return distancias, indices
+
+    def cota_error(self, datos_scaled, distancias):
+        """
+        Cota del error absoluto de las distancias de consultar().
+
+        Los árboles calculan en float64 aun con lecturas float32, así que su
+        búsqueda es exacta; el error de haber normalizado en float32 lo suma
+        quien normalizó.
+
+        Returns:
+            array | None: Cota por lectura, o None si las distancias son exactas
+            para las lecturas dadas
+        """
+        if self.dtype == np.float64 or self._arbol is not None:
+            return None
+        return cota_error_gemm(datos_scaled, distancias, self._radio, self.dtype)
+
+
+class IndiceLSH:
+    """
+    Índice aproximado del detector más cercano basado en LSH p-estable.
+
+    Cada tabla proyecta los detectores sobre direcciones gaussianas aleatorias
+    y los agrupa en cubetas de ancho fijo; una lectura solo se compara contra
+    los detectores que comparten cubeta con ella en alguna tabla. Más tablas
+    aumentan el recall a cambio de más candidatos por consulta.
+
+    Las consultas acumulan contadores en estadisticas; las copias de solo
+    lectura que comparten hilos (DetectorConcurrente) lo ponen en None para
+    que consultar no escriba nada.
+
+    La distancia aproximada nunca es menor que la exacta, así que una lectura
+    con distancia aproximada bajo distancia_verificacion es exacta en su
+    decisión. Las demás se recalculan contra el banco completo, de modo que
+    las decisiones de alerta alrededor del umbral no dependen del azar.
+
+    Para las lecturas que no se verifican, la distancia y la célula devueltas
+    son las del mejor candidato: una cota superior de la distancia exacta
+    (también bajo distancia_verificacion) y no necesariamente la célula más
+    cercana. Esos valores llegan a los niveles de alerta y a las métricas que
+    los usan. Las distancias de las anomalías sí son exactas mientras
+    distancia_verificacion no supere el umbral, como lo configura el sistema.
+    """
+
+    def __init__(self, celulas, num_tablas=8, num_proyecciones=4, ancho_cubeta=0.5,
+                 distancia_verificacion=0.3, semilla=42):
+        """
+        Construye las tablas hash sobre un banco de detectores.
+
+        Args:
+            celulas (array): Banco de detectores de forma (K, D)
+            num_tablas (int): Tablas hash independientes (perilla recall/velocidad)
+            num_proyecciones (int): Proyecciones concatenadas por tabla
+            ancho_cubeta (float): Ancho de cubeta en unidades normalizadas
+            distancia_verificacion (float): Distancia aproximada a partir de la
+                cual la lectura se verifica con búsqueda exacta
+            semilla (int): Semilla de las proyecciones aleatorias
+        """
+        self.tipo = 'lsh'
+        self.num_tablas = num_tablas
+        self.num_proyecciones = num_proyecciones
+        self.ancho_cubeta = ancho_cubeta
+        self.distancia_verificacion = distancia_verificacion
+        self.semilla = semilla
+        self.num_reconstrucciones = 0
+        self.estadisticas = {'consultas': 0, 'verificadas': 0, 'candidatos': 0}
+        self.reconstruir(celulas)
+
+    def reconstruir(self, celulas):
+        """Recalcula las tablas hash para un banco de detectores nuevo."""
+        self.celulas = celulas
+        self._celulas = np.asarray(celulas, dtype=float)
+        dimensiones = self._celulas.shape[1]
+
+        rng = np.random.default_rng(self.semilla)
+        self._proyecciones = rng.normal(size=(self.num_tablas, dimensiones, self.num_proyecciones))
+        self._desplazamientos = rng.uniform(0, self.ancho_cubeta, size=(self.num_tablas, self.num_proyecciones))
+        self._multiplicadores = rng.integers(1, PRIMO_CLAVES_LSH, size=self.num_proyecciones, dtype=np.int64)
+
+        self._claves_ordenadas = []
+        self._orden = []
+        for tabla in range(self.num_tablas):
+            claves = self._claves(self._celulas, tabla)
+            orden = np.argsort(claves, kind='stable')
+            self._claves_ordenadas.append(claves[orden])
+            self._orden.append(orden.astype(np.intp))
+
+        self.num_reconstrucciones += 1
+        return self
+
+    def _claves(self, datos, tabla):
+        """
+        Clave entera de cubeta de cada fila para una tabla.
+
+        Los códigos de cubeta se combinan con un hash polinomial módulo
+        PRIMO_CLAVES_LSH: cada producto es menor que 2^62, así que la clave no
+        depende del desborde de int64. Dos cubetas distintas pueden compartir
+        clave; eso solo agrega candidatos, cuya distancia se calcula igual.
+        """
+        codigos = np.floor(
+            (datos @ self._proyecciones[tabla] + self._desplazamientos[tabla]) / self.ancho_cubeta
+        ).astype(np.int64) % PRIMO_CLAVES_LSH
+        claves = np.zeros(len(codigos), dtype=np.int64)
+        for columna, multiplicador in zip(codigos.T, self._multiplicadores):
+            claves = (claves + columna * multiplicador) % PRIMO_CLAVES_LSH
+        return claves
+
+    def agregar(self, nuevas_celulas):
+        """Agrega detectores al banco recalculando las tablas hash."""
+        nuevas_celulas = np.atleast_2d(np.asarray(nuevas_celulas, dtype=float))
+        celulas = np.vstack([self._celulas, nuevas_celulas])
+        self.reconstruir(celulas)
+        return celulas
+
+    def consultar_aproximado(self, datos_scaled):
+        """
+        Busca el detector más cercano solo entre los candidatos de las tablas.
+
+        Returns:
+            tuple: (distancias, indices) con distancia infinita e índice -1 para
+            las lecturas sin candidatos
+        """
+        datos_scaled = np.asarray(datos_scaled, dtype=float)
+        num_lecturas = len(datos_scaled)
+        mejores_dist = np.full(num_lecturas, np.inf)
+        mejores_idx = np.full(num_lecturas, -1, dtype=np.intp)
+
+        for tabla in range(self.num_tablas):
+            claves = self._claves(datos_scaled, tabla)
+            claves_tabla = self._claves_ordenadas[tabla]
+            inicios = np.searchsorted(claves_tabla, claves, side='left')
+            conteos = np.searchsorted(claves_tabla, claves, side='right') - inicios
+            total = int(conteos.sum())
+            if total == 0:
+                continue
+            if self.estadisticas is not None:
+                self.estadisticas['candidatos'] += total
+
+            # Pares (lectura, detector candidato) sin bucles por lectura
+            lecturas = np.repeat(np.arange(num_lecturas), conteos)
+            desfase = np.arange(total) - np.repeat(np.cumsum(conteos) - conteos, conteos)
+            detectores = self._orden[tabla][np.repeat(inicios, conteos) + desfase]
+
+            diferencias = datos_scaled[lecturas] - self._celulas[detectores]
+            distancias = np.sqrt(np.sum(diferencias ** 2, axis=1))
+
+            # Mínimo por lectura: ordenar por (lectura, distancia) y tomar el primero
+            orden = np.lexsort((distancias, lecturas))
+            primeros = orden[np.r_[True, lecturas[orden][1:] != lecturas[orden][:-1]]]
+            lect, dist = lecturas[primeros], distancias[primeros]
+            mejora = dist < mejores_dist[lect]
+            mejores_dist[lect[mejora]] = dist[mejora]
+            mejores_idx[lect[mejora]] = detectores[primeros][mejora]
+
+        return mejores_dist, mejores_idx
+
+    def consultar(self, datos_scaled):
+        """
+        Busca el detector más cercano con verificación exacta cerca del umbral.
+
+        Args:
+            datos_scaled (array): Lecturas normalizadas de forma (N, D)
+
+        Returns:
+            tuple: (distancias_minimas, indices_celula) ambos de longitud N;
+            exactos salvo en las lecturas con distancia bajo
+            distancia_verificacion, donde son los del mejor candidato
+        """
+        distancias, indices = self.consultar_aproximado(datos_scaled)
+
+        verificar = np.flatnonzero(distancias > self.distancia_verificacion)
+        if len(verificar):
+            dist_exacta, idx_exacto = calcular_distancias_minimas(
+                np.asarray(datos_scaled, dtype=float)[verificar], self._celulas
+            )
+            distancias[verificar] = dist_exacta
+            indices[verificar] = idx_exacto
+
+        if self.estadisticas is not None:
+            self.estadisticas['consultas'] += len(distancias)
+            self.estadisticas['verificadas'] += len(verificar)
+        return distancias, indices
+
+    def cota_error(self, datos_scaled, distancias):
+        """
+        Las distancias de consultar() son exactas o cotas superiores bajo
+        distancia_verificacion, que nunca cambian una decisión de alerta.
+        """
+        return None
+
+    def medir_recall(self, datos_scaled, distancias_exactas=None):
+        """
+        Mide el recall del modo aproximado contra el recorrido exacto.
+
+        Args:
+            datos_scaled (array): Lecturas normalizadas de prueba
+            distancias_exactas (array, optional): Distancias exactas ya calculadas
+                para las mismas lecturas, para no repetir el recorrido completo
+
+        Returns:
+            dict: recall antes de verificar, recall final, fracción verificada
+            y candidatos promedio por lectura
+        """
+        candidatos_previos = self.estadisticas['candidatos']
+        aproximadas, _ = self.consultar_aproximado(datos_scaled)
+        candidatos = self.estadisticas['candidatos'] - candidatos_previos
+        finales, _ = self.consultar(datos_scaled)
+        exactas = distancias_exactas
+        if exactas is None:
+            exactas, _ = calcular_distancias_minimas(datos_scaled, self._celulas)
+
+        return {
+            'recall_aproximado': float(np.mean(np.isclose(aproximadas, exactas))),
+            'recall_final': float(np.mean(np.isclose(finales, exactas))),
+            'fraccion_verificada': float(np.mean(aproximadas > self.distancia_verificacion)),
+            'candidatos_por_lectura': candidatos / max(1, len(exactas))
+        }
+
+
+def crear_indice(celulas, tipo='fuerza_bruta', **opciones):
+    """
+    Crea el índice de detectores adecuado para el tipo solicitado.
+
+    Args:
+        celulas (array): Banco de detectores de forma (K, D)
+        tipo (str): Uno de TIPOS_INDICE
+        **opciones: Parámetros específicos del índice (p. ej. num_tablas para 'lsh')
+
+    Returns:
+        IndiceDetectores | IndiceLSH
+    """
+    if tipo == 'lsh':
+        return IndiceLSH(celulas, **opciones)
+    return IndiceDetectores(celulas, tipo=tipo, **opciones)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Detección Concurrente con Estado Adaptativo en Instantáneas
+
+detectar_anomalia() adapta umbral_activacion y escribe el historial y los
+patógenos conocidos sin sincronización, así que un mismo sistema no puede
+compartirse entre hilos. DetectorConcurrente separa lectores y escritor:
+
+- Los lectores (cualquier número de hilos) puntúan contra una instantánea
+  inmutable con los detectores, el escalador y el umbral vigentes. La
+  instantánea se lee con una sola referencia, sin bloqueos, y puntuar no
+  escribe nada en ella (ver _congelar); por eso los lectores no registran
+  latencias por etapa.
+- Un único hilo escritor recibe los resultados en orden de llegada, adapta
+  el umbral anomalía por anomalía, registra el historial (y opcionalmente
+  clasifica los patógenos) y publica una instantánea nueva.
+
+Cada lote se decide con el umbral de la instantánea que leyó; la adaptación
+de ese lote se refleja en las instantáneas siguientes. Ninguna actualización
+se pierde: el escritor aplica todas en el orden en que fueron encoladas.
+
+Autor: Leonardo Mosquera
+"""
+
+import copy
+import queue
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from instrumentacion import INSTRUMENTACION_INACTIVA
+from sistema_bioinspirado_cultivos import calcular_niveles_alerta
+
+InstantaneaDeteccion = namedtuple('InstantaneaDeteccion', ['version', 'umbral', 'sistema'])
+
+_FIN_ESCRITOR = object()
+
+
+def _congelar(sistema):
+    """
+    Copia de solo lectura del estado de puntuación de un sistema.
+
+    Comparte los arreglos de detectores y las tablas cuantizadas, que se
+    reemplazan, nunca se modifican en su lugar. Todo lo que la lectura podría
+    escribir se deja resuelto o se separa del sistema vivo: el escalador se
+    copia (actualizar_self() lo modifica con partial_fit) con su copia en
+    dtype ya calculada, el índice es propio y sin estadísticas, la tabla
+    queda al día con el banco, y la instrumentación, el historial y los
+    patógenos no se comparten. Así los lectores puntúan sin efectos
+    secundarios sobre la instantánea ni sobre el sistema.
+    """
+    congelado = copy.copy(sistema)
+    congelado.scaler = copy.deepcopy(sistema.scaler)
+    congelado._copia_escalador = None
+    if congelado.dtype != np.float64:
+        congelado._escalador_reducido()
+    congelado.instrumentacion = INSTRUMENTACION_INACTIVA
+    congelado.historial_anomalias = None
+    congelado.patogenos_conocidos = None
+    congelado.metricas_performance = {}
+    
+    indice = sistema.indice_detectores
+    if indice is None or indice.celulas is not sistema.celulas_memoria:
+        congelado.indice_detectores = None
+        congelado.actualizar_celulas_memoria(congelado.celulas_memoria)
+    else:
+        congelado.indice_detectores = copy.copy(indice)
+    if hasattr(congelado.indice_detectores, 'estadisticas'):
+        congelado.indice_detectores.estadisticas = None
+    congelado._tabla_vigente()
+    
+    congelado.bancos_cultivo = {cultivo: _congelar(banco) for cultivo, banco in sistema.bancos_cultivo.items()}
+    return congelado
+
+
+class DetectorConcurrente:
+    """
+    Envoltura de un SistemaInmunologicoArtificial para detección multihilo.
+
+    Mientras esté activa, el sistema solo debe modificarse a través de ella
+    (detección, actualizar_self); el escritor es el único que lo muta.
+    """
+
+    def __init__(self, sistema, capacidad_cola=1024, clasificar_anomalias=False):
+        """
+        Publica la primera instantánea y arranca el hilo escritor.
+
+        Args:
+            sistema (SistemaInmunologicoArtificial): Sistema ya entrenado
+            capacidad_cola (int): Lotes pendientes de aplicar antes de frenar
+                a los lectores
+            clasificar_anomalias (bool): Clasificar cada anomalía en el escritor
+                para llevar patogenos_conocidos
+        """
+        if sistema.celulas_memoria is None:
+            raise ValueError("El sistema no ha sido entrenado. Ejecutar entrenar_fase_self_nonself() primero.")
+
+        self.sistema = sistema
+        self.clasificar_anomalias = clasificar_anomalias
+        self.lotes_aplicados = 0
+        self.anomalias_aplicadas = 0
+        self._cola = queue.Queue(maxsize=capacidad_cola)
+        self._error = None
+        self._instantanea = InstantaneaDeteccion(0, sistema.umbral_activacion, _congelar(sistema))
+
+        self._escritor = threading.Thread(target=self._escribir, name='escritor_adaptacion', daemon=True)
+        self._escritor.start()
+
+    @property
+    def instantanea(self):
+        """Instantánea vigente (versión, umbral y sistema congelado)."""
+        return self._instantanea
+
+    def detectar_lote(self, X, tipos_cultivo=None):
+        """
+        Detecta anomalías en un lote; puede llamarse desde varios hilos a la vez.
+
+        Args:
+            X (array): Lecturas de forma (N, 4)
+            tipos_cultivo (str | list, optional): Tipo de cultivo común o por lectura
+
+        Returns:
+            tuple: (es_anomalia, distancia_minima, nivel_alerta, celula_activada)
+        """
+        if self._error is not None:
+            raise RuntimeError("El escritor de adaptación falló") from self._error
+
+        instantanea = self._instantanea
+        congelado = instantanea.sistema
+        X = np.asarray(X, dtype=float).reshape(-1, congelado.celulas_memoria.shape[1])
+        if tipos_cultivo is None or isinstance(tipos_cultivo, str):
+            tipos_cultivo = [tipos_cultivo or "general"] * len(X)
+        elif len(tipos_cultivo) != len(X):
+            raise ValueError("tipos_cultivo debe tener una entrada por lectura.")
+
+        es_anomalia, distancias, celulas, _ = congelado._decidir_lote(X, tipos_cultivo, instantanea.umbral,
+                                                                      adaptativo=False)
+        niveles = calcular_niveles_alerta(distancias)
+
+        if es_anomalia.any():
+            indices = np.flatnonzero(es_anomalia)
+            self._cola.put(('anomalias', (self.sistema.reloj(), X[indices], distancias[indices],
+                                          niveles[indices], celulas[indices],
+                                          [tipos_cultivo[i] for i in indices])))
+        return es_anomalia, distancias, niveles, celulas
+
+    def detectar_anomalia(self, dato_nuevo, tipo_cultivo="general"):
+        """Versión de una sola lectura de detectar_lote()."""
+        es_anomalia, distancias, niveles, _ = self.detectar_lote(np.asarray(dato_nuevo, dtype=float), tipo_cultivo)
+        return bool(es_anomalia[0]), distancias[0], int(niveles[0])
+
+    def actualizar_self(self, datos_normales_nuevos, tipos_cultivo=None):
+        """Encola una actualización del modelo "self"; se publica al aplicarse."""
+        self._cola.put(('actualizar_self', (np.array(datos_normales_nuevos, dtype=float), tipos_cultivo)))
+
+    def _escribir(self):
+        """Hilo escritor: aplica en orden las adaptaciones y publica instantáneas."""
+        while True:
+            tarea = self._cola.get()
+            try:
+                if tarea is _FIN_ESCRITOR:
+                    return
+                tipo, carga = tarea
+                if tipo == 'anomalias':
+                    self._aplicar_anomalias(*carga)
+                    self._publicar(reconstruir=False)
+                else:
+                    self.sistema.actualizar_self(*carga)
+                    self._publicar(reconstruir=True)
+            except Exception as error:
+                self._error = error
+            finally:
+                self._cola.task_done()
+
+    def _aplicar_anomalias(self, timestamp_ns, datos, distancias, niveles, celulas, tipos_cultivo):
+        for dato, distancia in zip(datos, distancias):
+            self.sistema._adaptacion_inmunologica(dato, distancia)
+        if self.clasificar_anomalias:
+            self.sistema.clasificar_anomalias_lote(datos)
+        self.sistema.historial_anomalias.agregar_lote(timestamp_ns, datos, distancias, niveles,
+                                                      celulas, tipos_cultivo)
+        self.lotes_aplicados += 1
+        self.anomalias_aplicadas += len(distancias)
+
+    def _publicar(self, reconstruir):
+        """Publica una instantánea nueva con una sola asignación de referencia."""
+        anterior = self._instantanea
+        congelado = _congelar(self.sistema) if reconstruir else anterior.sistema
+        self._instantanea = InstantaneaDeteccion(anterior.version + 1, self.sistema.umbral_activacion, congelado)
+
+    def sincronizar(self):
+        """Espera a que el escritor aplique todo lo encolado hasta ahora."""
+        self._cola.join()
+        if self._error is not None:
+            raise RuntimeError("El escritor de adaptación falló") from self._error
+        return self._instantanea
+
+    def cerrar(self):
+        """Aplica lo pendiente y detiene el hilo escritor."""
+        if self._escritor.is_alive():
+            self._cola.put(_FIN_ESCRITOR)
+            self._escritor.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
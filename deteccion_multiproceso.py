@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Detección Fragmentada Multiproceso con Banco de Detectores Compartido
+
+Un solo proceso de Python aprovecha un único núcleo en detectar_anomalia().
+Este módulo reparte las lecturas entre un pool de procesos que leen los
+parámetros del escalador y las células de memoria (del banco global y de
+cada banco por cultivo) desde un bloque de multiprocessing.shared_memory, de
+modo que cada trabajador se adjunta a los bancos sin recibir copias
+serializadas. Las lecturas de cada lote también viajan por memoria
+compartida: cada fragmento recibe solo el rango de filas que le toca.
+
+Las lecturas se fragmentan por sensor (o campo): todas las lecturas de un
+sensor caen siempre en el mismo fragmento, y cada fragmento mantiene su
+propio umbral_activacion adaptado en orden de llegada. Las anomalías de cada
+fragmento esperan en una lista acotada hasta fusionarse, en orden global de
+llegada, en el historial del sistema: al pedir el reporte ejecutivo o cuando
+las pendientes superan max_pendientes. Al fusionarlas, el umbral del sistema
+se adapta con ellas en ese mismo orden.
+
+Autor: Leonardo Mosquera
+"""
+
+import heapq
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from busqueda_detectores import calcular_distancias_minimas
+from sistema_bioinspirado_cultivos import aplicar_umbral_secuencial, ajustar_umbral, calcular_niveles_alerta
+
+# Vistas de los bancos y del último bloque de lecturas en cada proceso trabajador
+_BANCO_TRABAJADOR = {}
+
+
+def _adjuntar_memoria(nombre):
+    """
+    Adjunta un bloque compartido creado por el proceso padre.
+
+    Los trabajadores del pool comparten el resource_tracker del padre, donde
+    el bloque ya está registrado; registrarlo otra vez no tiene efecto y el
+    padre lo libera al cerrar.
+    """
+    return shared_memory.SharedMemory(name=nombre)
+
+
+def _adjuntar_banco(nombre, distribucion, dimensiones):
+    """
+    Inicializador del trabajador: adjunta los bancos compartidos sin copiarlos.
+
+    Args:
+        nombre (str): Bloque con los bancos uno tras otro
+        distribucion (list): (fila_inicial, num_celulas) de cada banco; la
+            posición en la lista es el código del banco
+        dimensiones (int): Variables por lectura
+    """
+    memoria = _adjuntar_memoria(nombre)
+    filas = sum(2 + num_celulas for _, num_celulas in distribucion)
+    datos = np.ndarray((filas, dimensiones), dtype=np.float64, buffer=memoria.buf)
+    _BANCO_TRABAJADOR.update({
+        'memoria': memoria,
+        'bancos': [(datos[inicio], datos[inicio + 1], datos[inicio + 2:inicio + 2 + num_celulas])
+                   for inicio, num_celulas in distribucion],
+        'entrada': None
+    })
+
+
+def _lecturas_trabajador(nombre, capacidad, columnas):
+    """Vista del bloque de lecturas vigente; se readjunta cuando el padre lo reemplaza."""
+    entrada = _BANCO_TRABAJADOR['entrada']
+    if entrada is None or entrada[0] != nombre:
+        if entrada is not None:
+            entrada[1].close()
+        memoria = _adjuntar_memoria(nombre)
+        entrada = _BANCO_TRABAJADOR['entrada'] = (
+            nombre, memoria, np.ndarray((capacidad, columnas), dtype=np.float64, buffer=memoria.buf)
+        )
+    return entrada[2]
+
+
+def _detectar_fragmento(nombre_entrada, capacidad, columnas, inicio, fin, umbral):
+    """
+    Detección completa de un fragmento dentro de un proceso trabajador.
+
+    Las filas [inicio, fin) del bloque de lecturas traen las variables y, en
+    la última columna, el código del banco que debe puntuar cada lectura.
+    """
+    filas = _lecturas_trabajador(nombre_entrada, capacidad, columnas)[inicio:fin]
+    X, codigos = filas[:, :-1], filas[:, -1].astype(np.intp)
+    distancias = np.empty(len(X))
+    celulas = np.empty(len(X), dtype=np.intp)
+    for codigo in np.unique(codigos):
+        mascara = codigos == codigo
+        media, escala, celulas_banco = _BANCO_TRABAJADOR['bancos'][codigo]
+        distancias[mascara], celulas[mascara] = calcular_distancias_minimas((X[mascara] - media) / escala,
+                                                                            celulas_banco)
+    es_anomalia, umbral = aplicar_umbral_secuencial(distancias, umbral)
+    return es_anomalia, distancias, calcular_niveles_alerta(distancias), celulas, umbral
+
+
+def fragmento_de_sensor(sensor_id, num_fragmentos):
+    """Fragmento estable de un sensor (o campo) entre ejecuciones y procesos."""
+    if isinstance(sensor_id, (int, np.integer)):
+        return int(sensor_id) % num_fragmentos
+    return zlib.crc32(str(sensor_id).encode()) % num_fragmentos
+
+
+class DetectorMultiproceso:
+    """
+    Pool de procesos de detección sobre bancos de detectores compartidos.
+
+    Se comparten el banco global y los bancos por cultivo tal como están al
+    crear el detector, y cada lectura se puntúa en el banco de su cultivo,
+    como en detectar_anomalias_lote(). Los trabajadores calculan en float64
+    exacto: con dtype float32 o tabla cuantizada las decisiones son las
+    mismas (ambos modos verifican en float64 las distancias cercanas a una
+    decisión) y solo cambian los últimos decimales de las distancias. El modo
+    'seleccion_negativa' decide con otro banco y no está soportado.
+    """
+
+    def __init__(self, sistema, num_procesos=None, num_fragmentos=None, max_pendientes=None):
+        """
+        Publica los bancos del sistema en memoria compartida y arranca el pool.
+
+        Args:
+            sistema (SistemaInmunologicoArtificial): Sistema ya entrenado
+            num_procesos (int, optional): Procesos trabajadores (por defecto, núcleos)
+            num_fragmentos (int, optional): Fragmentos de sensores; por defecto
+                uno por proceso. Cada fragmento conserva su propio umbral.
+            max_pendientes (int, optional): Anomalías sin fusionar a partir de
+                las cuales detectar_lote() las fusiona en el historial del
+                sistema; por defecto la capacidad de ese historial
+        """
+        if sistema.celulas_memoria is None:
+            raise ValueError("El sistema no ha sido entrenado. Ejecutar entrenar_fase_self_nonself() primero.")
+        if sistema.modo_deteccion != 'memoria':
+            raise ValueError(f"DetectorMultiproceso no soporta modo_deteccion='{sistema.modo_deteccion}'; "
+                             f"solo 'memoria'.")
+
+        self.sistema = sistema
+        self.num_procesos = num_procesos or os.cpu_count() or 1
+        self.num_fragmentos = num_fragmentos or self.num_procesos
+        self.umbrales_fragmento = [sistema.umbral_activacion] * self.num_fragmentos
+        self.historial_fragmentos = [[] for _ in range(self.num_fragmentos)]
+        self.max_pendientes = max_pendientes or sistema.historial_anomalias.capacidad
+        self._pendientes = 0
+        self._secuencia = 0
+
+        # Código 0: banco global; 1..n: bancos por cultivo
+        bancos = [sistema] + list(sistema.bancos_cultivo.values())
+        self._codigos_banco = {cultivo: codigo for codigo, cultivo in enumerate(sistema.bancos_cultivo, start=1)}
+        self.dimensiones = sistema.celulas_memoria.shape[1]
+        distribucion, fila = [], 0
+        for banco in bancos:
+            distribucion.append((fila, len(banco.celulas_memoria)))
+            fila += 2 + len(banco.celulas_memoria)
+
+        self._memoria = shared_memory.SharedMemory(create=True, size=fila * self.dimensiones * 8)
+        datos = np.ndarray((fila, self.dimensiones), dtype=np.float64, buffer=self._memoria.buf)
+        for banco, (inicio, num_celulas) in zip(bancos, distribucion):
+            datos[inicio] = banco.scaler.mean_
+            datos[inicio + 1] = banco.scaler.scale_
+            datos[inicio + 2:inicio + 2 + num_celulas] = banco.celulas_memoria
+        self._entrada = None
+        self._capacidad_entrada = 0
+
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.num_procesos,
+            initializer=_adjuntar_banco,
+            initargs=(self._memoria.name, distribucion, self.dimensiones)
+        )
+
+    def _bloque_lecturas(self, num_lecturas):
+        """Bloque compartido de lecturas con espacio para num_lecturas (se agranda al doble)."""
+        if num_lecturas > self._capacidad_entrada:
+            if self._entrada is not None:
+                self._entrada.close()
+                self._entrada.unlink()
+            self._capacidad_entrada = max(num_lecturas, 2 * self._capacidad_entrada)
+            self._entrada = shared_memory.SharedMemory(
+                create=True, size=self._capacidad_entrada * (self.dimensiones + 1) * 8
+            )
+        return np.ndarray((self._capacidad_entrada, self.dimensiones + 1), dtype=np.float64,
+                          buffer=self._entrada.buf)
+
+    def detectar_lote(self, sensor_ids, X, tipos_cultivo=None):
+        """
+        Detecta anomalías repartiendo el lote entre fragmentos por sensor.
+
+        Args:
+            sensor_ids (list): Identificador de sensor o campo por lectura
+            X (array): Lecturas de forma (N, 4)
+            tipos_cultivo (str | list, optional): Tipo de cultivo común o por lectura
+
+        Returns:
+            tuple: (es_anomalia, distancia_minima, nivel_alerta, celula_activada)
+            en el orden original del lote
+        """
+        X = np.asarray(X, dtype=float).reshape(-1, self.dimensiones)
+        if tipos_cultivo is None or isinstance(tipos_cultivo, str):
+            tipos_cultivo = [tipos_cultivo or "general"] * len(X)
+        elif len(tipos_cultivo) != len(X):
+            raise ValueError("tipos_cultivo debe tener una entrada por lectura.")
+
+        fragmentos = np.fromiter((fragmento_de_sensor(s, self.num_fragmentos) for s in sensor_ids),
+                                 dtype=np.intp, count=len(X))
+        codigos = np.fromiter((self._codigos_banco.get(tipo, 0) for tipo in tipos_cultivo),
+                              dtype=np.float64, count=len(X))
+
+        # Lecturas ordenadas por fragmento: cada uno recibe un rango de filas
+        orden = np.argsort(fragmentos, kind='stable')
+        entrada = self._bloque_lecturas(len(X))
+        entrada[:len(X), :-1] = X[orden]
+        entrada[:len(X), -1] = codigos[orden]
+        presentes, inicios = np.unique(fragmentos[orden], return_index=True)
+        fines = np.append(inicios[1:], len(X))
+
+        futuros = {}
+        for fragmento, inicio, fin in zip(presentes.tolist(), inicios.tolist(), fines.tolist()):
+            futuros[fragmento] = (orden[inicio:fin], self._pool.submit(
+                _detectar_fragmento, self._entrada.name, self._capacidad_entrada, self.dimensiones + 1,
+                inicio, fin, self.umbrales_fragmento[fragmento]
+            ))
+
+        es_anomalia = np.zeros(len(X), dtype=bool)
+        distancias = np.empty(len(X))
+        niveles = np.empty(len(X), dtype=np.intp)
+        celulas = np.empty(len(X), dtype=np.intp)
+        timestamp = self.sistema.reloj()
+
+        for fragmento, (indices, futuro) in futuros.items():
+            es_f, dist_f, niv_f, cel_f, umbral = futuro.result()
+            self.umbrales_fragmento[fragmento] = umbral
+            es_anomalia[indices], distancias[indices] = es_f, dist_f
+            niveles[indices], celulas[indices] = niv_f, cel_f
+
+            for j in np.flatnonzero(es_f):
+                i = indices[j]
+                self.historial_fragmentos[fragmento].append((self._secuencia + i, {
+                    'timestamp': timestamp,
+                    'dato': X[i].copy(),
+                    'distancia': dist_f[j],
+                    'nivel_alerta': int(niv_f[j]),
+                    'celula_activada': cel_f[j],
+                    'tipo_cultivo': tipos_cultivo[i]
+                }))
+            self._pendientes += int(np.count_nonzero(es_f))
+
+        self._secuencia += len(X)
+        if self._pendientes > self.max_pendientes:
+            self.fusionar_historiales()
+        return es_anomalia, distancias, niveles, celulas
+
+    def fusionar_historiales(self):
+        """
+        Incorpora al sistema las anomalías nuevas de todos los fragmentos.
+
+        Las entradas se intercalan en el orden global de llegada de las
+        lecturas y salen de las listas de los fragmentos, que solo conservan
+        las anomalías aún no fusionadas. El umbral_activacion del sistema se
+        adapta con cada anomalía incorporada, en ese mismo orden, como si las
+        hubiera detectado él; los umbrales de los fragmentos, que deciden la
+        detección, siguen en umbrales_fragmento.
+
+        Returns:
+            int: Número de anomalías incorporadas
+        """
+        nuevas = self.historial_fragmentos
+        self.historial_fragmentos = [[] for _ in range(self.num_fragmentos)]
+        self._pendientes = 0
+
+        incorporadas = 0
+        umbral = self.sistema.umbral_activacion
+        for _, registro in heapq.merge(*nuevas, key=lambda entrada: entrada[0]):
+            self.sistema.historial_anomalias.append(registro)
+            umbral = ajustar_umbral(umbral, registro['distancia'])
+            incorporadas += 1
+        self.sistema.umbral_activacion = float(umbral)
+        return incorporadas
+
+    def generar_reporte_ejecutivo(self):
+        """Fusiona los historiales de los fragmentos y genera el reporte del sistema."""
+        self.fusionar_historiales()
+        return self.sistema.generar_reporte_ejecutivo()
+
+    def cerrar(self):
+        """Detiene los trabajadores y libera los bloques de memoria compartida."""
+        self._pool.shutdown(wait=True)
+        for memoria in (self._memoria, self._entrada):
+            if memoria is not None:
+                memoria.close()
+                memoria.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
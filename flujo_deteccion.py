@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Flujo de Detección en Micro-lotes para el Sistema Inmunológico Artificial
+
+Consume lecturas de sensores IoT a medida que llegan, ya sea desde un
+iterador normal o un iterador asíncrono de tuplas
+(sensor_id, tipo_cultivo, lectura), y las agrupa en micro-lotes acotados
+por tamaño y por tiempo máximo de espera. Cada micro-lote se evalúa con la
+detección vectorizada del sistema y los resultados se entregan en el mismo
+orden de llegada.
+
+Como los lotes se procesan uno tras otro y la detección por lote adapta el
+umbral lectura a lectura, la evolución de umbral_activacion es idéntica a la
+de llamar detectar_anomalia() sobre la misma secuencia, sin importar dónde
+caigan los cortes entre lotes.
+
+Con cambios_solamente=True, EstadoSensores recuerda la última lectura
+cuantizada de cada sensor y su resultado: una lectura repetida reutiliza ese
+resultado sin pasar por la detección ni por el historial de anomalías, hasta
+que la lectura cambia o vence el intervalo de latido. En ese modo la
+evolución del umbral es la de detectar_anomalia() sobre las lecturas que
+efectivamente cambiaron. La tabla se vacía cuando cambia el modelo del
+sistema (banco de detectores, escalador, bancos por cultivo, modo o tabla
+cuantizada), y un resultado guardado cuya decisión ya no coincide con el
+umbral vigente se vuelve a evaluar.
+
+Autor: Leonardo Mosquera
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+
+from sistema_bioinspirado_cultivos import PASOS_CUANTIZACION
+
+ResultadoLectura = namedtuple('ResultadoLectura', [
+    'sensor_id', 'tipo_cultivo', 'lectura', 'es_anomalia', 'distancia',
+    'nivel_alerta', 'celula_activada', 'id_lote', 'repetida'
+], defaults=(False,))
+
+_FIN_FUENTE = object()
+
+
+def _firma_modelo(sistema):
+    """Objetos de los que dependen las decisiones del sistema y de sus bancos."""
+    escalador = sistema.scaler
+    firma = [sistema.celulas_memoria, escalador, getattr(escalador, 'mean_', None),
+             getattr(escalador, 'scale_', None), sistema.detectores_nonself,
+             sistema.modo_deteccion, sistema.tabla_cuantizada]
+    for cultivo in sorted(sistema.bancos_cultivo, key=str):
+        firma.append(cultivo)
+        firma.extend(_firma_modelo(sistema.bancos_cultivo[cultivo]))
+    return firma
+
+
+def _misma_firma(firma, otra):
+    """Compara firmas por identidad; los nombres se comparan por valor."""
+    return otra is not None and len(firma) == len(otra) and all(
+        a is b or (isinstance(a, str) and a == b) for a, b in zip(firma, otra)
+    )
+
+
+def _pasos_sistema(sistema):
+    """
+    Resolución de comparación acorde al sistema: la de su tabla cuantizada,
+    PASOS_CUANTIZACION si las lecturas tienen sus 4 dimensiones, o una
+    centésima de la desviación estándar de cada dimensión en otro caso.
+    """
+    if sistema.tabla_cuantizada is not None:
+        return sistema.tabla_cuantizada.pasos
+    if sistema.celulas_memoria.shape[1] == len(PASOS_CUANTIZACION):
+        return PASOS_CUANTIZACION
+    return sistema.scaler.scale_ / 100.0
+
+
+class EstadoSensores:
+    """
+    Tabla por sensor con su última lectura cuantizada, su resultado y el
+    instante en que se evaluó.
+    """
+
+    def __init__(self, pasos=None, latido_s=300.0):
+        """
+        Args:
+            pasos (tuple, optional): Resolución con que se comparan las
+                lecturas; si se omite la fija sincronizar() según el sistema
+            latido_s (float): Segundos tras los cuales una lectura sin cambios
+                se vuelve a evaluar
+        """
+        self.pasos_fijos = pasos is not None
+        self.pasos = None if pasos is None else np.asarray(pasos, dtype=float)
+        self.latido_s = latido_s
+        self.duplicados_suprimidos = 0
+        self.reevaluadas_por_latido = 0
+        self.invalidaciones = 0
+        self._firma = None
+        self._estado = {}
+
+    def __len__(self):
+        return len(self._estado)
+
+    def sincronizar(self, sistema):
+        """
+        Vacía la tabla si el modelo del sistema cambió desde el último lote
+        (actualizar_self, reentrenamiento, supresión, tabla cuantizada nueva...).
+
+        Args:
+            sistema (SistemaInmunologicoArtificial): Sistema que evalúa las lecturas
+        """
+        firma = _firma_modelo(sistema)
+        if _misma_firma(firma, self._firma):
+            return
+        if self._estado:
+            self.invalidaciones += 1
+            self._estado.clear()
+        self._firma = firma
+        if not self.pasos_fijos:
+            self.pasos = np.asarray(_pasos_sistema(sistema), dtype=float)
+
+    def claves(self, cultivos, X):
+        """Clave de comparación de cada lectura: cultivo y valores cuantizados."""
+        cuantizadas = np.rint(np.asarray(X, dtype=float) / self.pasos).astype(np.int64)
+        return [(cultivo, fila.tobytes()) for cultivo, fila in zip(cultivos, cuantizadas)]
+
+    def separar(self, sensores, claves, ahora, umbral=None):
+        """
+        Decide qué lecturas de un lote deben evaluarse.
+
+        Args:
+            sensores (sequence): Sensor de cada lectura
+            claves (list): Claves de claves()
+            ahora (int): Instante del lote en nanosegundos (reloj del sistema)
+            umbral (float, optional): Umbral vigente; un resultado guardado
+                cuya decisión no coincide con él se vuelve a evaluar
+
+        Returns:
+            tuple: (indices_evaluar, origenes); origenes[i] es None si la
+            lectura se evalúa, el índice de la lectura anterior del mismo lote
+            cuyo resultado repite, o el ResultadoLectura guardado del sensor
+        """
+        evaluar = []
+        origenes = []
+        en_lote = {}
+        for i, (sensor, clave) in enumerate(zip(sensores, claves)):
+            if sensor in en_lote:
+                previo, clave_previa = en_lote[sensor]
+                if clave_previa == clave and self.latido_s > 0:
+                    origenes.append(previo)
+                    self.duplicados_suprimidos += 1
+                    continue
+            elif sensor in self._estado:
+                clave_previa, resultado, instante = self._estado[sensor]
+                vigente = umbral is None or (resultado.distancia > umbral) == resultado.es_anomalia
+                if clave_previa == clave and vigente:
+                    if ahora - instante < self.latido_s * 1e9:
+                        origenes.append(resultado)
+                        self.duplicados_suprimidos += 1
+                        continue
+                    self.reevaluadas_por_latido += 1
+
+            en_lote[sensor] = (i, clave)
+            evaluar.append(i)
+            origenes.append(None)
+
+        return evaluar, origenes
+
+    def registrar(self, sensor, clave, resultado, instante):
+        """
+        Guarda el resultado evaluado de la lectura más reciente de un sensor,
+        con una copia propia de la lectura para no retener el arreglo del lote.
+        """
+        self._estado[sensor] = (clave, resultado._replace(lectura=np.array(resultado.lectura)), instante)
+
+    def clear(self):
+        self._estado.clear()
+
+
+class FlujoDeteccion:
+    """
+    Etapa de pipeline que agrupa lecturas en micro-lotes y las evalúa.
+
+    Las latencias de cada lote (tiempo de detección y espera de la lectura
+    más antigua) quedan disponibles en latencias_lote y en estadisticas().
+    """
+
+    def __init__(self, sistema, tamano_lote=256, espera_maxima=0.05, historial_latencias=1000,
+                 cambios_solamente=False, latido_s=300.0):
+        """
+        Configura la etapa de detección.
+
+        Args:
+            sistema (SistemaInmunologicoArtificial): Sistema ya entrenado
+            tamano_lote (int): Máximo de lecturas por micro-lote
+            espera_maxima (float): Segundos máximos que una lectura espera en
+                el lote antes de forzar su evaluación
+            historial_latencias (int): Lotes recientes cuyas latencias se conservan
+            cambios_solamente (bool): Reutilizar el resultado de las lecturas
+                que repiten la última lectura cuantizada de su sensor
+            latido_s (float): Segundos tras los cuales una lectura repetida se
+                vuelve a evaluar
+        """
+        if tamano_lote < 1:
+            raise ValueError("tamano_lote debe ser al menos 1.")
+
+        self.sistema = sistema
+        self.tamano_lote = tamano_lote
+        self.espera_maxima = espera_maxima
+        self.latencias_lote = deque(maxlen=historial_latencias)
+        self.lotes_procesados = 0
+        self.lecturas_procesadas = 0
+        self.estado_sensores = EstadoSensores(latido_s=latido_s) if cambios_solamente else None
+
+    def _evaluar_lote(self, pendientes, llegada_primera):
+        """Evalúa un micro-lote y devuelve sus resultados en orden de llegada."""
+        sensores, cultivos, lecturas = zip(*pendientes)
+        X = np.asarray(lecturas, dtype=float)
+        if self.estado_sensores is not None:
+            return self._evaluar_cambios(sensores, cultivos, X, llegada_primera)
+
+        inicio = time.perf_counter()
+        es_anomalia, distancias, niveles, celulas = self.sistema.detectar_anomalias_lote(X, list(cultivos))
+        fin = time.perf_counter()
+
+        return self._registrar_lote(sensores, cultivos, X, es_anomalia, distancias,
+                                    niveles, celulas, inicio, fin, llegada_primera)
+
+    def _evaluar_cambios(self, sensores, cultivos, X, llegada_primera):
+        """Evalúa solo las lecturas que cambiaron y repite el resultado del resto."""
+        estado = self.estado_sensores
+        sistema = self.sistema
+        estado.sincronizar(sistema)
+        ahora = sistema.reloj()
+        claves = estado.claves(cultivos, X)
+        umbral = sistema.umbral_activacion if sistema.modo_deteccion == 'memoria' else None
+        evaluar, origenes = estado.separar(sensores, claves, ahora, umbral)
+
+        es_anomalia = np.zeros(len(X), dtype=bool)
+        distancias = np.zeros(len(X))
+        niveles = np.zeros(len(X), dtype=np.int64)
+        celulas = np.zeros(len(X), dtype=np.int64)
+        inicio = time.perf_counter()
+        if evaluar:
+            (es_anomalia[evaluar], distancias[evaluar],
+             niveles[evaluar], celulas[evaluar]) = self.sistema.detectar_anomalias_lote(
+                X[evaluar], [cultivos[i] for i in evaluar]
+            )
+        fin = time.perf_counter()
+
+        repetidas = np.ones(len(X), dtype=bool)
+        repetidas[evaluar] = False
+        for i, origen in enumerate(origenes):
+            if origen is None:
+                continue
+            if isinstance(origen, ResultadoLectura):
+                es_anomalia[i], distancias[i] = origen.es_anomalia, origen.distancia
+                niveles[i], celulas[i] = origen.nivel_alerta, origen.celula_activada
+            else:
+                es_anomalia[i], distancias[i] = es_anomalia[origen], distancias[origen]
+                niveles[i], celulas[i] = niveles[origen], celulas[origen]
+
+        resultados = self._registrar_lote(sensores, cultivos, X, es_anomalia, distancias, niveles,
+                                          celulas, inicio, fin, llegada_primera, repetidas)
+        for i in evaluar:
+            estado.registrar(sensores[i], claves[i], resultados[i], ahora)
+        return resultados
+
+    def _registrar_lote(self, sensores, cultivos, X, es_anomalia, distancias,
+                        niveles, celulas, inicio, fin, llegada_primera, repetidas=None):
+        """Registra las latencias de un lote ya evaluado y arma sus resultados."""
+        id_lote = self.lotes_procesados
+        self.lotes_procesados += 1
+        self.lecturas_procesadas += len(X)
+        self.latencias_lote.append({
+            'id_lote': id_lote,
+            'tamano': len(X),
+            'latencia_deteccion_s': fin - inicio,
+            'espera_maxima_s': inicio - llegada_primera
+        })
+
+        return [
+            ResultadoLectura(sensores[i], cultivos[i], X[i], bool(es_anomalia[i]),
+                             float(distancias[i]), int(niveles[i]), int(celulas[i]), id_lote,
+                             repetidas is not None and bool(repetidas[i]))
+            for i in range(len(X))
+        ]
+
+    def procesar(self, fuente):
+        """
+        Procesa un iterador de lecturas entregando resultados en orden de llegada.
+
+        La fuente se consume en un hilo auxiliar, de modo que el plazo de
+        espera_maxima se cumple aunque la fuente quede bloqueada esperando
+        la siguiente lectura. Si el generador se cierra antes de agotar la
+        fuente, el hilo deja de leerla tras entregar la lectura en curso.
+
+        Args:
+            fuente (iterable): Tuplas (sensor_id, tipo_cultivo, lectura)
+
+        Yields:
+            ResultadoLectura: Un resultado por lectura
+        """
+        cola = queue.Queue(maxsize=4 * self.tamano_lote)
+        detener = threading.Event()
+
+        def _poner(elemento):
+            # put con plazo para notar que el consumidor abandonó el generador
+            while not detener.is_set():
+                try:
+                    cola.put(elemento, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def _consumir():
+            try:
+                for elemento in fuente:
+                    if not _poner((time.perf_counter(), elemento)):
+                        return
+                _poner((None, _FIN_FUENTE))
+            except BaseException as error:
+                _poner((None, error))
+
+        hilo = threading.Thread(target=_consumir, daemon=True)
+        hilo.start()
+
+        pendientes = []
+        llegada_primera = None
+        try:
+            while True:
+                espera = None
+                if pendientes:
+                    espera = max(0.0, llegada_primera + self.espera_maxima - time.perf_counter())
+                try:
+                    llegada, elemento = cola.get(timeout=espera)
+                except queue.Empty:
+                    yield from self._evaluar_lote(pendientes, llegada_primera)
+                    pendientes = []
+                    continue
+
+                if elemento is _FIN_FUENTE or isinstance(elemento, BaseException):
+                    if pendientes:
+                        yield from self._evaluar_lote(pendientes, llegada_primera)
+                    if isinstance(elemento, BaseException):
+                        raise elemento
+                    return
+
+                if not pendientes:
+                    llegada_primera = llegada
+                pendientes.append(elemento)
+                if len(pendientes) >= self.tamano_lote:
+                    yield from self._evaluar_lote(pendientes, llegada_primera)
+                    pendientes = []
+        finally:
+            detener.set()
+
+    async def procesar_async(self, fuente, ejecutor=None, al_fallar=None):
+        """
+        Versión asíncrona de procesar() para iteradores asíncronos.
+
+        Args:
+            fuente (async iterable): Tuplas (sensor_id, tipo_cultivo, lectura)
+            ejecutor (concurrent.futures.Executor, optional): Si se indica, la
+                detección corre en el ejecutor para no bloquear el event loop.
+                Debe ejecutar las tareas en orden (p. ej. un solo hilo) para
+                conservar la adaptación determinista del umbral.
+            al_fallar (callable, optional): Si se indica, un lote cuya
+                detección lanza una excepción se descarta llamando
+                al_fallar(error, lecturas_del_lote) y el procesamiento sigue;
+                por defecto la excepción se propaga
+
+        Yields:
+            ResultadoLectura: Un resultado por lectura
+        """
+        loop = asyncio.get_running_loop()
+        iterador = fuente.__aiter__()
+        siguiente = None
+        pendientes = []
+        llegada_primera = None
+
+        async def _evaluar():
+            try:
+                if ejecutor is None:
+                    return self._evaluar_lote(pendientes, llegada_primera)
+                return await loop.run_in_executor(ejecutor, self._evaluar_lote, pendientes, llegada_primera)
+            except Exception as error:
+                if al_fallar is None:
+                    raise
+                al_fallar(error, list(pendientes))
+                return []
+
+        try:
+            while True:
+                if siguiente is None:
+                    siguiente = asyncio.ensure_future(iterador.__anext__())
+
+                espera = None
+                if pendientes:
+                    espera = max(0.0, llegada_primera + self.espera_maxima - time.perf_counter())
+                listos, _ = await asyncio.wait({siguiente}, timeout=espera)
+
+                if not listos:
+                    # Plazo vencido: se evalúa el lote sin cancelar la lectura en curso
+                    for resultado in await _evaluar():
+                        yield resultado
+                    pendientes = []
+                    continue
+
+                tarea, siguiente = siguiente, None
+                try:
+                    elemento = tarea.result()
+                except StopAsyncIteration:
+                    if pendientes:
+                        for resultado in await _evaluar():
+                            yield resultado
+                    return
+
+                if not pendientes:
+                    llegada_primera = time.perf_counter()
+                pendientes.append(elemento)
+                if len(pendientes) >= self.tamano_lote:
+                    for resultado in await _evaluar():
+                        yield resultado
+                    pendientes = []
+        finally:
+            # Un generador abandonado no deja la lectura en curso pendiente
+            if siguiente is not None:
+                siguiente.cancel()
+
+    def estadisticas(self):
+        """
+        Resume las latencias de los lotes recientes.
+
+        Returns:
+            dict: Conteos y percentiles de latencia de detección por lote
+        """
+        if not self.latencias_lote:
+            return {'lotes_procesados': 0, 'lecturas_procesadas': 0}
+
+        latencias = np.array([l['latencia_deteccion_s'] for l in self.latencias_lote])
+        tamanos = np.array([l['tamano'] for l in self.latencias_lote])
+        cambios = {}
+        if self.estado_sensores is not None:
+            cambios = {
+                'sensores_rastreados': len(self.estado_sensores),
+                'duplicados_suprimidos': self.estado_sensores.duplicados_suprimidos,
+                'reevaluadas_por_latido': self.estado_sensores.reevaluadas_por_latido,
+                'invalidaciones_modelo': self.estado_sensores.invalidaciones
+            }
+        return {
+            'lotes_procesados': self.lotes_procesados,
+            'lecturas_procesadas': self.lecturas_procesadas,
+            'tamano_lote_promedio': float(tamanos.mean()),
+            'latencia_p50_ms': float(np.percentile(latencias, 50) * 1e3),
+            'latencia_p95_ms': float(np.percentile(latencias, 95) * 1e3),
+            'latencia_max_ms': float(latencias.max() * 1e3),
+            'lecturas_por_segundo': float(tamanos.sum() / max(latencias.sum(), 1e-12)),
+            **cambios
+        }
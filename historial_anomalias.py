@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Historial de Anomalías en Búfer Circular Columnar
+
+Reemplaza la lista sin límite de diccionarios del Sistema Inmunológico
+Artificial por arreglos NumPy preasignados de capacidad fija: timestamp en
+nanosegundos, distancia, nivel de alerta, célula activada, código de cultivo
+y la lectura original. Al llenarse, cada registro nuevo sobrescribe al más
+antiguo y se cuenta en descartadas, así la memoria del detector queda acotada
+aunque corra durante meses.
+
+Con un escritor de derrame (segmentos_anomalias.EscritorSegmentos), los
+registros desalojados de memoria no se pierden: se entregan en bloque al
+escritor, que los persiste en segmentos columnares fuera del camino de
+detección.
+
+Los agregados del reporte ejecutivo (totales, críticas, detecciones tempranas
+y conteos por día y por hora) se mantienen en AgregadosHistorial con cada
+alta y cada desalojo, así el reporte sale en tiempo constante.
+
+La lectura conserva una API tipo lista (len, iteración, índices y slices que
+devuelven diccionarios con las mismas claves de siempre), de modo que el
+código que recorría historial_anomalias sigue funcionando.
+
+Autor: Leonardo Mosquera
+"""
+
+from bisect import bisect_left
+
+import numpy as np
+import pandas as pd
+
+COLUMNAS_HISTORIAL = ('timestamp', 'dato', 'distancia', 'nivel_alerta', 'celula_activada', 'codigo_cultivo')
+
+NS_POR_HORA = 3600 * 10**9
+NS_POR_DIA = 24 * NS_POR_HORA
+
+# Niveles de alerta Alto o Crítico, y Normal a Medio (detección temprana)
+NIVEL_CRITICO_MINIMO = 3
+NIVEL_TEMPRANO_MAXIMO = 2
+
+
+class AgregadosHistorial:
+    """
+    Agregados acumulados del historial, actualizados por lote en O(1).
+
+    La tendencia del reporte ejecutivo exige que los conteos diarios, en orden
+    de fecha, no decrezcan; en lugar de recorrer todos los días se lleva la
+    cuenta de pares de días consecutivos con descenso, y solo se revisan los
+    vecinos del día que cambió.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.criticas = 0
+        self.tempranas = 0
+        self.por_dia = {}
+        self.por_hora = {}
+        self._dias = []
+        self._descensos = 0
+
+    def actualizar(self, timestamps, niveles, signo=1):
+        """
+        Suma (signo=1) o resta (signo=-1) un bloque de anomalías.
+
+        Args:
+            timestamps (array): Timestamps en nanosegundos
+            niveles (array): Nivel de alerta de cada anomalía
+            signo (int): 1 al registrar, -1 al desalojar
+        """
+        if len(timestamps) == 0:
+            return
+        niveles = np.asarray(niveles)
+        self.total += signo * len(timestamps)
+        self.criticas += signo * int(np.count_nonzero(niveles >= NIVEL_CRITICO_MINIMO))
+        self.tempranas += signo * int(np.count_nonzero(niveles <= NIVEL_TEMPRANO_MAXIMO))
+
+        dias, conteos = np.unique(np.asarray(timestamps) // NS_POR_DIA, return_counts=True)
+        for dia, conteo in zip(dias.tolist(), conteos.tolist()):
+            self._ajustar_dia(dia, signo * conteo)
+
+        horas, conteos = np.unique(np.asarray(timestamps) // NS_POR_HORA, return_counts=True)
+        for hora, conteo in zip(horas.tolist(), conteos.tolist()):
+            nuevo = self.por_hora.get(hora, 0) + signo * conteo
+            if nuevo:
+                self.por_hora[hora] = nuevo
+            else:
+                del self.por_hora[hora]
+
+    def actualizar_uno(self, timestamp, nivel, signo=1):
+        """Versión escalar de actualizar() para una sola anomalía, sin arreglos temporales."""
+        self.total += signo
+        if nivel >= NIVEL_CRITICO_MINIMO:
+            self.criticas += signo
+        if nivel <= NIVEL_TEMPRANO_MAXIMO:
+            self.tempranas += signo
+        self._ajustar_dia(timestamp // NS_POR_DIA, signo)
+
+        hora = timestamp // NS_POR_HORA
+        nuevo = self.por_hora.get(hora, 0) + signo
+        if nuevo:
+            self.por_hora[hora] = nuevo
+        else:
+            del self.por_hora[hora]
+
+    def _descenso(self, dia_anterior, dia_siguiente):
+        if dia_anterior is None or dia_siguiente is None:
+            return 0
+        return int(self.por_dia[dia_anterior] > self.por_dia[dia_siguiente])
+
+    def _ajustar_dia(self, dia, delta):
+        """Cambia el conteo de un día recalculando solo los pares con sus vecinos."""
+        i = bisect_left(self._dias, dia)
+        existe = i < len(self._dias) and self._dias[i] == dia
+        anterior = self._dias[i - 1] if i > 0 else None
+        j = i + 1 if existe else i
+        siguiente = self._dias[j] if j < len(self._dias) else None
+
+        if existe:
+            self._descensos -= self._descenso(anterior, dia) + self._descenso(dia, siguiente)
+        else:
+            self._descensos -= self._descenso(anterior, siguiente)
+            self._dias.insert(i, dia)
+
+        conteo = self.por_dia.get(dia, 0) + delta
+        if conteo:
+            self.por_dia[dia] = conteo
+            self._descensos += self._descenso(anterior, dia) + self._descenso(dia, siguiente)
+        else:
+            self.por_dia.pop(dia, None)
+            del self._dias[i]
+            self._descensos += self._descenso(anterior, siguiente)
+
+    @property
+    def tendencia_creciente(self):
+        """Los conteos diarios en orden de fecha no decrecen."""
+        return self._descensos == 0
+
+    def conteos_por_dia(self):
+        """Serie de anomalías por fecha, en orden cronológico."""
+        return pd.Series([self.por_dia[dia] for dia in self._dias],
+                         index=pd.to_datetime(np.asarray(self._dias, dtype=np.int64) * NS_POR_DIA).date)
+
+    def conteos_por_hora(self):
+        """Serie de anomalías por hora, en orden cronológico."""
+        horas = sorted(self.por_hora)
+        return pd.Series([self.por_hora[hora] for hora in horas],
+                         index=pd.to_datetime(np.asarray(horas, dtype=np.int64) * NS_POR_HORA))
+
+
+class HistorialAnomalias:
+    """
+    Búfer circular columnar de anomalías con capacidad fija.
+    """
+
+    def __init__(self, capacidad=100000, dimensiones=None, derrame=None):
+        """
+        Configura el historial; las columnas se preasignan completas en la
+        primera anomalía, cuando se conoce el número de variables.
+
+        Args:
+            capacidad (int): Máximo de anomalías conservadas en memoria
+            dimensiones (int, optional): Variables de cada lectura; por defecto
+                las de la primera anomalía registrada
+            derrame (EscritorSegmentos, optional): Destino de los registros
+                desalojados; sin él, los registros más antiguos se descartan
+        """
+        if capacidad < 1:
+            raise ValueError("capacidad debe ser al menos 1.")
+
+        self.capacidad = capacidad
+        self.derrame = derrame
+        self._reservar(dimensiones)
+
+        self.cultivos = []
+        self._codigos_cultivo = {}
+        self._inicio = 0
+        self._tamano = 0
+        self.descartadas = 0
+        self.agregados = AgregadosHistorial()
+
+    def _reservar(self, dimensiones):
+        """Preasigna las columnas; sin dimensiones quedan vacías hasta la primera anomalía."""
+        capacidad = self.capacidad if dimensiones else 0
+        self.dimensiones = dimensiones
+        self.timestamp = np.zeros(capacidad, dtype=np.int64)
+        self.distancia = np.zeros(capacidad, dtype=np.float64)
+        self.nivel_alerta = np.zeros(capacidad, dtype=np.int8)
+        self.celula_activada = np.zeros(capacidad, dtype=np.int64)
+        self.codigo_cultivo = np.zeros(capacidad, dtype=np.int16)
+        self.dato = np.zeros((capacidad, dimensiones or 0), dtype=np.float64)
+
+    def codigo_de_cultivo(self, tipo_cultivo):
+        """Código entero estable de un tipo de cultivo (se asigna al primer uso)."""
+        codigo = self._codigos_cultivo.get(tipo_cultivo)
+        if codigo is None:
+            codigo = self._codigos_cultivo[tipo_cultivo] = len(self.cultivos)
+            self.cultivos.append(tipo_cultivo)
+        return codigo
+
+    @property
+    def total_registradas(self):
+        """Anomalías registradas desde la creación, incluidas las descartadas."""
+        return self.descartadas + self._tamano
+
+    def append(self, registro):
+        """
+        Agrega una anomalía con el formato de diccionario del historial.
+
+        Es el camino de detectar_anomalia(): escribe una fila en cada columna
+        y actualiza los agregados con operaciones escalares, sin pasar por los
+        arreglos temporales de agregar_lote().
+
+        Args:
+            registro (dict): Claves timestamp (ns enteros o pd.Timestamp), dato,
+                distancia, nivel_alerta, celula_activada y tipo_cultivo
+        """
+        timestamp = registro['timestamp']
+        if not isinstance(timestamp, (int, np.integer)):
+            timestamp = pd.Timestamp(timestamp).value
+        timestamp = int(timestamp)
+        nivel = int(registro['nivel_alerta'])
+        if self.dimensiones is None:
+            self._reservar(np.size(registro['dato']))
+
+        if self._tamano == self.capacidad:
+            # Búfer lleno: el registro más antiguo sale de memoria
+            posicion = self._inicio
+            self.agregados.actualizar_uno(int(self.timestamp[posicion]), int(self.nivel_alerta[posicion]), signo=-1)
+            if self.derrame is not None:
+                self.derrame.derramar_registro(self.timestamp[posicion], self.dato[posicion],
+                                               self.distancia[posicion], self.nivel_alerta[posicion],
+                                               self.celula_activada[posicion], self.codigo_cultivo[posicion],
+                                               self.cultivos)
+            self._inicio = (posicion + 1) % self.capacidad
+            self.descartadas += 1
+        else:
+            posicion = (self._inicio + self._tamano) % self.capacidad
+            self._tamano += 1
+
+        self.timestamp[posicion] = timestamp
+        self.dato[posicion] = registro['dato']
+        self.distancia[posicion] = registro['distancia']
+        self.nivel_alerta[posicion] = nivel
+        self.celula_activada[posicion] = registro['celula_activada']
+        self.codigo_cultivo[posicion] = self.codigo_de_cultivo(registro['tipo_cultivo'])
+        self.agregados.actualizar_uno(timestamp, nivel)
+
+    def agregar_lote(self, timestamp_ns, datos, distancias, niveles, celulas, tipos_cultivo):
+        """
+        Agrega varias anomalías con una escritura vectorizada por columna.
+
+        Args:
+            timestamp_ns (int | array): Timestamp común en nanosegundos o uno por anomalía
+            datos (array): Lecturas de forma (N, dimensiones)
+            distancias (array): Distancia al detector más afín
+            niveles (array): Nivel de alerta
+            celulas (array): Célula activada
+            tipos_cultivo (list): Tipo de cultivo de cada anomalía
+        """
+        n = len(distancias)
+        if n == 0:
+            return
+        datos = np.asarray(datos, dtype=float).reshape(n, -1)
+        if self.dimensiones is None:
+            self._reservar(datos.shape[1])
+
+        codigos = np.fromiter((self.codigo_de_cultivo(c) for c in tipos_cultivo), dtype=np.int16, count=n)
+        timestamps = np.broadcast_to(np.asarray(timestamp_ns, dtype=np.int64), (n,))
+        columnas = dict(zip(COLUMNAS_HISTORIAL, (timestamps, datos, np.asarray(distancias, dtype=float),
+                                                 np.asarray(niveles), np.asarray(celulas), codigos)))
+
+        # Registros que salen de memoria: los más antiguos del búfer y, si el
+        # lote supera la capacidad, también sus primeros registros
+        excedente = max(0, n - self.capacidad)
+        desplazadas = max(0, self._tamano + n - excedente - self.capacidad)
+        self.agregados.actualizar(columnas['timestamp'], columnas['nivel_alerta'])
+        if desplazadas + excedente:
+            salientes = (self._inicio + np.arange(desplazadas)) % self.capacidad
+            self.agregados.actualizar(
+                np.concatenate([self.timestamp[salientes], columnas['timestamp'][:excedente]]),
+                np.concatenate([self.nivel_alerta[salientes], columnas['nivel_alerta'][:excedente]]),
+                signo=-1
+            )
+            if self.derrame is not None:
+                self.derrame.derramar({
+                    nombre: np.concatenate([getattr(self, nombre)[salientes], columnas[nombre][:excedente]])
+                    for nombre in COLUMNAS_HISTORIAL
+                }, self.cultivos)
+
+        if excedente:
+            columnas = {nombre: valor[excedente:] for nombre, valor in columnas.items()}
+            n = self.capacidad
+
+        posiciones = (self._inicio + self._tamano + np.arange(n)) % self.capacidad
+        for nombre in COLUMNAS_HISTORIAL:
+            getattr(self, nombre)[posiciones] = columnas[nombre]
+
+        self._inicio = (self._inicio + desplazadas) % self.capacidad
+        self._tamano = min(self._tamano + n, self.capacidad)
+        self.descartadas += desplazadas + excedente
+
+    def _posiciones(self):
+        """Posiciones físicas de los registros vigentes, del más antiguo al más reciente."""
+        return (self._inicio + np.arange(self._tamano)) % self.capacidad
+
+    def columnas(self):
+        """
+        Copia de las columnas vigentes en orden cronológico.
+
+        Returns:
+            dict: Arreglos timestamp (int64 ns), dato, distancia, nivel_alerta,
+            celula_activada, codigo_cultivo y la tabla de cultivos
+        """
+        posiciones = self._posiciones()
+        return {
+            'timestamp': self.timestamp[posiciones],
+            'dato': self.dato[posiciones],
+            'distancia': self.distancia[posiciones],
+            'nivel_alerta': self.nivel_alerta[posiciones],
+            'celula_activada': self.celula_activada[posiciones],
+            'codigo_cultivo': self.codigo_cultivo[posiciones],
+            'cultivos': list(self.cultivos)
+        }
+
+    def a_dataframe(self):
+        """DataFrame del historial con las mismas columnas que la lista de diccionarios."""
+        columnas = self.columnas()
+        return pd.DataFrame({
+            'timestamp': pd.to_datetime(columnas['timestamp']),
+            'dato': list(columnas['dato']),
+            'distancia': columnas['distancia'],
+            'nivel_alerta': columnas['nivel_alerta'].astype(int),
+            'celula_activada': columnas['celula_activada'],
+            'tipo_cultivo': np.asarray(columnas['cultivos'] or [''], dtype=object)[columnas['codigo_cultivo']]
+        })
+
+    def _registro(self, posicion):
+        return {
+            'timestamp': pd.Timestamp(int(self.timestamp[posicion])),
+            'dato': self.dato[posicion].copy(),
+            'distancia': float(self.distancia[posicion]),
+            'nivel_alerta': int(self.nivel_alerta[posicion]),
+            'celula_activada': int(self.celula_activada[posicion]),
+            'tipo_cultivo': self.cultivos[self.codigo_cultivo[posicion]]
+        }
+
+    def __len__(self):
+        return self._tamano
+
+    def __iter__(self):
+        for posicion in self._posiciones():
+            yield self._registro(posicion)
+
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            return [self._registro(posicion) for posicion in self._posiciones()[indice]]
+        if not -self._tamano <= indice < self._tamano:
+            raise IndexError("Índice fuera del historial de anomalías.")
+        return self._registro((self._inicio + indice % self._tamano) % self.capacidad)
+
+    def clear(self):
+        """Vacía el historial (el contador de descartadas se conserva)."""
+        self._inicio = 0
+        self._tamano = 0
+        self.agregados = AgregadosHistorial()
+
+    def cerrar(self, derramar_vigentes=True):
+        """
+        Cierra el escritor de derrame, si lo hay.
+
+        Args:
+            derramar_vigentes (bool): Persistir también los registros que siguen
+                en memoria, para que el disco contenga el historial completo
+        """
+        if self.derrame is None or self.derrame.cerrado:
+            return
+        if derramar_vigentes and self._tamano:
+            posiciones = self._posiciones()
+            self.derrame.derramar({nombre: getattr(self, nombre)[posiciones] for nombre in COLUMNAS_HISTORIAL},
+                                  self.cultivos)
+        self.derrame.cerrar()
+
+    def __repr__(self):
+        return (f"HistorialAnomalias({self._tamano}/{self.capacidad} anomalías, "
+                f"{self.descartadas} descartadas)")
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Instrumentación de Latencias por Etapa
+
+Registra el tiempo de cada etapa de la detección (escalado, búsqueda del
+detector más afín, decisión del umbral, clasificación, historial,
+adaptación) y del entrenamiento (ajuste, silhouette) en histogramas de
+cubetas fijas. Cada registro es un cálculo de índice y un incremento, sin
+guardar muestras individuales, así que la memoria no crece con el tiempo de
+operación y los percentiles p50/p95/p99 salen de los conteos acumulados.
+
+InstrumentacionInactiva ofrece la misma interfaz sin hacer nada: es el modo
+por defecto del sistema y su costo es una llamada vacía por etapa.
+
+Autor: Leonardo Mosquera
+"""
+
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# Cubetas geométricas de 1 µs a 1000 s, 8 por década (resolución ~33 %)
+LATENCIA_MINIMA_S = 1e-6
+LATENCIA_MAXIMA_S = 1e3
+CUBETAS_POR_DECADA = 8
+PERCENTILES = (50, 95, 99)
+
+
+class HistogramaLatencias:
+    """
+    Histograma de latencias con cubetas geométricas fijas.
+
+    Los percentiles se informan como el límite superior de la cubeta que los
+    contiene, es decir, con error relativo menor que el ancho de una cubeta.
+    """
+
+    def __init__(self):
+        decadas = math.log10(LATENCIA_MAXIMA_S / LATENCIA_MINIMA_S)
+        self.num_cubetas = int(round(decadas * CUBETAS_POR_DECADA)) + 2
+        self.limites = LATENCIA_MINIMA_S * 10.0 ** (np.arange(self.num_cubetas - 1) / CUBETAS_POR_DECADA)
+        self._log_minimo = math.log10(LATENCIA_MINIMA_S)
+        self.reiniciar()
+
+    def reiniciar(self):
+        """Descarta todos los registros."""
+        self.conteos = [0] * self.num_cubetas
+        self.conteo = 0
+        self.elementos = 0
+        self.total_s = 0.0
+        self.maximo_s = 0.0
+
+    def registrar(self, segundos, elementos=1):
+        """
+        Agrega una medición.
+
+        Args:
+            segundos (float): Duración de la etapa
+            elementos (int): Lecturas procesadas en la medición (para el rendimiento)
+        """
+        if segundos <= LATENCIA_MINIMA_S:
+            cubeta = 0
+        else:
+            cubeta = min(self.num_cubetas - 1,
+                         int((math.log10(segundos) - self._log_minimo) * CUBETAS_POR_DECADA) + 1)
+        self.conteos[cubeta] += 1
+        self.conteo += 1
+        self.elementos += elementos
+        self.total_s += segundos
+        if segundos > self.maximo_s:
+            self.maximo_s = segundos
+
+    def percentil(self, q):
+        """Límite superior (segundos) de la cubeta que contiene el percentil q."""
+        if self.conteo == 0:
+            return 0.0
+        acumulados = np.cumsum(self.conteos)
+        cubeta = int(np.searchsorted(acumulados, q / 100 * self.conteo, side='left'))
+        if cubeta >= len(self.limites):
+            return self.maximo_s
+        return min(float(self.limites[cubeta]), self.maximo_s)
+
+    def resumen(self):
+        """Conteos, percentiles en milisegundos y rendimiento de la etapa."""
+        resumen = {
+            'conteo': self.conteo,
+            'elementos': self.elementos,
+            'total_s': self.total_s,
+            'media_ms': self.total_s / self.conteo * 1e3 if self.conteo else 0.0,
+            'max_ms': self.maximo_s * 1e3,
+            'elementos_por_segundo': self.elementos / self.total_s if self.total_s > 0 else 0.0
+        }
+        for q in PERCENTILES:
+            resumen[f'p{q}_ms'] = self.percentil(q) * 1e3
+        return resumen
+
+
+class Instrumentacion:
+    """
+    Histogramas de latencia por etapa.
+
+    El histograma de cada etapa se crea una sola vez bajo un bloqueo, así que
+    dos hilos nunca se reemplazan el histograma de una etapa. Los incrementos
+    de un mismo histograma no se sincronizan: en detección concurrente un
+    incremento aislado puede perderse, lo que no afecta los percentiles de
+    forma apreciable.
+    """
+
+    activa = True
+
+    def __init__(self):
+        self.etapas = {}
+        self.inicio_ns = time.perf_counter_ns()
+        self._bloqueo = threading.Lock()
+
+    def marca(self):
+        """Instante de inicio de una etapa, para pasarlo a registrar()."""
+        return time.perf_counter_ns()
+
+    def registrar(self, etapa, desde_ns, elementos=1):
+        """
+        Registra la duración de una etapa iniciada en desde_ns.
+
+        Args:
+            etapa (str): Nombre de la etapa
+            desde_ns (int): Valor devuelto por marca() al iniciar la etapa
+            elementos (int): Lecturas procesadas en la etapa
+        """
+        self.registrar_duracion(etapa, time.perf_counter_ns() - desde_ns, elementos)
+
+    def registrar_duracion(self, etapa, duracion_ns, elementos=1):
+        """
+        Registra una duración ya medida, p. ej. la suma de varios tramos.
+
+        Args:
+            etapa (str): Nombre de la etapa
+            duracion_ns (int): Duración en nanosegundos
+            elementos (int): Lecturas procesadas en la etapa
+        """
+        histograma = self.etapas.get(etapa)
+        if histograma is None:
+            with self._bloqueo:
+                histograma = self.etapas.setdefault(etapa, HistogramaLatencias())
+        histograma.registrar(duracion_ns * 1e-9, elementos)
+
+    def _etapas_registradas(self):
+        with self._bloqueo:
+            return list(self.etapas.items())
+
+    @contextmanager
+    def medir(self, etapa, elementos=1):
+        """Contexto que registra la duración de su bloque como una etapa."""
+        desde = self.marca()
+        try:
+            yield
+        finally:
+            self.registrar(etapa, desde, elementos)
+
+    def instantanea(self):
+        """
+        Resumen de todas las etapas registradas.
+
+        Returns:
+            dict: Resumen de HistogramaLatencias por etapa
+        """
+        return {etapa: histograma.resumen() for etapa, histograma in self._etapas_registradas()}
+
+    def a_dataframe(self):
+        """Instantánea como DataFrame, una fila por etapa."""
+        return pd.DataFrame.from_dict(self.instantanea(), orient='index').rename_axis('etapa')
+
+    def exportar(self, ruta=None):
+        """
+        Exporta la instantánea en JSON, con los conteos crudos de cada cubeta.
+
+        Args:
+            ruta (str, optional): Archivo destino; si se omite solo se devuelve
+
+        Returns:
+            dict: Documento exportado
+        """
+        documento = {
+            'duracion_s': (time.perf_counter_ns() - self.inicio_ns) * 1e-9,
+            'limites_cubetas_s': HistogramaLatencias().limites.tolist(),
+            'etapas': {
+                etapa: {**histograma.resumen(), 'conteos_cubetas': list(histograma.conteos)}
+                for etapa, histograma in self._etapas_registradas()
+            }
+        }
+        if ruta is not None:
+            with open(ruta, 'w', encoding='utf-8') as archivo:
+                json.dump(documento, archivo, indent=2)
+        return documento
+
+    def reiniciar(self):
+        """Descarta los registros de todas las etapas."""
+        with self._bloqueo:
+            self.etapas = {}
+        self.inicio_ns = time.perf_counter_ns()
+
+
+class InstrumentacionInactiva:
+    """Misma interfaz que Instrumentacion sin registrar nada."""
+
+    activa = False
+    etapas = {}
+
+    def marca(self):
+        return 0
+
+    def registrar(self, etapa, desde_ns, elementos=1):
+        pass
+
+    def registrar_duracion(self, etapa, duracion_ns, elementos=1):
+        pass
+
+    @contextmanager
+    def medir(self, etapa, elementos=1):
+        yield
+
+    def instantanea(self):
+        return {}
+
+    def a_dataframe(self):
+        return pd.DataFrame()
+
+    def exportar(self, ruta=None):
+        return {}
+
+    def reiniciar(self):
+        pass
+
+
+INSTRUMENTACION_INACTIVA = InstrumentacionInactiva()
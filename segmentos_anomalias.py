@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Segmentos Columnares de Solo Anexado para el Historial de Anomalías
+
+Cuando el búfer circular de HistorialAnomalias se llena, los registros que
+salen de memoria se derraman a disco en lugar de perderse. EscritorSegmentos
+los recibe en bloques, los acumula en un hilo propio y escribe archivos de
+segmento inmutables particionados por tiempo:
+
+    directorio/AAAAMMDDTHH/segmento_<timestamp_min>_<secuencia>.seg
+
+Cada segmento guarda una columna contigua por campo, con el mismo esquema de
+contenedor del modelo: firma, versión, cabecera JSON y arreglos alineados a
+64 bytes. Se escribe a un archivo temporal y se publica con un rename
+atómico, así LectorSegmentos nunca ve segmentos a medio escribir ni necesita
+bloquear al escritor; los segmentos publicados se mapean en memoria para
+recorrer rangos de tiempo y cultivo.
+
+Autor: Leonardo Mosquera
+"""
+
+import atexit
+import json
+import os
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+FIRMA_SEGMENTO = b'SIASEGMT'
+VERSION_FORMATO_SEGMENTO = 1
+_PREFIJO_SEGMENTO = struct.Struct('<8sII')
+_ALINEACION_SEGMENTO = 64
+EXTENSION_SEGMENTO = '.seg'
+
+# Columnas del historial y su tipo en disco
+COLUMNAS_SEGMENTO = {
+    'timestamp': '<i8',
+    'distancia': '<f8',
+    'nivel_alerta': '<i1',
+    'celula_activada': '<i8',
+    'codigo_cultivo': '<i2',
+    'dato': '<f8'
+}
+
+_PERIODOS_PARTICION = {
+    'hora': (3600 * 10**9, '%Y%m%dT%H'),
+    'dia': (86400 * 10**9, '%Y%m%d')
+}
+
+_FIN_ESCRITURA = object()
+
+
+def escribir_segmento(ruta, columnas, cultivos):
+    """
+    Escribe un segmento columnar de forma atómica (temporal + rename).
+
+    Args:
+        ruta (str): Archivo final del segmento
+        columnas (dict): Arreglos de COLUMNAS_SEGMENTO con la misma longitud
+        cultivos (list): Tabla de códigos de cultivo vigente
+
+    Returns:
+        str: Ruta del segmento publicado
+    """
+    arreglos = {nombre: np.ascontiguousarray(columnas[nombre], dtype=tipo)
+                for nombre, tipo in COLUMNAS_SEGMENTO.items()}
+    cabecera = {
+        'version_formato': VERSION_FORMATO_SEGMENTO,
+        'registros': len(arreglos['timestamp']),
+        'timestamp_min': int(arreglos['timestamp'].min()),
+        'timestamp_max': int(arreglos['timestamp'].max()),
+        'cultivos': list(cultivos),
+        'columnas': {}
+    }
+
+    desplazamiento = 0
+    for nombre, valor in arreglos.items():
+        cabecera['columnas'][nombre] = {'desplazamiento': desplazamiento, 'forma': list(valor.shape),
+                                        'tipo': COLUMNAS_SEGMENTO[nombre]}
+        desplazamiento += -(-valor.nbytes // _ALINEACION_SEGMENTO) * _ALINEACION_SEGMENTO
+
+    cabecera_bytes = json.dumps(cabecera).encode('utf-8')
+    inicio_datos = -(-(_PREFIJO_SEGMENTO.size + len(cabecera_bytes)) // _ALINEACION_SEGMENTO) * _ALINEACION_SEGMENTO
+
+    temporal = ruta + '.tmp'
+    with open(temporal, 'wb') as archivo:
+        archivo.write(_PREFIJO_SEGMENTO.pack(FIRMA_SEGMENTO, VERSION_FORMATO_SEGMENTO, len(cabecera_bytes)))
+        archivo.write(cabecera_bytes)
+        for nombre, valor in arreglos.items():
+            archivo.seek(inicio_datos + cabecera['columnas'][nombre]['desplazamiento'])
+            archivo.write(valor.tobytes())
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    os.replace(temporal, ruta)
+    return ruta
+
+
+def leer_cabecera_segmento(ruta):
+    """
+    Lee la cabecera de un segmento sin tocar sus columnas.
+
+    Returns:
+        tuple: (cabecera, inicio_datos)
+    """
+    with open(ruta, 'rb') as archivo:
+        firma, version, longitud = _PREFIJO_SEGMENTO.unpack(archivo.read(_PREFIJO_SEGMENTO.size))
+        if firma != FIRMA_SEGMENTO:
+            raise ValueError(f"'{ruta}' no es un segmento del historial de anomalías.")
+        if version > VERSION_FORMATO_SEGMENTO:
+            raise ValueError(f"Versión de segmento {version} no soportada (máxima {VERSION_FORMATO_SEGMENTO}).")
+        cabecera = json.loads(archivo.read(longitud).decode('utf-8'))
+    inicio_datos = -(-(_PREFIJO_SEGMENTO.size + longitud) // _ALINEACION_SEGMENTO) * _ALINEACION_SEGMENTO
+    return cabecera, inicio_datos
+
+
+class EscritorSegmentos:
+    """
+    Escritor en segundo plano de segmentos de anomalías derramadas.
+
+    derramar_registro() copia un registro desalojado a un bloque preasignado
+    de tamano_bloque filas, que se entrega al hilo escritor al llenarse (o al
+    pasar intervalo_vaciado desde su primera fila); derramar() entrega un
+    bloque ya armado. El hilo escritor acumula bloques hasta
+    registros_por_segmento (o hasta intervalo_vaciado segundos sin llegar a
+    ese tamaño) y escribe un segmento por partición.
+
+    La cola admite capacidad_cola bloques: si el disco no da abasto, la
+    entrega espera en lugar de acumular memoria sin límite. Si una escritura
+    falla, el hilo sigue vaciando la cola (los registros se cuentan en
+    registros_perdidos) y el error se entrega a al_fallar o, sin él, se
+    lanza en la siguiente entrega y en cerrar(). Entregar después de
+    cerrar() también es un error. Los bloques pendientes se escriben al
+    salir del intérprete si no se llamó a cerrar().
+    """
+
+    def __init__(self, directorio, registros_por_segmento=65536, particion='hora', intervalo_vaciado=5.0,
+                 tamano_bloque=4096, capacidad_cola=64, al_fallar=None):
+        """
+        Prepara el directorio y arranca el hilo escritor.
+
+        Args:
+            directorio (str): Raíz de las particiones de segmentos
+            registros_por_segmento (int): Registros acumulados antes de escribir
+            particion (str): 'hora' o 'dia'
+            intervalo_vaciado (float): Segundos máximos que un bloque incompleto
+                espera antes de escribirse
+            tamano_bloque (int): Filas del bloque preasignado de derramar_registro()
+            capacidad_cola (int): Bloques pendientes de escribir antes de frenar
+                a quien derrama
+            al_fallar (callable, optional): Recibe el error de escritura desde el
+                hilo escritor; sin él, el error se lanza al derramar o cerrar
+        """
+        if particion not in _PERIODOS_PARTICION:
+            raise ValueError(f"Partición desconocida: {particion}. Opciones: {tuple(_PERIODOS_PARTICION)}")
+
+        self.directorio = directorio
+        self.registros_por_segmento = registros_por_segmento
+        self.particion = particion
+        self.intervalo_vaciado = intervalo_vaciado
+        self.tamano_bloque = tamano_bloque
+        self.al_fallar = al_fallar
+        self.registros_escritos = 0
+        self.segmentos_escritos = 0
+        self.registros_perdidos = 0
+        self._secuencia = 0
+        self._bloque = None
+        self._filas_bloque = 0
+        self._inicio_bloque = 0.0
+        self._cultivos = []
+        self._cola = queue.Queue(maxsize=capacidad_cola)
+        self._error = None
+        self._cerrado = False
+        os.makedirs(directorio, exist_ok=True)
+
+        self._hilo = threading.Thread(target=self._escribir, name='escritor_segmentos', daemon=True)
+        self._hilo.start()
+        atexit.register(self.cerrar)
+
+    @property
+    def cerrado(self):
+        """cerrar() ya se llamó y no se aceptan más registros."""
+        return self._cerrado
+
+    def _verificar(self):
+        if self._cerrado:
+            raise RuntimeError("El escritor de segmentos está cerrado; los registros no se persistirían.")
+        if self._error is not None and self.al_fallar is None:
+            raise RuntimeError(f"El escritor de segmentos falló; {self.registros_perdidos} registros "
+                               f"no se persistieron") from self._error
+
+    def derramar(self, columnas, cultivos):
+        """
+        Encola un bloque de registros para escribirlos en disco.
+
+        Args:
+            columnas (dict): Arreglos de COLUMNAS_SEGMENTO (el escritor toma posesión)
+            cultivos (list): Tabla de códigos de cultivo vigente
+        """
+        self._verificar()
+        self._entregar_bloque()
+        self._cola.put((columnas, list(cultivos)))
+
+    def derramar_registro(self, timestamp, dato, distancia, nivel_alerta, celula_activada, codigo_cultivo,
+                          cultivos):
+        """
+        Copia un registro al bloque preasignado, sin arreglos temporales.
+
+        Args:
+            timestamp (int): Timestamp en nanosegundos
+            dato (array): Lectura original
+            distancia (float): Distancia al detector más afín
+            nivel_alerta (int): Nivel de alerta
+            celula_activada (int): Célula activada
+            codigo_cultivo (int): Código del tipo de cultivo
+            cultivos (list): Tabla de códigos de cultivo vigente
+        """
+        self._verificar()
+        bloque = self._bloque
+        if bloque is None:
+            bloque = self._bloque = {nombre: np.empty((self.tamano_bloque, np.size(dato)) if nombre == 'dato'
+                                                      else self.tamano_bloque, dtype=tipo)
+                                     for nombre, tipo in COLUMNAS_SEGMENTO.items()}
+            self._inicio_bloque = time.monotonic()
+        fila = self._filas_bloque
+        bloque['timestamp'][fila] = timestamp
+        bloque['dato'][fila] = dato
+        bloque['distancia'][fila] = distancia
+        bloque['nivel_alerta'][fila] = nivel_alerta
+        bloque['celula_activada'][fila] = celula_activada
+        bloque['codigo_cultivo'][fila] = codigo_cultivo
+        self._filas_bloque = fila + 1
+        self._cultivos = cultivos
+        if (self._filas_bloque == self.tamano_bloque
+                or time.monotonic() - self._inicio_bloque >= self.intervalo_vaciado):
+            self._entregar_bloque()
+
+    def _entregar_bloque(self):
+        """Entrega al hilo escritor las filas del bloque preasignado, si hay."""
+        if not self._filas_bloque:
+            return
+        columnas = {nombre: valor[:self._filas_bloque] for nombre, valor in self._bloque.items()}
+        self._bloque, self._filas_bloque = None, 0
+        self._cola.put((columnas, list(self._cultivos)))
+
+    def _escribir(self):
+        pendientes = []
+        cultivos = []
+        acumulados = 0
+        while True:
+            try:
+                elemento = self._cola.get(timeout=self.intervalo_vaciado if pendientes else None)
+            except queue.Empty:
+                elemento = None
+
+            if elemento is not None and elemento is not _FIN_ESCRITURA:
+                columnas, cultivos = elemento
+                if self._error is not None:
+                    # Tras un fallo se sigue vaciando la cola para no frenar a quien derrama
+                    self.registros_perdidos += len(columnas['timestamp'])
+                    continue
+                pendientes.append(columnas)
+                acumulados += len(columnas['timestamp'])
+                if acumulados < self.registros_por_segmento:
+                    continue
+
+            if pendientes:
+                try:
+                    self._escribir_bloque(pendientes, cultivos)
+                except Exception as error:
+                    self._error = error
+                    self.registros_perdidos += acumulados
+                    if self.al_fallar is not None:
+                        self.al_fallar(error)
+                pendientes, acumulados = [], 0
+
+            if elemento is _FIN_ESCRITURA:
+                return
+
+    def _escribir_bloque(self, bloques, cultivos):
+        """Concatena los bloques pendientes y escribe un segmento por partición."""
+        columnas = {nombre: np.concatenate([bloque[nombre] for bloque in bloques])
+                    for nombre in COLUMNAS_SEGMENTO}
+        periodo, formato = _PERIODOS_PARTICION[self.particion]
+        claves = columnas['timestamp'] // periodo
+
+        for clave in np.unique(claves):
+            mascara = claves == clave
+            particion = pd.Timestamp(int(clave) * periodo).strftime(formato)
+            os.makedirs(os.path.join(self.directorio, particion), exist_ok=True)
+            parte = {nombre: valor[mascara] for nombre, valor in columnas.items()}
+            nombre = f"segmento_{int(parte['timestamp'].min()):020d}_{self._secuencia:08d}{EXTENSION_SEGMENTO}"
+            escribir_segmento(os.path.join(self.directorio, particion, nombre), parte, cultivos)
+            self._secuencia += 1
+            self.segmentos_escritos += 1
+            self.registros_escritos += int(mascara.sum())
+
+    def cerrar(self):
+        """Escribe los bloques pendientes y detiene el hilo escritor."""
+        if not self._cerrado:
+            self._entregar_bloque()
+            self._cerrado = True
+            atexit.unregister(self.cerrar)
+            if self._hilo.is_alive():
+                self._cola.put(_FIN_ESCRITURA)
+                self._hilo.join()
+        if self._error is not None and self.al_fallar is None:
+            raise RuntimeError(f"El escritor de segmentos falló; {self.registros_perdidos} registros "
+                               f"no se persistieron") from self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+class LectorSegmentos:
+    """
+    Lectura de segmentos publicados mapeados en memoria.
+
+    Cada consulta lista los segmentos presentes en ese momento; los archivos
+    temporales del escritor se ignoran, así la lectura nunca lo bloquea.
+    """
+
+    def __init__(self, directorio, dimensiones=None):
+        """
+        Args:
+            directorio (str): Raíz de las particiones de segmentos
+            dimensiones (int, optional): Variables de cada lectura, para la
+                forma de 'dato' en consultas sin registros cuando aún no hay
+                ningún segmento publicado
+        """
+        self.directorio = directorio
+        self.dimensiones = dimensiones
+
+    def segmentos(self, desde=None, hasta=None):
+        """
+        Segmentos publicados cuyo rango de tiempo se cruza con [desde, hasta].
+
+        Args:
+            desde (pd.Timestamp | int, optional): Inicio del rango (ns si es int)
+            hasta (pd.Timestamp | int, optional): Fin del rango (ns si es int)
+
+        Returns:
+            list: Tuplas (ruta, cabecera, inicio_datos) en orden cronológico
+        """
+        desde = None if desde is None else pd.Timestamp(desde).value
+        hasta = None if hasta is None else pd.Timestamp(hasta).value
+        encontrados = []
+        if not os.path.isdir(self.directorio):
+            return encontrados
+
+        for particion in sorted(os.listdir(self.directorio)):
+            carpeta = os.path.join(self.directorio, particion)
+            if not os.path.isdir(carpeta):
+                continue
+            for nombre in sorted(os.listdir(carpeta)):
+                if not nombre.endswith(EXTENSION_SEGMENTO):
+                    continue
+                ruta = os.path.join(carpeta, nombre)
+                cabecera, inicio_datos = leer_cabecera_segmento(ruta)
+                if desde is not None and cabecera['timestamp_max'] < desde:
+                    continue
+                if hasta is not None and cabecera['timestamp_min'] > hasta:
+                    continue
+                encontrados.append((ruta, cabecera, inicio_datos))
+
+        encontrados.sort(key=lambda segmento: (segmento[1]['timestamp_min'], segmento[0]))
+        return encontrados
+
+    @staticmethod
+    def mapear_columna(ruta, cabecera, inicio_datos, nombre):
+        """Mapea en memoria (solo lectura) una columna de un segmento."""
+        info = cabecera['columnas'][nombre]
+        if info['forma'][0] == 0:
+            return np.empty(info['forma'], dtype=info['tipo'])
+        return np.memmap(ruta, dtype=info['tipo'], mode='r', offset=inicio_datos + info['desplazamiento'],
+                         shape=tuple(info['forma']))
+
+    def consultar(self, desde=None, hasta=None, tipo_cultivo=None):
+        """
+        Recorre los segmentos y devuelve los registros del rango pedido.
+
+        Args:
+            desde (pd.Timestamp | int, optional): Inicio del rango, inclusivo
+            hasta (pd.Timestamp | int, optional): Fin del rango, inclusivo
+            tipo_cultivo (str, optional): Filtrar por cultivo
+
+        Returns:
+            dict: Columnas concatenadas en orden cronológico (con la columna
+            tipo_cultivo ya decodificada)
+        """
+        desde_ns = None if desde is None else pd.Timestamp(desde).value
+        hasta_ns = None if hasta is None else pd.Timestamp(hasta).value
+        partes = {nombre: [] for nombre in COLUMNAS_SEGMENTO}
+        partes['tipo_cultivo'] = []
+
+        for ruta, cabecera, inicio_datos in self.segmentos(desde, hasta):
+            timestamps = self.mapear_columna(ruta, cabecera, inicio_datos, 'timestamp')
+            mascara = np.ones(len(timestamps), dtype=bool)
+            if desde_ns is not None:
+                mascara &= timestamps >= desde_ns
+            if hasta_ns is not None:
+                mascara &= timestamps <= hasta_ns
+            codigos = self.mapear_columna(ruta, cabecera, inicio_datos, 'codigo_cultivo')
+            if tipo_cultivo is not None:
+                if tipo_cultivo not in cabecera['cultivos']:
+                    continue
+                mascara &= codigos == cabecera['cultivos'].index(tipo_cultivo)
+            if not mascara.any():
+                continue
+
+            for nombre in COLUMNAS_SEGMENTO:
+                partes[nombre].append(np.asarray(self.mapear_columna(ruta, cabecera, inicio_datos, nombre)[mascara]))
+            partes['tipo_cultivo'].append(np.asarray(cabecera['cultivos'], dtype=object)[codigos[mascara]])
+
+        if not partes['timestamp']:
+            vacias = {nombre: np.empty(0, dtype=tipo) for nombre, tipo in COLUMNAS_SEGMENTO.items()}
+            vacias['dato'] = np.empty((0, self._dimensiones_dato()), dtype=COLUMNAS_SEGMENTO['dato'])
+            vacias['tipo_cultivo'] = np.empty(0, dtype=object)
+            return vacias
+        return {nombre: np.concatenate(valores) for nombre, valores in partes.items()}
+
+    def _dimensiones_dato(self):
+        """Variables por lectura según el primer segmento publicado, o las indicadas."""
+        for _, cabecera, _ in self.segmentos():
+            return cabecera['columnas']['dato']['forma'][1]
+        return self.dimensiones or 0
+
+    def a_dataframe(self, desde=None, hasta=None, tipo_cultivo=None):
+        """DataFrame de los registros consultados, con las columnas del historial."""
+        columnas = self.consultar(desde, hasta, tipo_cultivo)
+        return pd.DataFrame({
+            'timestamp': pd.to_datetime(columnas['timestamp']),
+            'dato': list(columnas['dato']),
+            'distancia': columnas['distancia'],
+            'nivel_alerta': columnas['nivel_alerta'].astype(int),
+            'celula_activada': columnas['celula_activada'],
+            'tipo_cultivo': columnas['tipo_cultivo']
+        })
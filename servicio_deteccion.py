@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Servicio asyncio de Ingesta y Detección para el Sistema Inmunológico Artificial
+
+Expone el detector como un servicio de larga duración que recibe lecturas de
+sensores por un socket local (TCP o Unix) y publica las alertas en una cola
+de salida. Cada mensaje puede llegar como una línea JSON o como una trama
+binaria compacta:
+
+    JSON:    {"sensor_id": 7, "tipo_cultivo": "maiz", "lectura": [55, 24, 6, 80]}\n
+    Binaria: 0xB1 | sensor_id (uint32) | código de cultivo (uint8) | 4 x float64
+
+La detección corre en un ejecutor de un solo hilo para no bloquear el event
+loop y conservar el orden de adaptación del umbral. Cuando la detección se
+atrasa, la cola de entrada acotada se llena, los lectores dejan de leer del
+socket y el control de flujo de TCP frena a los sensores (backpressure).
+
+Para medir el rendimiento sin servicios externos, BrokerLocal reemplaza al
+broker de mensajería real y medir_rendimiento() levanta servicio, cliente y
+consumidor de alertas en el mismo proceso.
+
+Uso:
+    python servicio_deteccion.py
+
+Autor: Leonardo Mosquera
+"""
+
+import asyncio
+import json
+import math
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from flujo_deteccion import FlujoDeteccion
+
+MARCA_TRAMA_BINARIA = 0xB1
+FORMATO_TRAMA = struct.Struct('<IB4d')
+CULTIVOS_TRAMA = ('general', 'maiz', 'soya', 'trigo')
+VARIABLES_LECTURA = 4
+
+
+def codificar_trama(sensor_id, tipo_cultivo, lectura):
+    """Codifica una lectura como trama binaria del protocolo del servicio."""
+    return bytes([MARCA_TRAMA_BINARIA]) + FORMATO_TRAMA.pack(
+        sensor_id, CULTIVOS_TRAMA.index(tipo_cultivo), *lectura
+    )
+
+
+def codificar_json(sensor_id, tipo_cultivo, lectura):
+    """Codifica una lectura como línea JSON del protocolo del servicio."""
+    return (json.dumps({'sensor_id': sensor_id, 'tipo_cultivo': tipo_cultivo,
+                        'lectura': list(map(float, lectura))}) + '\n').encode()
+
+
+class BrokerLocal:
+    """
+    Sustituto en memoria de un broker de mensajería para las alertas.
+
+    Publicar espera cuando la cola está llena, así un consumidor lento
+    también propaga backpressure hacia la detección.
+    """
+
+    def __init__(self, capacidad=10000):
+        self.cola = asyncio.Queue(maxsize=capacidad)
+        self.publicadas = 0
+
+    async def publicar(self, mensaje):
+        await self.cola.put(mensaje)
+        self.publicadas += 1
+
+    async def consumir(self):
+        return await self.cola.get()
+
+
+class ServicioDeteccion:
+    """
+    Servicio de ingesta asíncrona que envuelve un SistemaInmunologicoArtificial.
+    """
+
+    def __init__(self, sistema, broker=None, capacidad_cola=10000, tamano_lote=256, espera_maxima=0.01,
+                 cambios_solamente=False, latido_s=300.0):
+        """
+        Configura el servicio.
+
+        Args:
+            sistema (SistemaInmunologicoArtificial): Sistema ya entrenado
+            broker (BrokerLocal, optional): Destino de las alertas
+            capacidad_cola (int): Lecturas en espera antes de aplicar backpressure
+            tamano_lote (int): Máximo de lecturas por micro-lote de detección
+            espera_maxima (float): Segundos máximos de espera de un micro-lote
+            cambios_solamente (bool): No reevaluar ni volver a publicar las
+                lecturas que repiten la última de su sensor (ver EstadoSensores)
+            latido_s (float): Segundos tras los cuales una lectura repetida se
+                vuelve a evaluar
+        """
+        self.sistema = sistema
+        self.broker = broker or BrokerLocal()
+        self.capacidad_cola = capacidad_cola
+        self.flujo = FlujoDeteccion(sistema, tamano_lote=tamano_lote, espera_maxima=espera_maxima,
+                                    cambios_solamente=cambios_solamente, latido_s=latido_s)
+        self.lecturas_recibidas = 0
+        self.mensajes_invalidos = 0
+        self.lotes_fallidos = 0
+        self.lecturas_descartadas = 0
+        self.ultimo_error = None
+        self.direccion = None
+        self._servidor = None
+        self._cola = None
+        self._trabajador = None
+        self._conexiones = {}
+        self._ejecutor = None
+
+    async def iniciar(self, host='127.0.0.1', puerto=0, ruta_unix=None):
+        """
+        Abre el socket de ingesta y arranca el trabajador de detección.
+
+        Args:
+            host (str): Interfaz TCP de escucha
+            puerto (int): Puerto TCP (0 elige uno libre)
+            ruta_unix (str, optional): Si se indica, escucha en un socket Unix
+
+        Returns:
+            ServicioDeteccion: self, con la dirección efectiva en self.direccion
+        """
+        self._cola = asyncio.Queue(maxsize=self.capacidad_cola)
+        self._ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='deteccion')
+        self._trabajador = asyncio.create_task(self._detectar())
+
+        if ruta_unix:
+            self._servidor = await asyncio.start_unix_server(self._atender_conexion, path=ruta_unix)
+            self.direccion = ruta_unix
+        else:
+            self._servidor = await asyncio.start_server(self._atender_conexion, host, puerto)
+            self.direccion = self._servidor.sockets[0].getsockname()[:2]
+
+        return self
+
+    async def detener(self, inactividad_maxima=0.5):
+        """
+        Deja de aceptar conexiones, procesa lo pendiente y libera el ejecutor.
+
+        Las conexiones que siguen enviando o esperan lugar en la cola se
+        atienden hasta que el cliente cierra; las que pasan inactividad_maxima
+        segundos sin entregar datos se cierran. Así detener() no queda colgado
+        por un cliente conectado y ocioso (desde Python 3.12 wait_closed()
+        espera a todos los clientes).
+
+        Args:
+            inactividad_maxima (float): Segundos sin datos tras los cuales se
+                cierra una conexión abierta
+        """
+        loop = asyncio.get_running_loop()
+        self._servidor.close()
+        while self._conexiones:
+            ahora = loop.time()
+            for escritor, inactiva_desde in list(self._conexiones.values()):
+                if inactiva_desde is not None and ahora - inactiva_desde >= inactividad_maxima:
+                    escritor.close()
+            await asyncio.wait(list(self._conexiones), timeout=inactividad_maxima / 4)
+        await self._servidor.wait_closed()
+
+        await self._cola.put(None)
+        await self._trabajador
+        self._ejecutor.shutdown(wait=True)
+
+    async def _atender_conexion(self, lector, escritor):
+        """Lee mensajes de una conexión y los encola respetando la capacidad."""
+        tarea = asyncio.current_task()
+        loop = asyncio.get_running_loop()
+        # (escritor, instante desde el que espera datos del socket o None)
+        self._conexiones[tarea] = (escritor, loop.time())
+        try:
+            while True:
+                try:
+                    inicio = await lector.readexactly(1)
+                except asyncio.IncompleteReadError:
+                    break
+
+                try:
+                    if inicio[0] == MARCA_TRAMA_BINARIA:
+                        carga = await lector.readexactly(FORMATO_TRAMA.size)
+                        sensor_id, codigo, *lectura = FORMATO_TRAMA.unpack(carga)
+                        mensaje = (sensor_id, CULTIVOS_TRAMA[codigo], lectura)
+                    else:
+                        linea = inicio + await lector.readline()
+                        if not linea.strip():
+                            continue
+                        datos = json.loads(linea)
+                        mensaje = (datos['sensor_id'], datos.get('tipo_cultivo', 'general'),
+                                   [float(v) for v in datos['lectura']])
+                    # Una lectura mal formada haría fallar el lote completo en la detección
+                    if len(mensaje[2]) != VARIABLES_LECTURA or not all(map(math.isfinite, mensaje[2])):
+                        raise ValueError("Lectura con dimensión incorrecta o valores no finitos")
+                except asyncio.IncompleteReadError:
+                    break
+                except (ValueError, KeyError, IndexError, TypeError):
+                    self.mensajes_invalidos += 1
+                    continue
+
+                # Bloquea la lectura del socket mientras la cola esté llena
+                self._conexiones[tarea] = (escritor, None)
+                await self._cola.put(mensaje)
+                self._conexiones[tarea] = (escritor, loop.time())
+                self.lecturas_recibidas += 1
+        finally:
+            escritor.close()
+            self._conexiones.pop(tarea, None)
+
+    async def _lecturas_encoladas(self):
+        while True:
+            mensaje = await self._cola.get()
+            if mensaje is None:
+                return
+            yield mensaje
+
+    def _lote_fallido(self, error, lecturas):
+        """Registra un micro-lote descartado por un error de detección."""
+        self.lotes_fallidos += 1
+        self.lecturas_descartadas += len(lecturas)
+        self.ultimo_error = error
+        print(f"⚠️ Lote de {len(lecturas)} lecturas descartado: {type(error).__name__}: {error}")
+
+    async def _detectar(self):
+        """
+        Evalúa las lecturas en micro-lotes y publica las alertas.
+
+        Un lote que falla se descarta y se cuenta en lotes_fallidos; el
+        trabajador sigue atendiendo la cola para que las conexiones no queden
+        bloqueadas por la cola llena.
+        """
+        async for resultado in self.flujo.procesar_async(self._lecturas_encoladas(), ejecutor=self._ejecutor,
+                                                         al_fallar=self._lote_fallido):
+            if resultado.es_anomalia and not resultado.repetida:
+                await self.broker.publicar({
+                    'sensor_id': resultado.sensor_id,
+                    'tipo_cultivo': resultado.tipo_cultivo,
+                    'lectura': [float(v) for v in resultado.lectura],
+                    'distancia': resultado.distancia,
+                    'nivel_alerta': resultado.nivel_alerta,
+                    'celula_activada': resultado.celula_activada
+                })
+
+
+async def medir_rendimiento(sistema, num_lecturas=50000, formato='binario', fraccion_anomalas=0.01,
+                            num_clientes=4, ruta_unix=None, semilla=42, **opciones_servicio):
+    """
+    Mide lecturas por segundo sostenidas con clientes y broker locales.
+
+    Args:
+        sistema (SistemaInmunologicoArtificial): Sistema ya entrenado
+        num_lecturas (int): Total de lecturas enviadas entre todos los clientes
+        formato (str): 'binario' o 'json'
+        fraccion_anomalas (float): Fracción de lecturas anómalas generadas
+        num_clientes (int): Conexiones concurrentes de sensores simulados
+        ruta_unix (str, optional): Usar un socket Unix en lugar de TCP
+        semilla (int): Semilla aleatoria
+        **opciones_servicio: Parámetros adicionales de ServicioDeteccion
+
+    Returns:
+        dict: Lecturas procesadas, alertas y rendimiento sostenido
+    """
+    rng = np.random.default_rng(semilla)
+    media, escala = sistema.scaler.mean_, sistema.scaler.scale_
+    lecturas = media + rng.normal(scale=0.3, size=(num_lecturas, len(media))) * escala
+    anomalas = rng.random(num_lecturas) < fraccion_anomalas
+    lecturas[anomalas] += 4 * escala
+    codificar = codificar_trama if formato == 'binario' else codificar_json
+
+    servicio = ServicioDeteccion(sistema, **opciones_servicio)
+    await servicio.iniciar(ruta_unix=ruta_unix)
+
+    alertas = []
+
+    async def _consumir_alertas():
+        while True:
+            alertas.append(await servicio.broker.consumir())
+
+    async def _cliente(indices):
+        if ruta_unix:
+            _, escritor = await asyncio.open_unix_connection(ruta_unix)
+        else:
+            _, escritor = await asyncio.open_connection(*servicio.direccion)
+        for inicio in range(0, len(indices), 512):
+            escritor.write(b''.join(codificar(int(i), 'general', lecturas[i])
+                                    for i in indices[inicio:inicio + 512]))
+            await escritor.drain()
+        escritor.close()
+        await escritor.wait_closed()
+
+    consumidor = asyncio.create_task(_consumir_alertas())
+    inicio = time.perf_counter()
+    await asyncio.gather(*(_cliente(parte) for parte in np.array_split(np.arange(num_lecturas), num_clientes)))
+    await servicio.detener()
+    duracion = time.perf_counter() - inicio
+    while not servicio.broker.cola.empty():
+        await asyncio.sleep(0)
+    consumidor.cancel()
+
+    return {
+        **servicio.flujo.estadisticas(),
+        'lecturas_enviadas': num_lecturas,
+        'lecturas_procesadas': servicio.flujo.lecturas_procesadas,
+        'alertas_publicadas': servicio.broker.publicadas,
+        'alertas_consumidas': len(alertas),
+        'mensajes_invalidos': servicio.mensajes_invalidos,
+        'lotes_fallidos': servicio.lotes_fallidos,
+        'duracion_s': duracion,
+        'lecturas_por_segundo': servicio.flujo.lecturas_procesadas / duracion
+    }
+
+
+if __name__ == "__main__":
+    from sistema_bioinspirado_cultivos import SistemaInmunologicoArtificial, simular_datos_cultivo_realistas
+
+    datos_normales, _, _ = simular_datos_cultivo_realistas()
+    sistema = SistemaInmunologicoArtificial(num_celulas_memoria=40, radio_afinidad=0.6)
+    sistema.entrenar_fase_self_nonself(datos_normales)
+
+    print("\n📡 SERVICIO DE INGESTA: RENDIMIENTO SOSTENIDO CON BROKER LOCAL")
+    print("-" * 50)
+    for formato in ('binario', 'json'):
+        resultado = asyncio.run(medir_rendimiento(sistema, formato=formato))
+        print(f"   • Formato {formato}: {resultado['lecturas_por_segundo']:,.0f} lecturas/s "
+              f"({resultado['alertas_publicadas']} alertas, lote promedio "
+              f"{resultado['tamano_lote_promedio']:.0f})")
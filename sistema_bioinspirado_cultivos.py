@@ -26,9 +26,20 @@ import seaborn as sns
 from sklearn.preprocessing import StandardScaler
 from sklearn.cluster import KMeans
 from sklearn.metrics import silhouette_score, accuracy_score
-from scipy.spatial.distance import euclidean
+from scipy.spatial import cKDTree
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+from busqueda_detectores import crear_indice, calcular_distancias_minimas
+from algoritmos_inmunes import (generar_detectores_v, calcular_margen_cobertura, refinar_clonal,
+                                suprimir_red_inmune)
+from historial_anomalias import HistorialAnomalias
+from segmentos_anomalias import EscritorSegmentos
+from tabla_cuantizada import TablaCuantizada
+from instrumentacion import Instrumentacion, INSTRUMENTACION_INACTIVA
+import json
+import struct
+import threading
+import time
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -36,6 +47,212 @@ warnings.filterwarnings('ignore')
 plt.style.use('seaborn-v0_8')
 sns.set_palette("husl")
 
+# Límites superiores (inclusivos) de los niveles de alerta Normal, Bajo, Medio y
+# Alto; cualquier distancia mayor al último límite es Crítica.
+LIMITES_NIVEL_ALERTA = np.array([0.3, 0.6, 0.9, 1.2])
+
+# Umbral dinámico de activación: valor inicial y rango permitido
+UMBRAL_ACTIVACION_INICIAL = 0.7
+UMBRAL_MINIMO, UMBRAL_MAXIMO = 0.3, 1.2
+
+# Cuantil de las distancias al vecino más cercano entre células que
+# suprimir_red_inmune() toma como radio de supresión por defecto
+CUANTIL_RADIO_SUPRESION = 0.25
+
+MODOS_EVALUACION_CALIDAD = ('completa', 'muestra', 'segundo_plano', 'desactivada')
+
+# 'memoria': distancia a las células de memoria contra el umbral dinámico.
+# 'seleccion_negativa': anomalía si la reconoce un detector "non-self".
+MODOS_DETECCION = ('memoria', 'seleccion_negativa')
+
+# Tablas compartidas de la clasificación agronómica. El código de tipo de una
+# anomalía es su posición en TIPOS_ANOMALIA y también el índice de su
+# recomendación en RECOMENDACIONES_ANOMALIA.
+TIPOS_ANOMALIA = ('estres_hidrico', 'deficiencia_nutricional', 'estres_termico',
+                  'posible_plaga', 'anomalia_compleja')
+SEVERIDADES_ANOMALIA = ('media', 'alta', 'crítica', 'desconocida')
+RECOMENDACIONES_ANOMALIA = (
+    {
+        'accion_inmediata': "Activar sistema de riego de emergencia",
+        'accion_preventiva': "Instalar sensores adicionales de humedad",
+        'impacto_economico': "Pérdida estimada: 15-25% del rendimiento",
+        'tiempo_respuesta': "< 2 horas"
+    },
+    {
+        'accion_inmediata': "Aplicar fertilizante NPK balanceado",
+        'accion_preventiva': "Análisis de suelo mensual",
+        'impacto_economico': "Pérdida estimada: 10-20% del rendimiento",
+        'tiempo_respuesta': "< 24 horas"
+    },
+    {
+        'accion_inmediata': "Activar sistema de control climático",
+        'accion_preventiva': "Revisar sistema de ventilación",
+        'impacto_economico': "Pérdida estimada: 20-40% del rendimiento",
+        'tiempo_respuesta': "< 1 hora"
+    },
+    {
+        'accion_inmediata': "Inspección visual urgente - Aplicar control biológico",
+        'accion_preventiva': "Implementar trampas de monitoreo",
+        'impacto_economico': "Pérdida estimada: 25-50% del rendimiento",
+        'tiempo_respuesta': "< 3 horas"
+    },
+    {
+        'accion_inmediata': "Revisión manual por especialista",
+        'accion_preventiva': "Recolectar más datos para análisis",
+        'impacto_economico': "Por determinar",
+        'tiempo_respuesta': "< 12 horas"
+    }
+)
+
+# Resolución de los sensores de campo: humedad y crecimiento en porcentajes
+# enteros, temperatura a 0.1 °C y nutrientes a 0.1
+PASOS_CUANTIZACION = (1.0, 0.1, 0.1, 1.0)
+
+# Las distancias de la tabla cuantizada son float16: las que quedan a menos de
+# esta fracción de un límite de nivel, de un corte de ajustar_umbral() o del
+# umbral vigente se recalculan exactas
+_HOLGURA_TABLA = 2.0 ** -8
+_CORTES_ADAPTACION = np.array([0.8, 1.5])
+
+# Contenedor binario del modelo: firma, versión, longitud de la cabecera JSON,
+# cabecera y arreglos float64 alineados a 64 bytes para mapearlos en memoria.
+FIRMA_MODELO = b'SIAMODEL'
+VERSION_FORMATO_MODELO = 1
+_PREFIJO_MODELO = struct.Struct('<8sII')
+_ALINEACION_MODELO = 64
+
+
+# Origen del reloj de eventos: la hora local de pared al importar el módulo
+# (época más el desfase UTC local), a partir de la cual se avanza con el reloj
+# monotónico. pd.Timestamp(ns) la muestra como hora local sin zona, igual que
+# pd.Timestamp.now(), así los conteos por día y por hora caen en la fecha local
+_ORIGEN_RELOJ_NS = time.time_ns() + time.localtime().tm_gmtoff * 10**9 - time.monotonic_ns()
+
+
+def reloj_ns():
+    """
+    Reloj por defecto de los eventos: hora local en nanosegundos (int).
+    
+    Avanza con el reloj monotónico del proceso, así los instantes del
+    historial nunca retroceden aunque se ajuste la hora del sistema. El
+    desfase horario se fija al importar el módulo: un cambio de horario de
+    verano se refleja al reiniciar el proceso.
+    """
+    return _ORIGEN_RELOJ_NS + time.monotonic_ns()
+
+
+class RelojVirtual:
+    """
+    Reloj manual para pruebas y reproducciones de registros históricos.
+    
+    Cada consulta devuelve el instante actual y luego avanza paso_ns.
+    """
+    
+    def __init__(self, inicio_ns=0, paso_ns=0):
+        self.ahora_ns = int(inicio_ns)
+        self.paso_ns = int(paso_ns)
+    
+    def __call__(self):
+        instante = self.ahora_ns
+        self.ahora_ns += self.paso_ns
+        return instante
+    
+    def avanzar(self, ns):
+        """Adelanta el reloj ns nanosegundos."""
+        self.ahora_ns += int(ns)
+
+
+def calcular_niveles_alerta(distancias):
+    """Convierte distancias en niveles de alerta (0-4: Normal a Crítico)"""
+    return np.searchsorted(LIMITES_NIVEL_ALERTA, distancias, side='left')
+
+
+def clasificar_reglas(X):
+    """
+    Reglas expertas de clasificación agronómica, sin estado.
+    
+    Args:
+        X (array): Lecturas de forma (N, 4) [humedad, temp, nutrientes, crecimiento]
+        
+    Returns:
+        tuple: (codigos_tipo, codigos_severidad) que indexan TIPOS_ANOMALIA y
+        SEVERIDADES_ANOMALIA
+    """
+    humedad, temperatura, nutrientes, crecimiento = np.asarray(X, dtype=float).reshape(-1, 4).T
+    
+    # Reglas expertas basadas en conocimiento agronómico, en orden de prioridad
+    tipos = np.select(
+        [(humedad < 35) & (temperatura > 30),
+         (nutrientes < 3) & (crecimiento < 50),
+         (temperatura < 10) | (temperatura > 40),
+         (crecimiento < 30) & (humedad > 30) & (nutrientes > 5)],
+        [0, 1, 2, 3],
+        default=4
+    )
+    media, alta, critica, desconocida = range(len(SEVERIDADES_ANOMALIA))
+    severidades = np.select(
+        [tipos == 0, tipos == 1, tipos == 2, tipos == 3],
+        [np.where(humedad < 25, alta, media),
+         np.where(nutrientes < 1.5, alta, media),
+         np.where((temperatura < 5) | (temperatura > 45), critica, alta),
+         alta],
+        default=desconocida
+    )
+    return tipos, severidades
+
+
+def ajustar_umbral(umbral, distancia):
+    """
+    Nuevo umbral de activación tras una anomalía de la distancia indicada.
+    
+    Regla de adaptación de _adaptacion_inmunologica(), expuesta como función
+    pura para que los procesos de detección fragmentada la apliquen sin
+    necesitar una instancia del sistema.
+    """
+    # Ajuste dinámico del umbral basado en feedback
+    if distancia > 1.5:  # Anomalía muy severa
+        umbral *= 0.95  # Hacerse más sensible
+    elif distancia < 0.8:  # Falso positivo potencial
+        umbral *= 1.02  # Reducir sensibilidad
+        
+    # Limitar el rango del umbral
+    return np.clip(umbral, UMBRAL_MINIMO, UMBRAL_MAXIMO)
+
+
+def _umbrales_por_lectura(distancias, es_anomalia, umbral):
+    """Umbral vigente al evaluar cada lectura en aplicar_umbral_secuencial()."""
+    anomalias = np.flatnonzero(es_anomalia)
+    umbrales = [umbral]
+    for i in anomalias:
+        umbrales.append(ajustar_umbral(umbrales[-1], distancias[i]))
+    return np.asarray(umbrales)[np.searchsorted(anomalias, np.arange(len(distancias)))]
+
+
+def aplicar_umbral_secuencial(distancias, umbral):
+    """
+    Evalúa el umbral dinámico sobre un lote respetando el orden de llegada.
+    
+    Solo las lecturas que podrían superar algún umbral alcanzable se
+    recorren una a una; el resto se descarta en bloque.
+    
+    Args:
+        distancias (array): Distancias mínimas en orden de llegada
+        umbral (float): Umbral de activación antes del lote
+        
+    Returns:
+        tuple: (es_anomalia, umbral_final)
+    """
+    es_anomalia = np.zeros(len(distancias), dtype=bool)
+    corte = min(umbral, UMBRAL_MINIMO)
+    
+    for i in np.flatnonzero(distancias > corte):
+        if distancias[i] > umbral:
+            es_anomalia[i] = True
+            umbral = ajustar_umbral(umbral, distancias[i])
+    
+    return es_anomalia, umbral
+
+
 class SistemaInmunologicoArtificial:
     """
     Sistema bioinspirado en el sistema inmunológico humano para detección 
@@ -52,28 +269,108 @@ class SistemaInmunologicoArtificial:
     IEEE symposium on security and privacy (pp. 202-212).
     """
     
-    def __init__(self, num_celulas_memoria=50, radio_afinidad=0.5):
+    def __init__(self, num_celulas_memoria=50, radio_afinidad=0.5, tipo_indice='fuerza_bruta',
+                 opciones_indice=None, tamano_reserva_self=20000,
+                 evaluacion_calidad='muestra', tamano_muestra_calidad=10000,
+                 modo_deteccion='memoria', opciones_seleccion_negativa=None,
+                 capacidad_historial=100000, directorio_derrame=None, reloj=None,
+                 dtype=np.float64, instrumentacion=False, verbose=True):
         """
         Inicializa el sistema inmunológico artificial.
         
         Args:
             num_celulas_memoria (int): Número de células de memoria (detectores)
             radio_afinidad (float): Radio de afinidad para detección de anomalías
+            tipo_indice (str): Búsqueda del detector más afín: 'fuerza_bruta',
+                'kdtree', 'balltree', 'auto' (KD-tree para bancos grandes) o
+                'lsh' (aproximada, para bancos de millones de detectores)
+            opciones_indice (dict, optional): Parámetros del índice, p. ej.
+                {'num_tablas': 16} para subir el recall del modo 'lsh'
+            tamano_reserva_self (int): Muestras "self" conservadas por muestreo
+                de reservorio para recalibrar sin volver a leer todos los datos
+            evaluacion_calidad (str): Cálculo del silhouette al entrenar:
+                'completa', 'muestra' (estratificada por detector),
+                'segundo_plano' (muestra evaluada en un hilo mientras el sistema
+                ya detecta) o 'desactivada'
+            tamano_muestra_calidad (int): Tamaño de la muestra estratificada
+            modo_deteccion (str): 'memoria' (distancia a las células de memoria)
+                o 'seleccion_negativa' (banco de detectores "non-self" V-detector)
+            opciones_seleccion_negativa (dict, optional): Parámetros de
+                generar_detectores_v(), p. ej. {'cobertura_objetivo': 0.99}
+            capacidad_historial (int): Anomalías conservadas en memoria; al
+                llenarse el historial las más antiguas se descartan
+            directorio_derrame (str, optional): Si se indica, las anomalías que
+                salen de memoria se persisten en segmentos columnares en este
+                directorio (ver segmentos_anomalias.LectorSegmentos)
+            reloj (callable, optional): Fuente de los instantes de los eventos
+                en nanosegundos enteros; por defecto reloj_ns(). RelojVirtual
+                permite reproducir registros con tiempo simulado
+            dtype (dtype): np.float64 o np.float32. Con float32 el banco de
+                detectores, los parámetros del escalador y los lotes
+                normalizados se guardan en float32 y la búsqueda exhaustiva usa
+                la forma matricial ||x||² - 2·x·c + ||c||²; las distancias cerca
+                de un límite de nivel, del umbral o de una anomalía registrada
+                se verifican en float64
+            instrumentacion (bool | Instrumentacion): Registrar la latencia de
+                cada etapa de detección y entrenamiento en histogramas (ver
+                self.instrumentacion.instantanea() y .exportar()); también
+                acepta una Instrumentacion compartida entre sistemas
+            verbose (bool): Mostrar mensajes de progreso
         """
+        if evaluacion_calidad not in MODOS_EVALUACION_CALIDAD:
+            raise ValueError(f"Modo de evaluación desconocido: {evaluacion_calidad}. "
+                             f"Opciones: {MODOS_EVALUACION_CALIDAD}")
+        if modo_deteccion not in MODOS_DETECCION:
+            raise ValueError(f"Modo de detección desconocido: {modo_deteccion}. "
+                             f"Opciones: {MODOS_DETECCION}")
+        if np.dtype(dtype) not in (np.float64, np.float32):
+            raise ValueError(f"dtype no soportado: {dtype}. Opciones: float64, float32")
+        
         self.num_celulas_memoria = num_celulas_memoria
         self.radio_afinidad = radio_afinidad
+        self.tipo_indice = tipo_indice
+        self.opciones_indice = dict(opciones_indice or {})
         self.celulas_memoria = None
-        self.umbral_activacion = 0.7
-        self.historial_anomalias = []
+        self.conteos_celulas = None
+        self.indice_detectores = None
+        self.tamano_reserva_self = tamano_reserva_self
+        self._reserva_self = None
+        self._muestras_self_vistas = 0
+        self._rng_reserva = np.random.default_rng(42)
+        self.umbral_activacion = UMBRAL_ACTIVACION_INICIAL
+        self.historial_anomalias = HistorialAnomalias(
+            capacidad_historial,
+            derrame=EscritorSegmentos(directorio_derrame) if directorio_derrame else None
+        )
         self.patogenos_conocidos = {}
         self.scaler = StandardScaler()
         self.metricas_performance = {}
+        self.evaluacion_calidad = evaluacion_calidad
+        self.tamano_muestra_calidad = tamano_muestra_calidad
+        self._hilo_calidad = None
+        self.bancos_cultivo = {}
+        self.modo_deteccion = modo_deteccion
+        self.opciones_seleccion_negativa = dict(opciones_seleccion_negativa or {})
+        self.detectores_nonself = None
+        self.radios_nonself = None
+        self.limites_nonself = None
+        self._bloqueo_nonself = threading.Lock()
+        self._hilo_clonal = None
+        self.tabla_cuantizada = None
+        self.reloj = reloj or reloj_ns
+        self.dtype = np.dtype(dtype)
+        self._copia_escalador = None
+        if instrumentacion is True:
+            instrumentacion = Instrumentacion()
+        self.instrumentacion = instrumentacion or INSTRUMENTACION_INACTIVA
+        self.verbose = verbose
         
-        print(f"🧬 Sistema Inmunológico Artificial Inicializado")
-        print(f"   • Células de memoria: {self.num_celulas_memoria}")
-        print(f"   • Radio de afinidad: {self.radio_afinidad}")
+        if self.verbose:
+            print(f"🧬 Sistema Inmunológico Artificial Inicializado")
+            print(f"   • Células de memoria: {self.num_celulas_memoria}")
+            print(f"   • Radio de afinidad: {self.radio_afinidad}")
         
-    def entrenar_fase_self_nonself(self, datos_normales):
+    def entrenar_fase_self_nonself(self, datos_normales, tipos_cultivo=None, num_celulas_por_cultivo=None):
         """
         Entrena el sistema con datos normales (fase de tolerancia central).
         
@@ -82,11 +379,20 @@ class SistemaInmunologicoArtificial:
         
         Args:
             datos_normales (array): Datos de condiciones normales/saludables
+            tipos_cultivo (list, optional): Tipo de cultivo de cada muestra. Si se
+                indica, además del banco global se entrena un banco por cultivo
+            num_celulas_por_cultivo (int, optional): Detectores de cada banco por
+                cultivo; por defecto los mismos del banco global. Como cada banco
+                se normaliza con la dispersión de su propio cultivo, repartir el
+                banco global entre cultivos volvería más lejanas las lecturas normales
             
         Referencias:
         Burnet, F. M. (1959). The clonal selection theory of acquired immunity. 
         Vanderbilt University Press.
         """
+        instrumentacion = self.instrumentacion
+        inicio_entrenamiento = instrumentacion.marca()
+        
         # Normalizar datos
         datos_normales_scaled = self.scaler.fit_transform(datos_normales)
         
@@ -97,22 +403,829 @@ class SistemaInmunologicoArtificial:
             n_init=10
         )
         kmeans.fit(datos_normales_scaled)
+        instrumentacion.registrar('ajuste', inicio_entrenamiento, len(datos_normales_scaled))
         
-        self.celulas_memoria = kmeans.cluster_centers_
+        self.actualizar_celulas_memoria(kmeans.cluster_centers_)
+        self.conteos_celulas = np.bincount(kmeans.labels_, minlength=len(self.celulas_memoria)).astype(float)
+        
+        # Reservorio de muestras "self" para recalibraciones futuras
+        datos_normales = np.asarray(datos_normales, dtype=float)
+        self._reserva_self = None
+        self._muestras_self_vistas = 0
+        self._actualizar_reserva_self(datos_normales)
         
         # Evaluación de la calidad del clustering
-        silhouette = silhouette_score(datos_normales_scaled, kmeans.labels_)
+        self.metricas_performance['num_detectores'] = len(self.celulas_memoria)
+        self.metricas_performance.pop('silhouette_score', None)
+        silhouette = self._evaluar_calidad(datos_normales_scaled, kmeans.labels_)
         
-        print(f"✅ Fase de Entrenamiento Completada")
-        print(f"   • {len(self.celulas_memoria)} células de memoria generadas")
-        print(f"   • Silhouette score: {silhouette:.3f}")
-        print(f"   • Estado 'self' establecido correctamente")
+        self.bancos_cultivo = {}
+        if tipos_cultivo is not None:
+            self._entrenar_bancos_cultivo(datos_normales, tipos_cultivo, num_celulas_por_cultivo)
+            if self.tabla_cuantizada is not None:
+                self._compilar_tablas_bancos()
         
-        # Guardar métricas
-        self.metricas_performance['silhouette_score'] = silhouette
-        self.metricas_performance['num_detectores'] = len(self.celulas_memoria)
+        # Un escalador nuevo invalida los detectores "non-self" anteriores
+        self.detectores_nonself = self.radios_nonself = self.limites_nonself = None
+        if self.modo_deteccion == 'seleccion_negativa':
+            self.generar_detectores_negativos(datos_normales)
+        instrumentacion.registrar('entrenamiento', inicio_entrenamiento, len(datos_normales))
+        
+        if self.verbose:
+            print(f"✅ Fase de Entrenamiento Completada")
+            print(f"   • {len(self.celulas_memoria)} células de memoria generadas")
+            if silhouette is not None:
+                print(f"   • Silhouette score: {silhouette:.3f}")
+            elif self.evaluacion_calidad == 'segundo_plano':
+                print(f"   • Silhouette score: evaluándose en segundo plano")
+            else:
+                print(f"   • Silhouette score: evaluación desactivada")
+            for cultivo, banco in self.bancos_cultivo.items():
+                print(f"   • Banco '{cultivo}': {len(banco.celulas_memoria)} células de memoria")
+            print(f"   • Estado 'self' establecido correctamente")
+        
+        return self
+    
+    def _entrenar_bancos_cultivo(self, datos_normales, tipos_cultivo, num_celulas_por_cultivo=None):
+        """
+        Entrena un escalador y un banco de detectores independientes por cultivo.
+        
+        Cada banco es un sistema interno sin historial ni umbral propios: solo
+        aporta la búsqueda del detector más afín para las lecturas de su cultivo.
+        """
+        tipos_cultivo = np.asarray(tipos_cultivo, dtype=object)
+        if len(tipos_cultivo) != len(datos_normales):
+            raise ValueError("tipos_cultivo debe tener una entrada por muestra.")
+        
+        cultivos = [c for c in dict.fromkeys(tipos_cultivo) if c != "general"]
+        if num_celulas_por_cultivo is None:
+            num_celulas_por_cultivo = self.num_celulas_memoria
+        
+        for cultivo in cultivos:
+            datos_cultivo = datos_normales[tipos_cultivo == cultivo]
+            banco = self._crear_banco(min(num_celulas_por_cultivo, len(datos_cultivo)))
+            banco.entrenar_fase_self_nonself(datos_cultivo)
+            self.bancos_cultivo[cultivo] = banco
+    
+    def _crear_banco(self, num_celulas_memoria):
+        """Sistema interno con la misma configuración, usado como banco de un cultivo."""
+        return type(self)(
+            num_celulas_memoria=num_celulas_memoria,
+            radio_afinidad=self.radio_afinidad,
+            tipo_indice=self.tipo_indice,
+            opciones_indice=self.opciones_indice,
+            tamano_reserva_self=self.tamano_reserva_self,
+            evaluacion_calidad=self.evaluacion_calidad,
+            tamano_muestra_calidad=self.tamano_muestra_calidad,
+            dtype=self.dtype,
+            instrumentacion=self.instrumentacion,
+            verbose=False
+        )
+    
+    def _evaluar_calidad(self, datos_scaled, etiquetas):
+        """
+        Calcula el silhouette según el modo de evaluación configurado.
+        
+        El silhouette completo es O(n²) en tiempo y memoria; con muestras
+        estratificadas por detector el costo queda acotado por el tamaño de la
+        muestra, y con datos menores a ese tamaño el resultado es el exacto.
+        
+        Returns:
+            float | None: Silhouette, o None si no se calculó en este hilo
+        """
+        self.metricas_performance['silhouette_muestra'] = 0
+        if self.evaluacion_calidad == 'desactivada':
+            return None
+        
+        if self.evaluacion_calidad == 'completa':
+            indices = np.arange(len(datos_scaled))
+        else:
+            indices = self._muestra_estratificada(etiquetas, self.tamano_muestra_calidad)
+        
+        datos_muestra, etiquetas_muestra = datos_scaled[indices], etiquetas[indices]
+        
+        def _calcular():
+            if not 2 <= len(np.unique(etiquetas_muestra)) < len(etiquetas_muestra):
+                return None
+            with self.instrumentacion.medir('silhouette', len(etiquetas_muestra)):
+                silhouette = silhouette_score(datos_muestra, etiquetas_muestra)
+            self.metricas_performance['silhouette_score'] = silhouette
+            self.metricas_performance['silhouette_muestra'] = len(indices)
+            return silhouette
+        
+        if self.evaluacion_calidad == 'segundo_plano':
+            self._hilo_calidad = threading.Thread(target=_calcular, daemon=True)
+            self._hilo_calidad.start()
+            return None
+        
+        return _calcular()
+    
+    def esperar_evaluacion_calidad(self, timeout=None):
+        """Espera a que termine la evaluación de calidad en segundo plano."""
+        if self._hilo_calidad is not None:
+            self._hilo_calidad.join(timeout)
+        return self.metricas_performance.get('silhouette_score')
+    
+    @staticmethod
+    def _muestra_estratificada(etiquetas, tamano, semilla=42):
+        """
+        Índices de una muestra de tamaño fijo con la proporción de cada detector.
+        
+        Cada detector aporta al menos una muestra para que ningún grupo
+        desaparezca del cálculo del silhouette.
+        """
+        if len(etiquetas) <= tamano:
+            return np.arange(len(etiquetas))
+        
+        rng = np.random.default_rng(semilla)
+        grupos, conteos = np.unique(etiquetas, return_counts=True)
+        proporcionales = conteos * tamano / len(etiquetas)
+        cuotas = np.maximum(1, np.floor(proporcionales).astype(int))
+        
+        # Repartir el resto por mayor fracción para llegar al tamaño exacto
+        faltantes = tamano - cuotas.sum()
+        if faltantes > 0:
+            fracciones = np.where(cuotas < conteos, proporcionales - np.floor(proporcionales), -1)
+            cuotas[np.argsort(-fracciones, kind='stable')[:faltantes]] += 1
+        
+        indices = [
+            rng.choice(np.flatnonzero(etiquetas == grupo), size=min(cuota, conteo), replace=False)
+            for grupo, cuota, conteo in zip(grupos, cuotas, conteos)
+        ]
+        return np.sort(np.concatenate(indices))
+    
+    def actualizar_self(self, datos_normales_nuevos, tipos_cultivo=None):
+        """
+        Incorpora un lote nuevo de datos normales sin reentrenar desde cero.
+        
+        Actualiza la media y varianza del escalador con las estadísticas del
+        lote, re-expresa las células de memoria en la nueva escala y las mueve
+        hacia los datos nuevos al estilo mini-batch K-Means: cada célula se
+        desplaza con tasa 1/n, donde n es el número de muestras que ya representa.
+        Los datos antiguos no se vuelven a leer.
+        
+        Args:
+            datos_normales_nuevos (array): Lote de datos normales de forma (M, 4)
+            tipos_cultivo (list, optional): Tipo de cultivo de cada muestra, para
+                actualizar también los bancos por cultivo
+            
+        Returns:
+            SistemaInmunologicoArtificial: self
+        """
+        if self.celulas_memoria is None:
+            raise ValueError("El sistema no ha sido entrenado. Ejecutar entrenar_fase_self_nonself() primero.")
+        
+        datos_nuevos = np.asarray(datos_normales_nuevos, dtype=float).reshape(-1, self.celulas_memoria.shape[1])
+        if len(datos_nuevos) == 0:
+            return self
+        
+        # Llevar las células a unidades originales y actualizar el escalador
+        celulas_originales = self.celulas_memoria * self.scaler.scale_ + self.scaler.mean_
+        if self.detectores_nonself is not None:
+            detectores_originales = self.detectores_nonself * self.scaler.scale_ + self.scaler.mean_
+            limites_originales = self.limites_nonself * self.scaler.scale_ + self.scaler.mean_
+        self.scaler.partial_fit(datos_nuevos)
+        celulas = (celulas_originales - self.scaler.mean_) / self.scaler.scale_
+        
+        # Paso mini-batch: cada célula absorbe la media de las muestras que captura
+        datos_scaled = self._normalizar(datos_nuevos)
+        _, asignaciones = calcular_distancias_minimas(datos_scaled, celulas)
+        capturas = np.bincount(asignaciones, minlength=len(celulas)).astype(float)
+        sumas = np.zeros_like(celulas)
+        np.add.at(sumas, asignaciones, datos_scaled)
+        
+        activas = capturas > 0
+        totales = self.conteos_celulas[activas] + capturas[activas]
+        celulas[activas] = (
+            celulas[activas] * self.conteos_celulas[activas, np.newaxis] + sumas[activas]
+        ) / totales[:, np.newaxis]
+        self.conteos_celulas[activas] = totales
+        
+        self.actualizar_celulas_memoria(celulas)
+        self._actualizar_reserva_self(datos_nuevos)
+        
+        # Los detectores "non-self" conservan su posición en unidades originales
+        if self.detectores_nonself is not None:
+            self.detectores_nonself = (detectores_originales - self.scaler.mean_) / self.scaler.scale_
+            self.limites_nonself = (limites_originales - self.scaler.mean_) / self.scaler.scale_
+        
+        if tipos_cultivo is not None and self.bancos_cultivo:
+            tipos_cultivo = np.asarray(tipos_cultivo, dtype=object)
+            for cultivo, banco in self.bancos_cultivo.items():
+                mascara = tipos_cultivo == cultivo
+                if mascara.any():
+                    banco.actualizar_self(datos_nuevos[mascara])
+        
+        self.metricas_performance['actualizaciones_self'] = self.metricas_performance.get('actualizaciones_self', 0) + 1
+        self.metricas_performance['muestras_self'] = int(self.scaler.n_samples_seen_)
+        
+        return self
+    
+    def recalibrar_self(self, datos_normales=None, tipos_cultivo=None):
+        """
+        Recalibración completa bajo demanda (escalador y K-Means desde cero).
+        
+        Args:
+            datos_normales (array, optional): Datos de entrenamiento completos. Si
+                se omite se usa el reservorio de muestras "self" acumulado.
+            tipos_cultivo (list, optional): Tipo de cultivo de cada muestra de
+                datos_normales para reentrenar también los bancos por cultivo.
+                Si se omite, cada banco de cultivo se recalibra con su reservorio.
+        """
+        if datos_normales is None:
+            if self._reserva_self is None:
+                raise ValueError("No hay muestras 'self' en reserva para recalibrar.")
+            datos_normales = self._reserva_self.copy()
+        
+        if tipos_cultivo is not None:
+            return self.entrenar_fase_self_nonself(datos_normales, tipos_cultivo)
+        
+        bancos = self.bancos_cultivo
+        self.entrenar_fase_self_nonself(datos_normales)
+        for banco in bancos.values():
+            banco.recalibrar_self()
+        self.bancos_cultivo = bancos
+        
+        return self
+    
+    def _actualizar_reserva_self(self, datos):
+        """Muestreo de reservorio vectorizado (algoritmo R) sobre un lote nuevo."""
+        if self.tamano_reserva_self <= 0:
+            return
+        
+        if self._reserva_self is None:
+            self._reserva_self = np.empty((0, datos.shape[1]))
+        
+        # Completar el reservorio mientras tenga espacio libre
+        libres = min(self.tamano_reserva_self - len(self._reserva_self), len(datos))
+        if libres > 0:
+            self._reserva_self = np.vstack([self._reserva_self, datos[:libres]])
+        
+        # Cada muestra posterior reemplaza una posición con probabilidad R / t
+        restantes = datos[libres:]
+        if len(restantes):
+            posiciones_globales = self._muestras_self_vistas + libres + np.arange(1, len(restantes) + 1)
+            destinos = (self._rng_reserva.random(len(restantes)) * posiciones_globales).astype(np.int64)
+            reemplazos = destinos < self.tamano_reserva_self
+            self._reserva_self[destinos[reemplazos]] = restantes[reemplazos]
+        
+        self._muestras_self_vistas += len(datos)
+    
+    def generar_detectores_negativos(self, datos_normales=None, **opciones):
+        """
+        Genera el banco de detectores "non-self" por selección negativa.
+        
+        A diferencia de las células de memoria (centroides de lo "self"), estos
+        detectores cubren el espacio que NO es "self": candidatos aleatorios
+        que sobreviven a la censura contra las muestras normales, cada uno con
+        el radio máximo que no toca lo "self" (V-detector). Se usan cuando
+        modo_deteccion='seleccion_negativa'.
+        
+        Args:
+            datos_normales (array, optional): Muestras normales; por defecto el
+                reservorio de muestras "self"
+            **opciones: Parámetros de generar_detectores_v(); completan a
+                opciones_seleccion_negativa
+            
+        Returns:
+            SistemaInmunologicoArtificial: self
+            
+        Referencias:
+        Ji, Z., & Dasgupta, D. (2004). Real-valued negative selection algorithm
+        with variable-sized detectors. GECCO 2004, 287-298.
+        """
+        if self.celulas_memoria is None:
+            raise ValueError("El sistema no ha sido entrenado. Ejecutar entrenar_fase_self_nonself() primero.")
+        if datos_normales is None:
+            datos_normales = self._reserva_self
+        
+        datos_scaled = self._normalizar(np.asarray(datos_normales, dtype=float))
+        resultado = generar_detectores_v(datos_scaled, self.radio_afinidad,
+                                         **{**self.opciones_seleccion_negativa, **opciones})
+        
+        with self._bloqueo_nonself:
+            self.detectores_nonself = resultado['centros']
+            self.radios_nonself = resultado['radios']
+            self.limites_nonself = np.vstack(resultado['limites'])
+        self.metricas_performance['detectores_nonself'] = len(self.detectores_nonself)
+        self.metricas_performance['cobertura_nonself'] = resultado['cobertura_estimada']
+        self.metricas_performance['candidatos_por_segundo'] = resultado['candidatos_por_segundo']
+        self.metricas_performance['detectores_nonself_por_segundo'] = resultado['detectores_por_segundo']
+        
+        if self.verbose:
+            print(f"🛡️ Selección negativa: {len(self.detectores_nonself)} detectores 'non-self'")
+            print(f"   • Cobertura estimada: {resultado['cobertura_estimada']:.1%}")
+            print(f"   • Candidatos: {resultado['candidatos_generados']:,} "
+                  f"({resultado['candidatos_por_segundo']:,.0f}/s), "
+                  f"{resultado['candidatos_nonself']:,} 'non-self' evaluados")
+            print(f"   • Detectores aceptados: {resultado['detectores_por_segundo']:,.0f}/s")
+        
+        return self
+    
+    def _reconocer_nonself(self, X):
+        """
+        Lecturas reconocidas por algún detector "non-self" o fuera del espacio
+        donde se generaron (el exterior de la caja también es "non-self").
+        """
+        with self._bloqueo_nonself:
+            detectores, radios, limites = self.detectores_nonself, self.radios_nonself, self.limites_nonself
+        if detectores is None:
+            raise ValueError("No hay detectores 'non-self'. Ejecutar generar_detectores_negativos() primero.")
+        
+        X_scaled = self._normalizar(X)
+        inferior, superior = limites
+        fuera = np.any((X_scaled < inferior) | (X_scaled > superior), axis=1)
+        margenes, _ = calcular_margen_cobertura(X_scaled, detectores, radios)
+        return fuera | (margenes < 0)
+    
+    def refinar_detectores_clonales(self, nivel_minimo=3, max_antigenos=2000, presupuesto_s=1.0,
+                                    en_segundo_plano=True, **opciones):
+        """
+        Refina el banco "non-self" por selección clonal con anomalías confirmadas.
+        
+        Las anomalías del historial con nivel de alerta >= nivel_minimo actúan
+        como antígenos: los detectores más afines se clonan, mutan y censuran
+        contra el reservorio "self", y los mejores clones forman un banco
+        nuevo. El banco se reemplaza de una sola vez al terminar, así la
+        detección en curso siempre ve un banco completo; si el banco cambió
+        mientras tanto (reentrenamiento o actualizar_self) el resultado se descarta.
+        
+        Args:
+            nivel_minimo (int): Nivel de alerta mínimo de una anomalía confirmada
+            max_antigenos (int): Anomalías más recientes usadas como antígenos
+            presupuesto_s (float): Segundos máximos del trabajo de refinamiento
+            en_segundo_plano (bool): Ejecutar en un hilo sin bloquear la detección
+            **opciones: Parámetros adicionales de refinar_clonal()
+            
+        Returns:
+            dict | None: Resultado del refinamiento, o None si corre en segundo plano
+            
+        Referencias:
+        De Castro, L. N., & Von Zuben, F. J. (2002). Learning and optimization
+        using the clonal selection principle. IEEE Transactions on Evolutionary
+        Computation, 6(3), 239-251.
+        """
+        with self._bloqueo_nonself:
+            detectores, radios = self.detectores_nonself, self.radios_nonself
+        if detectores is None:
+            raise ValueError("No hay detectores 'non-self'. Ejecutar generar_detectores_negativos() primero.")
+        
+        # Copia de los antígenos y de la escala actual: la detección puede seguir
+        # agregando anomalías al historial mientras el trabajo corre
+        columnas = self.historial_anomalias.columnas()
+        confirmadas = columnas['dato'][columnas['nivel_alerta'] >= nivel_minimo][-max_antigenos:]
+        if len(confirmadas) == 0:
+            return None
+        antigenos = self._normalizar(confirmadas)
+        datos_self = self._normalizar(self._reserva_self)
+        
+        def _refinar():
+            resultado = refinar_clonal(detectores, radios, antigenos, datos_self, self.radio_afinidad,
+                                       presupuesto_s=presupuesto_s, **opciones)
+            with self._bloqueo_nonself:
+                vigente = self.detectores_nonself is detectores
+                if vigente:
+                    self.detectores_nonself = resultado['centros']
+                    self.radios_nonself = resultado['radios']
+            
+            if vigente:
+                self.metricas_performance['detectores_nonself'] = len(resultado['centros'])
+                self.metricas_performance['clones_promovidos'] = (
+                    self.metricas_performance.get('clones_promovidos', 0) + resultado['promovidos']
+                )
+            if self.verbose:
+                estado = "promovidos" if vigente else "descartados (el banco cambió)"
+                print(f"🧪 Selección clonal: {resultado['promovidos']} clones {estado} "
+                      f"en {resultado['generaciones']} generaciones ({resultado['duracion_s']:.2f}s)")
+            return resultado
+        
+        if en_segundo_plano:
+            self._hilo_clonal = threading.Thread(target=_refinar, daemon=True)
+            self._hilo_clonal.start()
+            return None
+        
+        return _refinar()
+    
+    def esperar_refinamiento_clonal(self, timeout=None):
+        """Espera a que termine el refinamiento clonal en segundo plano."""
+        if self._hilo_clonal is not None:
+            self._hilo_clonal.join(timeout)
+        return self.metricas_performance.get('clones_promovidos')
+    
+    def suprimir_red_inmune(self, radio_supresion=None, fusionar=True, datos_evaluacion=None,
+                            tipos_evaluacion=None, umbral_referencia=UMBRAL_ACTIVACION_INICIAL,
+                            tamano_bloque=1024):
+        """
+        Comprime las células de memoria con la supresión de la red inmune (aiNet).
+        
+        Las células más cercanas entre sí que radio_supresion se consideran
+        redundantes: sobrevive la que representa más muestras y, si fusionar
+        es True, se desplaza a la media ponderada de las que absorbe. Se
+        comprimen el banco general y los bancos por cultivo. Sin radio, cada
+        banco usa el cuantil CUANTIL_RADIO_SUPRESION de las distancias entre
+        sus células vecinas, así que se fusiona aproximadamente esa fracción
+        de los pares más cercanos; un radio fijo menor que el espaciado
+        habitual del banco no comprime nada.
+        
+        La tasa de detección (sobre anomalías conocidas) y la de falsos
+        positivos (sobre los reservorios "self") se miden antes y después con
+        la misma decisión de la detección, incluido modo_deteccion, y un umbral
+        de referencia fijo en lugar del umbral adaptado, que depende del
+        historial. En modo 'seleccion_negativa' deciden los detectores
+        "non-self", así que comprimir las células no cambia las tasas.
+        
+        Args:
+            radio_supresion (float, optional): Radio común a todos los bancos;
+                por defecto uno por banco según su espaciado
+            fusionar (bool): Fusionar las células suprimidas en lugar de eliminarlas
+            datos_evaluacion (array, optional): Lecturas anómalas para medir la
+                tasa de detección; por defecto las del historial de anomalías
+            tipos_evaluacion (list, optional): Cultivo de cada lectura de
+                datos_evaluacion; por defecto "general"
+            umbral_referencia (float): Umbral de activación de la evaluación
+            tamano_bloque (int): Filas de la matriz de afinidad por bloque
+            
+        Returns:
+            dict: Detectores antes/después por banco, radio usado en cada uno,
+            razón de compresión y tasas de detección y de falsos positivos
+            (None si no hay lecturas)
+            
+        Referencias:
+        Jerne, N. K. (1974). Towards a network theory of the immune system. 
+        Annales d'immunologie, 125(1-2), 373-389.
+        """
+        if self.celulas_memoria is None:
+            raise ValueError("El sistema no ha sido entrenado. Ejecutar entrenar_fase_self_nonself() primero.")
+        if datos_evaluacion is None:
+            columnas = self.historial_anomalias.columnas()
+            datos_evaluacion = columnas['dato']
+            tipos_evaluacion = list(np.asarray(columnas['cultivos'] or [''], dtype=object)[columnas['codigo_cultivo']])
+        datos_evaluacion = np.asarray(datos_evaluacion, dtype=float)
+        if tipos_evaluacion is None:
+            tipos_evaluacion = ["general"] * len(datos_evaluacion)
+        
+        # Muestras "self": el reservorio general y el de cada banco con su cultivo
+        reservas = [(self._reserva_self, "general")] + [
+            (banco._reserva_self, cultivo) for cultivo, banco in self.bancos_cultivo.items()]
+        reservas = [(reserva, cultivo) for reserva, cultivo in reservas if reserva is not None and len(reserva)]
+        datos_self = np.vstack([reserva for reserva, _ in reservas]) if reservas else np.empty((0, 0))
+        tipos_self = [cultivo for reserva, cultivo in reservas for _ in range(len(reserva))]
+        
+        def tasa_alertas(X, tipos):
+            if len(X) == 0:
+                return None
+            return float(np.mean(self._decidir_lote(X, tipos, umbral_referencia, adaptativo=False)[0]))
+        
+        deteccion_antes = tasa_alertas(datos_evaluacion, tipos_evaluacion)
+        falsos_antes = tasa_alertas(datos_self, tipos_self)
+        
+        bancos = [("general", self)] + list(self.bancos_cultivo.items())
+        detectores_antes, detectores_despues, radios = {}, {}, {}
+        for cultivo, banco in bancos:
+            celulas_banco = np.asarray(banco.celulas_memoria, dtype=float)
+            radio = radio_supresion
+            if radio is None:
+                radio = 0.0
+                if len(celulas_banco) > 1:
+                    vecinos, _ = cKDTree(celulas_banco).query(celulas_banco, k=2)
+                    radio = float(np.quantile(vecinos[:, 1], CUANTIL_RADIO_SUPRESION))
+            detectores_antes[cultivo] = len(celulas_banco)
+            celulas, conteos, _ = suprimir_red_inmune(banco.celulas_memoria, radio, banco.conteos_celulas,
+                                                      fusionar=fusionar, tamano_bloque=tamano_bloque)
+            banco.actualizar_celulas_memoria(celulas)
+            banco.conteos_celulas = conteos
+            banco.metricas_performance['num_detectores'] = len(celulas)
+            detectores_despues[cultivo] = len(celulas)
+            radios[cultivo] = radio
+        
+        deteccion_despues = tasa_alertas(datos_evaluacion, tipos_evaluacion)
+        falsos_despues = tasa_alertas(datos_self, tipos_self)
+        
+        def cambio(antes, despues):
+            return None if antes is None else despues - antes
+        
+        num_antes, num_despues = detectores_antes["general"], detectores_despues["general"]
+        total_antes, total_despues = sum(detectores_antes.values()), sum(detectores_despues.values())
+        reporte = {
+            'detectores_antes': num_antes,
+            'detectores_despues': num_despues,
+            'razon_compresion': num_antes / num_despues,
+            'detectores_cultivo_antes': {c: n for c, n in detectores_antes.items() if c != "general"},
+            'detectores_cultivo_despues': {c: n for c, n in detectores_despues.items() if c != "general"},
+            'radios_supresion': radios,
+            'razon_compresion_total': total_antes / total_despues,
+            'modo_deteccion': self.modo_deteccion,
+            'umbral_referencia': umbral_referencia,
+            'lecturas_evaluacion': len(datos_evaluacion),
+            'tasa_deteccion_antes': deteccion_antes,
+            'tasa_deteccion_despues': deteccion_despues,
+            'cambio_tasa_deteccion': cambio(deteccion_antes, deteccion_despues),
+            'tasa_falsos_positivos_antes': falsos_antes,
+            'tasa_falsos_positivos_despues': falsos_despues,
+            'cambio_tasa_falsos_positivos': cambio(falsos_antes, falsos_despues)
+        }
+        self.metricas_performance['num_detectores'] = num_despues
+        self.metricas_performance['razon_compresion'] = reporte['razon_compresion_total']
+        
+        if self.verbose:
+            print(f"🕸️ Supresión de red inmune: {total_antes} → {total_despues} detectores "
+                  f"en {len(bancos)} bancos (compresión {reporte['razon_compresion_total']:.2f}x)")
+            print(f"   • Evaluación: modo '{self.modo_deteccion}', umbral de referencia {umbral_referencia}")
+            if deteccion_antes is not None:
+                print(f"   • Tasa de detección ({len(datos_evaluacion)} anomalías): "
+                      f"{deteccion_antes:.2%} → {deteccion_despues:.2%}")
+            if falsos_antes is not None:
+                print(f"   • Falsos positivos ({len(datos_self)} muestras self): "
+                      f"{falsos_antes:.2%} → {falsos_despues:.2%}")
+        
+        return reporte
+    
+    def actualizar_celulas_memoria(self, celulas, agregar=False):
+        """
+        Reemplaza o amplía el banco de detectores manteniendo el índice al día.
+        
+        Args:
+            celulas (array): Banco nuevo, o detectores a agregar si agregar=True
+            agregar (bool): Si True, los detectores se suman al banco actual y el
+                índice se parchea en lugar de reconstruirse por completo
+        """
+        if agregar and self.indice_detectores is not None:
+            self.celulas_memoria = self.indice_detectores.agregar(celulas)
+        else:
+            self.celulas_memoria = np.asarray(celulas, dtype=self.dtype)
+            opciones = dict(self.opciones_indice)
+            if self.tipo_indice == 'lsh':
+                # Toda lectura que pueda superar algún umbral alcanzable se verifica exacta
+                opciones.setdefault('distancia_verificacion', min(self.umbral_activacion, UMBRAL_MINIMO))
+            else:
+                opciones.setdefault('dtype', self.dtype)
+            self.indice_detectores = crear_indice(self.celulas_memoria, tipo=self.tipo_indice, **opciones)
+        
+        if self.tabla_cuantizada is not None and not self.tabla_cuantizada.vigente(self.celulas_memoria,
+                                                                                  LIMITES_NIVEL_ALERTA):
+            self._recompilar_tabla()
+        
+        return self
+    
+    def compilar_tabla_cuantizada(self, pasos=PASOS_CUANTIZACION, rangos=None, margen=0.0,
+                                  max_celdas=50_000_000):
+        """
+        Activa el modo compilado: precalcula sobre una rejilla de lecturas
+        cuantizadas la distancia al detector más afín, el nivel de alerta y la
+        clasificación agronómica, para que cada lectura sea un acceso a arreglo.
+        
+        La tabla se recompila al cambiar el banco de detectores o las bandas de
+        LIMITES_NIVEL_ALERTA. Las lecturas fuera de la rejilla, y las que la
+        tabla ubica cerca del umbral mínimo o de algún límite de nivel, se
+        calculan con la búsqueda exacta; las decisiones y niveles no cambian.
+        
+        Args:
+            pasos (tuple): Resolución de cada variable
+            rangos (list, optional): (mínimo, máximo) de cada variable. Por
+                defecto el rango del reservorio de muestras "self"
+            margen (float | array): Ampliación del rango en unidades originales
+            max_celdas (int): Límite de puntos de la rejilla
+            
+        Returns:
+            SistemaInmunologicoArtificial: self
+        """
+        if self.celulas_memoria is None:
+            raise ValueError("El sistema no ha sido entrenado. Ejecutar entrenar_fase_self_nonself() primero.")
+        if rangos is not None:
+            referencia = np.asarray(rangos, dtype=float).T
+        elif self._reserva_self is not None and len(self._reserva_self):
+            referencia = self._reserva_self
+        else:
+            raise ValueError("No hay muestras 'self' en reserva para delimitar la rejilla; indicar rangos.")
+        
+        inicio = time.perf_counter()
+        self.tabla_cuantizada = TablaCuantizada.desde_datos(referencia, pasos, margen, max_celdas)
+        self._recompilar_tabla()
+        self._compilar_tablas_bancos()
+        
+        self.metricas_performance['celdas_tabla'] = self.tabla_cuantizada.num_celdas
+        self.metricas_performance['bytes_tabla'] = self.tabla_cuantizada.tamano_bytes
+        self.metricas_performance['tiempo_compilacion_tabla'] = time.perf_counter() - inicio
+        
+        if self.verbose:
+            print(f"🧮 Tabla cuantizada compilada: {self.tabla_cuantizada.num_celdas:,} lecturas "
+                  f"({self.tabla_cuantizada.tamano_bytes / 1e6:.1f} MB) en "
+                  f"{self.metricas_performance['tiempo_compilacion_tabla']:.2f}s")
         
         return self
+    
+    def _recompilar_tabla(self):
+        """Compila una tabla nueva sobre la misma rejilla (la anterior no se modifica)."""
+        anterior = self.tabla_cuantizada
+        tabla = TablaCuantizada(anterior.minimos, anterior.pasos, anterior.tamanos, anterior.num_celdas)
+        self.tabla_cuantizada = tabla.compilar(self.scaler.mean_, self.scaler.scale_, self.celulas_memoria,
+                                               LIMITES_NIVEL_ALERTA, clasificar=clasificar_reglas)
+    
+    def _compilar_tablas_bancos(self):
+        """Cada banco de cultivo compila su tabla sobre la rejilla del banco global."""
+        for banco in self.bancos_cultivo.values():
+            banco.tabla_cuantizada = self.tabla_cuantizada
+            banco._recompilar_tabla()
+    
+    def _tabla_vigente(self):
+        """Tabla cuantizada al día con el banco y las bandas de alerta, o None."""
+        if self.tabla_cuantizada is None:
+            return None
+        if not self.tabla_cuantizada.vigente(self.celulas_memoria, LIMITES_NIVEL_ALERTA):
+            self._recompilar_tabla()
+        return self.tabla_cuantizada
+    
+    def _puntuar_banco(self, X, exacta=False):
+        """
+        Detector más afín de este banco para lecturas sin normalizar.
+        
+        Con tabla cuantizada, las lecturas de la rejilla toman la distancia
+        (float16) y la célula de la tabla; con dtype float32, la distancia sale
+        de la búsqueda en float32. En ambos casos las distancias cuyo margen de
+        error alcanza un límite de nivel o un corte de ajustar_umbral() se
+        recalculan en float64, igual que las lecturas fuera de la rejilla.
+        
+        Returns:
+            tuple: (distancias_minimas, indices_celula, holguras); la holgura es
+            el error máximo de cada distancia (0 si es exacta)
+        """
+        instrumentacion = self.instrumentacion
+        tabla = None if exacta else self._tabla_vigente()
+        if tabla is not None:
+            inicio = instrumentacion.marca()
+            en_rejilla, indices = tabla.ubicar(X)
+            distancias = tabla.distancia[indices].astype(float)
+            celulas = tabla.celula[indices].astype(np.intp)
+            holguras = np.where(en_rejilla, distancias * _HOLGURA_TABLA, np.inf)
+            instrumentacion.registrar('tabla_cuantizada', inicio, len(X))
+        else:
+            reducida = not exacta and self.dtype != np.float64
+            inicio = instrumentacion.marca()
+            datos = self._normalizar(X, self.dtype if reducida else np.float64)
+            instrumentacion.registrar('escalado', inicio, len(X))
+            inicio = instrumentacion.marca()
+            distancias, celulas = self._buscar_detector_mas_afin(datos, exacta=not reducida)
+            instrumentacion.registrar('busqueda', inicio, len(X))
+            if not reducida:
+                return distancias, celulas, np.zeros(len(distancias))
+            
+            # Error de la búsqueda (None si es exacta sobre las lecturas
+            # normalizadas, como en los árboles) más el de normalizar en
+            # float32: |x_s| <= (|x| + |media|) / escala
+            holguras = self.indice_detectores.cota_error(datos, distancias)
+            if holguras is None:
+                holguras = np.zeros(len(distancias))
+            escalados = (np.abs(X) + np.abs(self.scaler.mean_)) / self.scaler.scale_
+            holguras += 3 * np.finfo(self.dtype).eps * np.sqrt(np.einsum('ij,ij->i', escalados, escalados))
+            distancias = distancias.astype(float)
+        
+        criticas = np.concatenate([LIMITES_NIVEL_ALERTA, _CORTES_ADAPTACION])
+        exactas = np.any(np.abs(distancias[:, np.newaxis] - criticas) <= holguras[:, np.newaxis], axis=1)
+        if exactas.any():
+            inicio = instrumentacion.marca()
+            distancias[exactas], celulas[exactas] = self._buscar_detector_mas_afin(
+                self._normalizar(X[exactas]), exacta=True
+            )
+            holguras[exactas] = 0
+            instrumentacion.registrar('verificacion_exacta', inicio, int(exactas.sum()))
+        
+        return distancias, celulas, holguras
+    
+    def _normalizar(self, X, dtype=np.float64):
+        """
+        Normaliza lecturas con la media y escala del escalador ajustado.
+        
+        Hace las mismas operaciones que StandardScaler.transform() (restar la
+        media y dividir por la escala), con resultados idénticos, pero sin la
+        validación de entrada de sklearn, que en lecturas sueltas cuesta mucho
+        más que la distancia misma. sklearn solo interviene al ajustar el
+        escalador (entrenamiento, actualizar_self).
+        """
+        media, escala = self.scaler.mean_, self.scaler.scale_
+        if dtype != np.float64:
+            media, escala = self._escalador_reducido()
+        return (np.asarray(X, dtype=dtype) - media) / escala
+    
+    def _escalador_reducido(self):
+        """Media y escala en self.dtype, copiadas de nuevo cuando el escalador se reajusta."""
+        media, escala = self.scaler.mean_, self.scaler.scale_
+        copia = self._copia_escalador
+        if copia is None or copia[0] is not media or copia[1] is not escala:
+            copia = self._copia_escalador = (media, escala, media.astype(self.dtype), escala.astype(self.dtype))
+        return copia[2], copia[3]
+    
+    def _buscar_detector_mas_afin(self, datos_scaled, exacta=False):
+        """
+        Consulta el índice de detectores, reconstruyéndolo si el banco cambió.
+        
+        Con exacta=True y un banco float32, las lecturas (pocas: las que se
+        verifican) se comparan en float64 contra el banco completo.
+        """
+        if self.indice_detectores is None or self.indice_detectores.celulas is not self.celulas_memoria:
+            self.actualizar_celulas_memoria(self.celulas_memoria)
+        
+        if exacta and self.dtype != np.float64:
+            return calcular_distancias_minimas(datos_scaled, self.celulas_memoria)
+        return self.indice_detectores.consultar(datos_scaled)
+    
+    def _puntuar_lote(self, X, tipos_cultivo, exacta=False, con_holguras=False):
+        """
+        Distancia al detector más afín de cada lectura, sin efectos secundarios.
+        
+        Las lecturas de un cultivo con banco propio se normalizan y buscan solo
+        en ese banco; el resto usa el banco global. Los grupos se procesan de
+        forma vectorizada, así un lote mixto sigue siendo una operación por banco.
+        
+        Args:
+            X (array): Lecturas de forma (N, D)
+            tipos_cultivo (list): Tipo de cultivo de cada lectura
+            exacta (bool): Calcular en float64 sin tablas cuantizadas
+            con_holguras (bool): Devolver también el error máximo de cada
+                distancia (tabla cuantizada o dtype float32; 0 si es exacta)
+            
+        Returns:
+            tuple: (distancias_minimas, indices_celula[, holguras]); el
+            índice es relativo al banco que atendió la lectura
+        """
+        if not self.bancos_cultivo:
+            resultado = self._puntuar_banco(X, exacta)
+            return resultado if con_holguras else resultado[:2]
+        
+        distancias = np.empty(len(X))
+        celulas = np.empty(len(X), dtype=np.intp)
+        holguras = np.zeros(len(X))
+        tipos_cultivo = np.asarray(tipos_cultivo, dtype=object)
+        sin_banco = np.ones(len(X), dtype=bool)
+        
+        for cultivo, banco in self.bancos_cultivo.items():
+            mascara = tipos_cultivo == cultivo
+            if mascara.any():
+                distancias[mascara], celulas[mascara], holguras[mascara] = banco._puntuar_banco(X[mascara], exacta)
+                sin_banco &= ~mascara
+        
+        if sin_banco.any():
+            distancias[sin_banco], celulas[sin_banco], holguras[sin_banco] = self._puntuar_banco(X[sin_banco], exacta)
+        
+        return (distancias, celulas, holguras) if con_holguras else (distancias, celulas)
+    
+    def _decidir_lote(self, X, tipos_cultivo, umbral, adaptativo=True):
+        """
+        Puntúa y decide un lote sin registrar nada ni modificar el sistema.
+        
+        Las distancias aproximadas (tabla cuantizada o float32) cuyo margen de
+        error alcanza el umbral vigente al evaluarlas, o que resultan anómalas
+        (y se registrarán), se recalculan en float64 y la decisión se repite
+        hasta que ninguna dependa de una distancia aproximada.
+        
+        Args:
+            X (array): Lecturas de forma (N, D)
+            tipos_cultivo (list): Tipo de cultivo de cada lectura
+            umbral (float): Umbral de activación antes del lote
+            adaptativo (bool): Adaptar el umbral lectura a lectura
+                (aplicar_umbral_secuencial) o mantenerlo fijo
+                
+        Returns:
+            tuple: (es_anomalia, distancias_minimas, indices_celula, umbral_final)
+        """
+        instrumentacion = self.instrumentacion
+        distancias, celulas, holguras = self._puntuar_lote(X, tipos_cultivo, con_holguras=True)
+        aproximadas = holguras > 0
+        nonself = None
+        if self.modo_deteccion == 'seleccion_negativa':
+            inicio = instrumentacion.marca()
+            nonself = self._reconocer_nonself(X)
+            instrumentacion.registrar('seleccion_negativa', inicio, len(X))
+        
+        # La etapa 'umbral' acumula solo la decisión; las verificaciones
+        # exactas se registran en sus propias etapas
+        duracion_umbral = 0
+        while True:
+            inicio = instrumentacion.marca()
+            if nonself is not None:
+                es_anomalia, umbral_final = nonself, umbral
+            elif adaptativo:
+                es_anomalia, umbral_final = aplicar_umbral_secuencial(distancias, umbral)
+            else:
+                es_anomalia, umbral_final = distancias > umbral, umbral
+            duracion_umbral += instrumentacion.marca() - inicio
+            if not aproximadas.any():
+                break
+            
+            dudosas = aproximadas & es_anomalia
+            if nonself is None:
+                umbrales = _umbrales_por_lectura(distancias, es_anomalia, umbral) if adaptativo else umbral
+                dudosas |= aproximadas & (np.abs(distancias - umbrales) <= holguras)
+            if not dudosas.any():
+                break
+            
+            indices = np.flatnonzero(dudosas)
+            distancias[indices], celulas[indices] = self._puntuar_lote(
+                X[indices], [tipos_cultivo[i] for i in indices], exacta=True
+            )
+            aproximadas[indices] = False
+        
+        instrumentacion.registrar_duracion('umbral', duracion_umbral, len(X))
+        return es_anomalia, distancias, celulas, umbral_final
         
     def detectar_anomalia(self, dato_nuevo, tipo_cultivo="general"):
         """
@@ -136,49 +1249,98 @@ class SistemaInmunologicoArtificial:
         if self.celulas_memoria is None:
             raise ValueError("El sistema no ha sido entrenado. Ejecutar entrenar_fase_self_nonself() primero.")
             
-        # Normalizar el dato nuevo
-        dato_nuevo_scaled = self.scaler.transform([dato_nuevo])
-        
-        # Calcular afinidad con células de memoria (distancia euclidiana)
-        afinidades = []
-        for celula in self.celulas_memoria:
-            afinidad = euclidean(celula, dato_nuevo_scaled[0])
-            afinidades.append(afinidad)
+        instrumentacion = self.instrumentacion
+        inicio_deteccion = instrumentacion.marca()
         
-        distancia_minima = np.min(afinidades)
-        celula_mas_afin = np.argmin(afinidades)
-        
-        # Determinar si es anomalía basado en umbral dinámico
-        es_anomalia = distancia_minima > self.umbral_activacion
+        # Normalizar el dato nuevo y calcular afinidad con las células de
+        # memoria de su cultivo (distancia euclidiana); la anomalía se decide
+        # con el umbral dinámico o con los detectores "non-self"
+        anomalias, distancias, indices, _ = self._decidir_lote(
+            np.asarray(dato_nuevo, dtype=float).reshape(1, -1), [tipo_cultivo],
+            self.umbral_activacion, adaptativo=False
+        )
+        es_anomalia = bool(anomalias[0])
+        distancia_minima = distancias[0]
+        celula_mas_afin = indices[0]
         
         # Calcular nivel de alerta (0-4: Normal, Bajo, Medio, Alto, Crítico)
-        if distancia_minima <= 0.3:
-            nivel_alerta = 0  # Normal
-        elif distancia_minima <= 0.6:
-            nivel_alerta = 1  # Bajo
-        elif distancia_minima <= 0.9:
-            nivel_alerta = 2  # Medio
-        elif distancia_minima <= 1.2:
-            nivel_alerta = 3  # Alto
-        else:
-            nivel_alerta = 4  # Crítico
+        nivel_alerta = int(calcular_niveles_alerta(distancia_minima))
         
         # Registrar anomalía si se detecta
         if es_anomalia:
+            inicio = instrumentacion.marca()
             self.historial_anomalias.append({
-                'timestamp': pd.Timestamp.now(),
+                'timestamp': self.reloj(),
                 'dato': dato_nuevo,
                 'distancia': distancia_minima,
                 'nivel_alerta': nivel_alerta,
                 'celula_activada': celula_mas_afin,
                 'tipo_cultivo': tipo_cultivo
             })
+            instrumentacion.registrar('historial', inicio)
             
             # Adaptación del sistema (memoria inmunológica)
-            self._adaptacion_inmunologica(dato_nuevo_scaled[0], distancia_minima)
-            
+            inicio = instrumentacion.marca()
+            self._adaptacion_inmunologica(dato_nuevo, distancia_minima)
+            instrumentacion.registrar('adaptacion', inicio)
+        
+        instrumentacion.registrar('deteccion', inicio_deteccion)
         return es_anomalia, distancia_minima, nivel_alerta
     
+    def detectar_anomalias_lote(self, X, tipos_cultivo=None):
+        """
+        Detecta anomalías en un lote de lecturas con una sola normalización
+        y un único cálculo matricial de distancias por banco de detectores.
+        
+        El umbral dinámico se adapta lectura a lectura en el orden del lote,
+        por lo que cada resultado coincide con el de llamar detectar_anomalia()
+        secuencialmente sobre las mismas lecturas.
+        
+        Args:
+            X (array): Lecturas de forma (N, 4) [humedad, temp, nutrientes, crecimiento]
+            tipos_cultivo (str | list, optional): Tipo de cultivo común a todo el
+                lote o uno por lectura. Por defecto "general".
+                
+        Returns:
+            tuple: (es_anomalia, distancia_minima, nivel_alerta, celula_activada)
+            como arrays de longitud N
+        """
+        if self.celulas_memoria is None:
+            raise ValueError("El sistema no ha sido entrenado. Ejecutar entrenar_fase_self_nonself() primero.")
+        
+        instrumentacion = self.instrumentacion
+        inicio_deteccion = instrumentacion.marca()
+        X = np.asarray(X, dtype=float).reshape(-1, self.celulas_memoria.shape[1])
+        if tipos_cultivo is None or isinstance(tipos_cultivo, str):
+            tipos_cultivo = [tipos_cultivo or "general"] * len(X)
+        elif len(tipos_cultivo) != len(X):
+            raise ValueError("tipos_cultivo debe tener una entrada por lectura.")
+        
+        es_anomalia, distancias, celulas_activadas, umbral_final = self._decidir_lote(
+            X, tipos_cultivo, self.umbral_activacion
+        )
+        niveles_alerta = calcular_niveles_alerta(distancias)
+        inicio = instrumentacion.marca()
+        if self.modo_deteccion == 'seleccion_negativa':
+            for distancia in distancias[es_anomalia]:
+                self._adaptacion_inmunologica(None, distancia)
+        else:
+            self.umbral_activacion = umbral_final
+        instrumentacion.registrar('adaptacion', inicio, len(X))
+        
+        # Un único timestamp por lote para todas las anomalías registradas
+        if es_anomalia.any():
+            inicio = instrumentacion.marca()
+            self.historial_anomalias.agregar_lote(
+                self.reloj(), X[es_anomalia], distancias[es_anomalia],
+                niveles_alerta[es_anomalia], celulas_activadas[es_anomalia],
+                [tipos_cultivo[i] for i in np.flatnonzero(es_anomalia)]
+            )
+            instrumentacion.registrar('historial', inicio, int(es_anomalia.sum()))
+        
+        instrumentacion.registrar('deteccion_lote', inicio_deteccion, len(X))
+        return es_anomalia, distancias, niveles_alerta, celulas_activadas
+    
     def _adaptacion_inmunologica(self, dato_anomalo, distancia):
         """
         Implementa la adaptación del sistema basada en clonal selection.
@@ -187,14 +1349,7 @@ class SistemaInmunologicoArtificial:
         detección futura, similar a como el sistema inmunológico desarrolla
         memoria inmunológica después de una infección.
         """
-        # Ajuste dinámico del umbral basado en feedback
-        if distancia > 1.5:  # Anomalía muy severa
-            self.umbral_activacion *= 0.95  # Hacerse más sensible
-        elif distancia < 0.8:  # Falso positivo potencial
-            self.umbral_activacion *= 1.02  # Reducir sensibilidad
-            
-        # Limitar el rango del umbral
-        self.umbral_activacion = np.clip(self.umbral_activacion, 0.3, 1.2)
+        self.umbral_activacion = ajustar_umbral(self.umbral_activacion, distancia)
         
     def clasificar_anomalia(self, dato_anomalo):
         """
@@ -206,72 +1361,75 @@ class SistemaInmunologicoArtificial:
         Returns:
             dict: Clasificación y recomendaciones específicas
         """
-        humedad, temperatura, nutrientes, crecimiento = dato_anomalo
-        
-        # Reglas expertas basadas en conocimiento agronómico
-        if humedad < 35 and temperatura > 30:
-            tipo = "estres_hidrico"
-            severidad = "alta" if humedad < 25 else "media"
-            recomendacion = {
-                'accion_inmediata': "Activar sistema de riego de emergencia",
-                'accion_preventiva': "Instalar sensores adicionales de humedad",
-                'impacto_economico': "Pérdida estimada: 15-25% del rendimiento",
-                'tiempo_respuesta': "< 2 horas"
-            }
-        elif nutrientes < 3 and crecimiento < 50:
-            tipo = "deficiencia_nutricional" 
-            severidad = "alta" if nutrientes < 1.5 else "media"
-            recomendacion = {
-                'accion_inmediata': "Aplicar fertilizante NPK balanceado",
-                'accion_preventiva': "Análisis de suelo mensual",
-                'impacto_economico': "Pérdida estimada: 10-20% del rendimiento",
-                'tiempo_respuesta': "< 24 horas"
-            }
-        elif temperatura < 10 or temperatura > 40:
-            tipo = "estres_termico"
-            severidad = "crítica" if (temperatura < 5 or temperatura > 45) else "alta"
-            recomendacion = {
-                'accion_inmediata': "Activar sistema de control climático",
-                'accion_preventiva': "Revisar sistema de ventilación",
-                'impacto_economico': "Pérdida estimada: 20-40% del rendimiento",
-                'tiempo_respuesta': "< 1 hora"
-            }
-        elif crecimiento < 30 and humedad > 30 and nutrientes > 5:
-            tipo = "posible_plaga"
-            severidad = "alta"
-            recomendacion = {
-                'accion_inmediata': "Inspección visual urgente - Aplicar control biológico",
-                'accion_preventiva': "Implementar trampas de monitoreo",
-                'impacto_economico': "Pérdida estimada: 25-50% del rendimiento",
-                'tiempo_respuesta': "< 3 horas"
-            }
-        else:
-            tipo = "anomalia_compleja"
-            severidad = "desconocida"
-            recomendacion = {
-                'accion_inmediata': "Revisión manual por especialista",
-                'accion_preventiva': "Recolectar más datos para análisis",
-                'impacto_economico': "Por determinar",
-                'tiempo_respuesta': "< 12 horas"
-            }
-        
-        # Registrar patógeno conocido para futuras referencias
-        if tipo not in self.patogenos_conocidos:
-            self.patogenos_conocidos[tipo] = {
-                'primera_deteccion': pd.Timestamp.now(),
-                'frecuencia': 1,
-                'severidad_promedio': severidad
-            }
-        else:
-            self.patogenos_conocidos[tipo]['frecuencia'] += 1
-            
+        tipos, severidades, recomendaciones, confianzas = self.clasificar_anomalias_lote(
+            np.asarray(dato_anomalo, dtype=float).reshape(1, -1)
+        )
+        
         return {
-            'tipo': tipo,
-            'severidad': severidad,
-            'recomendacion': recomendacion,
-            'confianza': self._calcular_confianza(dato_anomalo, tipo)
+            'tipo': TIPOS_ANOMALIA[tipos[0]],
+            'severidad': SEVERIDADES_ANOMALIA[severidades[0]],
+            'recomendacion': dict(RECOMENDACIONES_ANOMALIA[recomendaciones[0]]),
+            'confianza': float(confianzas[0])
         }
     
+    def clasificar_anomalias_lote(self, X):
+        """
+        Clasifica un lote de anomalías con las reglas agronómicas vectorizadas.
+        
+        Cada regla es una máscara booleana sobre las columnas del lote y se
+        aplica con la misma prioridad que la cadena de reglas expertas. Los
+        patógenos conocidos se actualizan una vez por lote con bincount, y la
+        confianza de cada anomalía usa la frecuencia acumulada hasta ella, igual
+        que al clasificarlas una por una. Con una tabla cuantizada compilada, las
+        lecturas que caen en su rejilla se clasifican con un solo acceso a ella.
+        
+        Args:
+            X (array): Anomalías de forma (N, 4) [humedad, temp, nutrientes, crecimiento]
+            
+        Returns:
+            tuple: (codigos_tipo, codigos_severidad, indices_recomendacion,
+            confianza) como arrays de longitud N; los códigos indexan
+            TIPOS_ANOMALIA, SEVERIDADES_ANOMALIA y RECOMENDACIONES_ANOMALIA
+        """
+        inicio_clasificacion = self.instrumentacion.marca()
+        X = np.asarray(X, dtype=float).reshape(-1, 4)
+        
+        # Las lecturas de la rejilla cuantizada toman sus códigos de la tabla
+        tabla = self._tabla_vigente()
+        if tabla is not None and tabla.tipo is not None:
+            en_rejilla, indices = tabla.ubicar(X)
+            tipos = tabla.tipo[indices].astype(np.int64)
+            severidades = tabla.severidad[indices].astype(np.int64)
+            if not en_rejilla.all():
+                tipos[~en_rejilla], severidades[~en_rejilla] = clasificar_reglas(X[~en_rejilla])
+        else:
+            tipos, severidades = clasificar_reglas(X)
+        
+        # Frecuencia de cada tipo hasta cada anomalía (incluida) dentro del lote
+        conteos = np.bincount(tipos, minlength=len(TIPOS_ANOMALIA))
+        acumuladas = np.cumsum(tipos[:, np.newaxis] == np.arange(len(TIPOS_ANOMALIA)), axis=0)
+        previas = np.array([self.patogenos_conocidos.get(tipo, {}).get('frecuencia', 0)
+                            for tipo in TIPOS_ANOMALIA])
+        frecuencias = previas[tipos] + acumuladas[np.arange(len(tipos)), tipos]
+        
+        # Registrar patógenos conocidos para futuras referencias, en orden de aparición
+        codigos, primeras = np.unique(tipos, return_index=True)
+        ahora = self.reloj() if len(codigos) else None
+        for codigo, primera in sorted(zip(codigos, primeras), key=lambda par: par[1]):
+            tipo = TIPOS_ANOMALIA[codigo]
+            if tipo not in self.patogenos_conocidos:
+                self.patogenos_conocidos[tipo] = {
+                    'primera_deteccion': ahora,
+                    'frecuencia': int(conteos[codigo]),
+                    'severidad_promedio': SEVERIDADES_ANOMALIA[severidades[primera]]
+                }
+            else:
+                self.patogenos_conocidos[tipo]['frecuencia'] += int(conteos[codigo])
+        
+        confianzas = self._calcular_confianza_lote(frecuencias)
+        self.instrumentacion.registrar('clasificacion', inicio_clasificacion, len(X))
+        return tipos, severidades, tipos.copy(), confianzas
+    
     def _calcular_confianza(self, dato, tipo):
         """Calcula el nivel de confianza en la clasificación"""
         # Implementación simplificada basada en patrones históricos
@@ -282,6 +1440,12 @@ class SistemaInmunologicoArtificial:
             confianza = 0.7  # Confianza base para nuevos patrones
         
         return confianza
+    
+    @staticmethod
+    def _calcular_confianza_lote(frecuencias):
+        """_calcular_confianza() de un lote a partir de la frecuencia de cada tipo."""
+        frecuencias = np.asarray(frecuencias)
+        return np.where(frecuencias > 0, np.minimum(0.95, 0.5 + (frecuencias * 0.1)), 0.7)
         
     def generar_reporte_ejecutivo(self):
         """
@@ -296,22 +1460,18 @@ class SistemaInmunologicoArtificial:
         if not self.historial_anomalias:
             return {"mensaje": "No hay anomalías registradas en el sistema."}
         
-        # Análisis temporal
-        df_anomalias = pd.DataFrame(self.historial_anomalias)
-        
-        # Métricas clave de negocio
-        total_anomalias = len(df_anomalias)
-        anomalias_criticas = len(df_anomalias[df_anomalias['nivel_alerta'] >= 3])
+        # Métricas clave de negocio, desde los agregados acumulados del historial
+        agregados = self.historial_anomalias.agregados
+        total_anomalias = agregados.total
+        anomalias_criticas = agregados.criticas
         tasa_criticidad = (anomalias_criticas / total_anomalias) * 100
         
-        # Análisis de tendencias
-        df_anomalias['fecha'] = df_anomalias['timestamp'].dt.date
-        anomalias_por_dia = df_anomalias.groupby('fecha').size()
-        tendencia = "Creciente" if anomalias_por_dia.is_monotonic_increasing else "Estable"
+        # Análisis de tendencias: anomalías por día sin decrecer
+        tendencia = "Creciente" if agregados.tendencia_creciente else "Estable"
         
         # ROI estimado del sistema
         ahorro_por_deteccion_temprana = 5000  # USD por hectárea
-        numero_detecciones_tempranas = len(df_anomalias[df_anomalias['nivel_alerta'] <= 2])
+        numero_detecciones_tempranas = agregados.tempranas
         roi_estimado = numero_detecciones_tempranas * ahorro_por_deteccion_temprana
         
         reporte = {
@@ -343,6 +1503,180 @@ class SistemaInmunologicoArtificial:
         }
         
         return reporte
+    
+    def cerrar(self):
+        """Persiste el historial en memoria y detiene el escritor de derrame, si lo hay."""
+        self.historial_anomalias.cerrar()
+    
+    def guardar_modelo(self, ruta, incluir_reserva=False):
+        """
+        Guarda el modelo entrenado en un contenedor binario compacto.
+        
+        Se escriben solo los parámetros necesarios para detectar: media y
+        escala del escalador, células de memoria (global y por cultivo),
+        umbral actual, patógenos conocidos y metadatos de versión. No se
+        serializan objetos de sklearn.
+        
+        Args:
+            ruta (str): Archivo de destino
+            incluir_reserva (bool): Incluir el reservorio de muestras "self"
+                para poder usar recalibrar_self() tras cargar el modelo
+        """
+        if self.celulas_memoria is None:
+            raise ValueError("El sistema no ha sido entrenado. Ejecutar entrenar_fase_self_nonself() primero.")
+        
+        arreglos = self._arreglos_banco('', incluir_reserva)
+        for cultivo, banco in self.bancos_cultivo.items():
+            arreglos.update(banco._arreglos_banco(f'{cultivo}/', incluir_reserva))
+        
+        cabecera = {
+            'version_formato': VERSION_FORMATO_MODELO,
+            'creado': pd.Timestamp.now().isoformat(),
+            'versiones': {'numpy': np.__version__, 'pandas': pd.__version__},
+            'configuracion': {
+                'num_celulas_memoria': self.num_celulas_memoria,
+                'radio_afinidad': self.radio_afinidad,
+                'tipo_indice': self.tipo_indice,
+                'opciones_indice': self.opciones_indice,
+                'modo_deteccion': self.modo_deteccion,
+                'opciones_seleccion_negativa': self.opciones_seleccion_negativa,
+                'dtype': self.dtype.name
+            },
+            'umbral_activacion': float(self.umbral_activacion),
+            'banco': self._metadatos_banco(),
+            'bancos_cultivo': {cultivo: banco._metadatos_banco() for cultivo, banco in self.bancos_cultivo.items()},
+            'patogenos_conocidos': {
+                tipo: {**info, 'primera_deteccion': pd.Timestamp(info['primera_deteccion']).isoformat()}
+                for tipo, info in self.patogenos_conocidos.items()
+            },
+            'metricas_performance': {clave: float(valor) for clave, valor in self.metricas_performance.items()},
+            'arreglos': {}
+        }
+        
+        # Calcular desplazamientos con la cabecera ya reservada y alineada
+        desplazamiento = 0
+        for nombre, valor in arreglos.items():
+            cabecera['arreglos'][nombre] = {'desplazamiento': desplazamiento, 'forma': list(valor.shape)}
+            desplazamiento += -(-valor.nbytes // _ALINEACION_MODELO) * _ALINEACION_MODELO
+        
+        cabecera_bytes = json.dumps(cabecera, ensure_ascii=False).encode('utf-8')
+        inicio_datos = -(-(_PREFIJO_MODELO.size + len(cabecera_bytes)) // _ALINEACION_MODELO) * _ALINEACION_MODELO
+        
+        with open(ruta, 'wb') as archivo:
+            archivo.write(_PREFIJO_MODELO.pack(FIRMA_MODELO, VERSION_FORMATO_MODELO, len(cabecera_bytes)))
+            archivo.write(cabecera_bytes)
+            for nombre, valor in arreglos.items():
+                archivo.seek(inicio_datos + cabecera['arreglos'][nombre]['desplazamiento'])
+                archivo.write(valor.tobytes())
+        
+        if self.verbose:
+            print(f"💾 Modelo guardado en '{ruta}' ({len(self.celulas_memoria)} detectores)")
+        return ruta
+    
+    def _arreglos_banco(self, prefijo, incluir_reserva):
+        """Arreglos float64 contiguos que describen un banco de detectores."""
+        arreglos = {
+            'media': self.scaler.mean_,
+            'escala': self.scaler.scale_,
+            'varianza': self.scaler.var_,
+            'celulas_memoria': self.celulas_memoria,
+            'conteos_celulas': self.conteos_celulas
+        }
+        if self.detectores_nonself is not None:
+            arreglos.update({
+                'detectores_nonself': self.detectores_nonself,
+                'radios_nonself': self.radios_nonself,
+                'limites_nonself': self.limites_nonself
+            })
+        if incluir_reserva:
+            arreglos['reserva_self'] = self._reserva_self
+        return {prefijo + nombre: np.ascontiguousarray(valor, dtype='<f8')
+                for nombre, valor in arreglos.items() if valor is not None}
+    
+    def _metadatos_banco(self):
+        return {
+            'num_celulas_memoria': self.num_celulas_memoria,
+            'muestras_escalador': int(self.scaler.n_samples_seen_),
+            'muestras_self_vistas': int(self._muestras_self_vistas)
+        }
+    
+    def _restaurar_banco(self, metadatos, arreglo, prefijo, mapear_memoria):
+        """Reconstruye escalador y banco desde los arreglos del contenedor."""
+        scaler = StandardScaler()
+        scaler.mean_ = arreglo(prefijo + 'media')
+        scaler.scale_ = arreglo(prefijo + 'escala')
+        scaler.var_ = arreglo(prefijo + 'varianza')
+        scaler.n_samples_seen_ = np.int64(metadatos['muestras_escalador'])
+        scaler.n_features_in_ = len(scaler.mean_)
+        self.scaler = scaler
+        
+        # El índice se construye de forma diferida en la primera detección
+        self.celulas_memoria = arreglo(prefijo + 'celulas_memoria', mapear_memoria)
+        self.conteos_celulas = arreglo(prefijo + 'conteos_celulas')
+        self._reserva_self = arreglo(prefijo + 'reserva_self')
+        self.detectores_nonself = arreglo(prefijo + 'detectores_nonself')
+        self.radios_nonself = arreglo(prefijo + 'radios_nonself')
+        self.limites_nonself = arreglo(prefijo + 'limites_nonself')
+        self._muestras_self_vistas = metadatos['muestras_self_vistas']
+    
+    @classmethod
+    def cargar_modelo(cls, ruta, mapear_memoria=True, verbose=True):
+        """
+        Carga un modelo guardado con guardar_modelo().
+        
+        La matriz de detectores se mapea en memoria en lugar de leerse
+        completa, y el índice de búsqueda se construye en la primera consulta,
+        así un trabajador queda listo en milisegundos aun con bancos grandes.
+        
+        Args:
+            ruta (str): Archivo del modelo
+            mapear_memoria (bool): Mapear las células de memoria (solo lectura)
+                en lugar de copiarlas a RAM
+            verbose (bool): Mostrar mensajes de progreso
+            
+        Returns:
+            SistemaInmunologicoArtificial: Sistema listo para detectar
+        """
+        with open(ruta, 'rb') as archivo:
+            firma, version, longitud = _PREFIJO_MODELO.unpack(archivo.read(_PREFIJO_MODELO.size))
+            if firma != FIRMA_MODELO:
+                raise ValueError(f"'{ruta}' no es un modelo del sistema inmunológico artificial.")
+            if version > VERSION_FORMATO_MODELO:
+                raise ValueError(f"Versión de formato {version} no soportada (máxima {VERSION_FORMATO_MODELO}).")
+            cabecera = json.loads(archivo.read(longitud).decode('utf-8'))
+        
+        inicio_datos = -(-(_PREFIJO_MODELO.size + longitud) // _ALINEACION_MODELO) * _ALINEACION_MODELO
+        
+        def _arreglo(nombre, mapear=False):
+            info = cabecera['arreglos'].get(nombre)
+            if info is None:
+                return None
+            forma = tuple(info['forma'])
+            if mapear:
+                return np.memmap(ruta, dtype='<f8', mode='r', offset=inicio_datos + info['desplazamiento'], shape=forma)
+            with open(ruta, 'rb') as archivo:
+                archivo.seek(inicio_datos + info['desplazamiento'])
+                return np.fromfile(archivo, dtype='<f8', count=int(np.prod(forma))).reshape(forma)
+        
+        sistema = cls(**cabecera['configuracion'], verbose=verbose)
+        sistema._restaurar_banco(cabecera['banco'], _arreglo, '', mapear_memoria)
+        for cultivo, metadatos in cabecera['bancos_cultivo'].items():
+            banco = sistema._crear_banco(metadatos['num_celulas_memoria'])
+            banco._restaurar_banco(metadatos, _arreglo, f'{cultivo}/', mapear_memoria)
+            sistema.bancos_cultivo[cultivo] = banco
+        
+        sistema.umbral_activacion = cabecera['umbral_activacion']
+        sistema.patogenos_conocidos = {
+            tipo: {**info, 'primera_deteccion': pd.Timestamp(info['primera_deteccion']).value}
+            for tipo, info in cabecera['patogenos_conocidos'].items()
+        }
+        sistema.metricas_performance = dict(cabecera['metricas_performance'])
+        sistema.metricas_performance['version_formato_modelo'] = cabecera['version_formato']
+        
+        if sistema.verbose:
+            print(f"📂 Modelo cargado desde '{ruta}' ({len(sistema.celulas_memoria)} detectores, "
+                  f"{len(sistema.bancos_cultivo)} bancos por cultivo)")
+        return sistema
 
 def simular_datos_cultivo_realistas():
     """
@@ -399,13 +1733,17 @@ def simular_datos_cultivo_realistas():
     
     return np.array(datos_normales), anomalias_catalogadas, metadatos
 
-def demostracion_sistema_empresarial():
+def demostracion_sistema_empresarial(ruta_modelo=None):
     """
     Demostración completa del sistema bioinspirado aplicado al caso empresarial.
     
     Esta función ilustra cómo los sistemas bioinspirados ofrecen ventajas
     competitivas reales en la toma de decisiones estratégicas del sector
     agroindustrial.
+    
+    Args:
+        ruta_modelo (str, optional): Modelo guardado a reutilizar. Si el archivo
+            no existe, se entrena el sistema y se guarda en esa ruta.
     """
     print("🌱 DEMOSTRACIÓN SISTEMA BIOINSPIRADO PARA CULTIVOS INTELIGENTES")
     print("="*80)
@@ -428,8 +1766,14 @@ def demostracion_sistema_empresarial():
     print(f"\n🧬 FASE 2: ENTRENAMIENTO DEL SISTEMA INMUNOLÓGICO")
     print("-" * 50)
     
-    sistema = SistemaInmunologicoArtificial(num_celulas_memoria=40, radio_afinidad=0.6)
-    sistema.entrenar_fase_self_nonself(datos_normales)
+    import os
+    if ruta_modelo and os.path.exists(ruta_modelo):
+        sistema = SistemaInmunologicoArtificial.cargar_modelo(ruta_modelo)
+    else:
+        sistema = SistemaInmunologicoArtificial(num_celulas_memoria=40, radio_afinidad=0.6)
+        sistema.entrenar_fase_self_nonself(datos_normales, [m['tipo_cultivo'] for m in metadatos])
+        if ruta_modelo:
+            sistema.guardar_modelo(ruta_modelo)
     
     # 3. Detección de anomalías en tiempo real
     print(f"\n🚨 FASE 3: DETECCIÓN Y CLASIFICACIÓN DE ANOMALÍAS")
@@ -589,8 +1933,9 @@ def crear_visualizaciones_impacto(sistema, resultados, reporte):
     
     # Gráfico 4: Timeline de detecciones
     if sistema.historial_anomalias:
-        timestamps = [anom['timestamp'] for anom in sistema.historial_anomalias]
-        distancias = [anom['distancia'] for anom in sistema.historial_anomalias]
+        columnas = sistema.historial_anomalias.columnas()
+        timestamps = pd.to_datetime(columnas['timestamp'])
+        distancias = columnas['distancia']
         
         fig.add_trace(
             go.Scatter(x=timestamps, y=distancias, mode='markers',
@@ -695,6 +2040,7 @@ if __name__ == "__main__":
     
     # Crear visualizaciones
     dashboard = crear_visualizaciones_impacto(sistema, resultados, reporte)
+    sistema.cerrar()
     
     # Mostrar conclusiones finales
     print(f"\n" + "="*80)
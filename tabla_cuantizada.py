@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tabla Precalculada para Lecturas Cuantizadas
+
+Los sensores de campo reportan humedad y crecimiento en porcentajes enteros,
+temperatura con resolución de 0.1 °C y nutrientes con resolución de 0.1: el
+espacio de lecturas es una rejilla finita que se repite constantemente.
+TablaCuantizada precalcula sobre esa rejilla la distancia al detector más
+afín (float16), la célula activada, el nivel de alerta y los códigos de tipo
+y severidad de la clasificación agronómica (uint8), de modo que evaluar una
+lectura de la rejilla es un solo acceso a arreglo.
+
+La distancia de cada punto es una suma de términos por variable, así que la
+compilación precalcula esos términos por valor de la rejilla y combina las
+dos últimas variables una sola vez, en lugar de recorrer el banco por punto.
+
+Autor: Leonardo Mosquera
+"""
+
+import numpy as np
+
+# Decimales al construir los valores de la rejilla: un valor como 30.0 debe
+# coincidir exactamente con el float que envía el sensor
+_DECIMALES_REJILLA = 10
+
+
+class TablaCuantizada:
+    """
+    Rejilla regular de lecturas con resultados precalculados por punto.
+    """
+
+    def __init__(self, minimos, pasos, tamanos, max_celdas=50_000_000):
+        """
+        Define la rejilla.
+
+        Args:
+            minimos (array): Valor mínimo de cada variable
+            pasos (array): Resolución de cada variable
+            tamanos (array): Número de valores de cada variable
+            max_celdas (int): Límite de puntos de la rejilla (memoria acotada)
+        """
+        self.minimos = np.asarray(minimos, dtype=float)
+        self.pasos = np.asarray(pasos, dtype=float)
+        self.tamanos = np.asarray(tamanos, dtype=np.int64)
+        self.num_celdas = int(np.prod(self.tamanos))
+        if len(self.tamanos) < 2:
+            raise ValueError("La rejilla necesita al menos dos variables.")
+        if self.num_celdas > max_celdas:
+            raise ValueError(f"La rejilla tiene {self.num_celdas:,} puntos (máximo {max_celdas:,}); "
+                             f"reducir el rango o la resolución.")
+
+        self.valores = [np.round(minimo + np.arange(tamano) * paso, _DECIMALES_REJILLA)
+                        for minimo, paso, tamano in zip(self.minimos, self.pasos, self.tamanos)]
+        self.distancia = None
+        self.celula = None
+        self.nivel = None
+        self.tipo = None
+        self.severidad = None
+        self.celulas = None
+        self.limites_nivel = None
+
+    @classmethod
+    def desde_datos(cls, datos, pasos, margen=0.0, max_celdas=50_000_000):
+        """
+        Rejilla que cubre el rango de los datos, ampliado en margen por variable.
+
+        Args:
+            datos (array): Lecturas de referencia de forma (N, D)
+            pasos (array): Resolución de cada variable
+            margen (float | array): Ampliación del rango en unidades originales
+            max_celdas (int): Límite de puntos de la rejilla
+
+        Returns:
+            TablaCuantizada: Rejilla sin compilar
+        """
+        datos = np.asarray(datos, dtype=float)
+        pasos = np.asarray(pasos, dtype=float)
+        inferior = np.floor((datos.min(axis=0) - margen) / pasos)
+        superior = np.ceil((datos.max(axis=0) + margen) / pasos)
+        return cls(inferior * pasos, pasos, (superior - inferior + 1).astype(np.int64), max_celdas)
+
+    def ubicar(self, X):
+        """
+        Índice plano de cada lectura que cae exactamente en la rejilla.
+
+        Args:
+            X (array): Lecturas de forma (N, D)
+
+        Returns:
+            tuple: (en_rejilla, indices); los índices fuera de la rejilla valen 0
+        """
+        X = np.asarray(X, dtype=float)
+        posiciones = np.rint((X - self.minimos) / self.pasos)
+        en_rejilla = np.all((posiciones >= 0) & (posiciones < self.tamanos), axis=1)
+        posiciones = np.where(en_rejilla[:, np.newaxis], posiciones, 0).astype(np.int64)
+        for k, valores in enumerate(self.valores):
+            en_rejilla &= valores[posiciones[:, k]] == X[:, k]
+        indices = np.ravel_multi_index(posiciones.T, self.tamanos)
+        return en_rejilla, np.where(en_rejilla, indices, 0)
+
+    def vigente(self, celulas, limites_nivel):
+        """La tabla corresponde a este banco de detectores y a estas bandas de alerta."""
+        return (self.celulas is celulas and self.limites_nivel is not None
+                and np.array_equal(self.limites_nivel, limites_nivel))
+
+    def compilar(self, media, escala, celulas, limites_nivel, clasificar=None,
+                 elementos_por_bloque=4_000_000):
+        """
+        Precalcula los resultados de todos los puntos de la rejilla.
+
+        Args:
+            media (array): Media del escalador
+            escala (array): Escala del escalador
+            celulas (array): Banco de detectores normalizado (K, D)
+            limites_nivel (array): Límites superiores de los niveles de alerta
+            clasificar (callable, optional): Función X -> (codigos_tipo,
+                codigos_severidad) evaluada sobre los puntos de la rejilla
+            elementos_por_bloque (int): Tamaño de la matriz intermedia por bloque
+
+        Returns:
+            TablaCuantizada: self
+        """
+        celulas_arreglo = np.asarray(celulas, dtype=float)
+        num_celulas = len(celulas_arreglo)
+        tipo_celula = np.min_scalar_type(max(num_celulas - 1, 0))
+
+        self.distancia = np.empty(self.num_celdas, dtype=np.float16)
+        self.celula = np.empty(self.num_celdas, dtype=tipo_celula)
+        self.nivel = np.empty(self.num_celdas, dtype=np.uint8)
+        if clasificar is not None:
+            self.tipo = np.empty(self.num_celdas, dtype=np.uint8)
+            self.severidad = np.empty(self.num_celdas, dtype=np.uint8)
+
+        # Término (x_k - c_k)^2 de cada valor de la rejilla contra cada detector
+        terminos = [np.square(((valores - media[k]) / escala[k])[:, np.newaxis]
+                              - celulas_arreglo[:, k]).astype(np.float32)
+                    for k, valores in enumerate(self.valores)]
+        cola = terminos[-2][:, np.newaxis, :] + terminos[-1][np.newaxis, :, :]
+        puntos_cola = cola.shape[0] * cola.shape[1]
+        cola = cola.reshape(puntos_cola, num_celulas)
+
+        tamanos_cabeza = tuple(self.tamanos[:-2])
+        num_cabeza = int(np.prod(tamanos_cabeza))
+        cabezas_por_bloque = max(1, elementos_por_bloque // (puntos_cola * num_celulas))
+
+        for inicio in range(0, num_cabeza, cabezas_por_bloque):
+            cabezas = np.arange(inicio, min(inicio + cabezas_por_bloque, num_cabeza))
+            posiciones = np.unravel_index(cabezas, tamanos_cabeza)
+            base = terminos[0][posiciones[0]]
+            for k in range(1, len(tamanos_cabeza)):
+                base = base + terminos[k][posiciones[k]]
+
+            cuadrados = base[:, np.newaxis, :] + cola[np.newaxis, :, :]
+            cercanas = np.argmin(cuadrados, axis=2)
+            distancias = np.sqrt(np.take_along_axis(cuadrados, cercanas[..., np.newaxis], axis=2)[..., 0])
+
+            destino = slice(inicio * puntos_cola, (inicio + len(cabezas)) * puntos_cola)
+            self.distancia[destino] = distancias.ravel()
+            self.celula[destino] = cercanas.ravel()
+            self.nivel[destino] = np.searchsorted(limites_nivel, distancias.ravel(), side='left')
+
+            if clasificar is not None:
+                puntos = np.empty((len(cabezas) * puntos_cola, len(self.tamanos)))
+                for k in range(len(tamanos_cabeza)):
+                    puntos[:, k] = np.repeat(self.valores[k][posiciones[k]], puntos_cola)
+                ultimas = np.unravel_index(np.arange(puntos_cola), tuple(self.tamanos[-2:]))
+                puntos[:, -2] = np.tile(self.valores[-2][ultimas[0]], len(cabezas))
+                puntos[:, -1] = np.tile(self.valores[-1][ultimas[1]], len(cabezas))
+                tipos, severidades = clasificar(puntos)
+                self.tipo[destino] = tipos
+                self.severidad[destino] = severidades
+
+        self.celulas = celulas
+        self.limites_nivel = np.array(limites_nivel, copy=True)
+        return self
+
+    @property
+    def tamano_bytes(self):
+        """Memoria ocupada por las columnas compiladas."""
+        return sum(columna.nbytes for columna in (self.distancia, self.celula, self.nivel,
+                                                   self.tipo, self.severidad) if columna is not None)